@@ -0,0 +1,71 @@
+"""Throughput and chosen-frame quality of fast candidate decoding vs full decoding.
+
+Quality is the full-resolution sharpness of the chosen frame relative to the
+frame chosen by full decoding (1.0 means the same sharpness).
+
+Usage (from the ``backend`` directory)::
+
+    python -m benchmarks.candidate_decoding seg1.mp4 seg2.mp4 --stride 5 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import cv2
+
+from services.others.frame_quality import (
+    METHODS,
+    frame_count,
+    select_sharp_candidates,
+    select_sharp_frames,
+    sharpness_score,
+)
+
+
+def full_res_sharpness(frame, method: str) -> float:
+    return sharpness_score(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), method)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--method", choices=METHODS, default="laplacian")
+    parser.add_argument("--stride", type=int, nargs="+", default=[10])
+    parser.add_argument("--score-width", type=int, default=320)
+    args = parser.parse_args()
+
+    results = []
+    for video in args.videos:
+        frames = frame_count(video)
+        started = time.perf_counter()
+        reference = select_sharp_frames(video, 1, args.method, score_width=None)
+        full_seconds = time.perf_counter() - started
+        if not reference:
+            continue
+        reference_score = full_res_sharpness(reference[0][2], args.method)
+        runs = [("full", None, full_seconds, reference)]
+        for mode, stride in [("keyframes", None)] + [("stride", s) for s in args.stride]:
+            started = time.perf_counter()
+            chosen = select_sharp_candidates(
+                video, 1, args.method, mode=mode, stride=stride or 1, score_width=args.score_width
+            )
+            runs.append((mode, stride, time.perf_counter() - started, chosen))
+        for mode, stride, seconds, chosen in runs:
+            quality = full_res_sharpness(chosen[0][2], args.method) / reference_score if chosen else None
+            results.append({
+                "video": video,
+                "mode": mode,
+                "stride": stride,
+                "seconds": round(seconds, 4),
+                "frames_per_second": round(frames / seconds, 1) if seconds else None,
+                "chosen_frame_idx": chosen[0][1] if chosen else None,
+                "relative_quality": round(quality, 3) if quality is not None else None,
+            })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
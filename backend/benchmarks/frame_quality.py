@@ -0,0 +1,55 @@
+"""Scaling of the parallel frame-quality stage from 1 to N workers.
+
+Usage (from the ``backend`` directory)::
+
+    python -m benchmarks.frame_quality seg1.mp4 seg2.mp4 --max-workers 8 --batch-size 0 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+
+from services.others.frame_quality import FrameQualityStage, METHODS
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-frames", type=int, default=300)
+    parser.add_argument("--method", choices=METHODS, default="laplacian")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for batch_size in args.batch_size:
+        baseline = None
+        for workers in range(1, args.max_workers + 1):
+            stage = FrameQualityStage(
+                workers=workers,
+                chunk_frames=args.chunk_frames,
+                method=args.method,
+                batch_size=batch_size,
+            )
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                stage(args.videos)
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            baseline = baseline or best
+            results.append({
+                "workers": workers,
+                "batch_size": batch_size,
+                "seconds": round(best, 4),
+                "speedup": round(baseline / best, 2),
+            })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
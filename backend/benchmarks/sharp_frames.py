@@ -0,0 +1,78 @@
+"""Benchmark of sharp frame selection: time and peak memory per method.
+
+Usage (from the ``backend`` directory)::
+
+    python -m benchmarks.sharp_frames path/to/segment.mp4 --stride 1 2 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import cv2
+
+from services.others.frame_quality import METHODS, sharpness_score
+from services.others.video_client import VideoPipe
+
+
+def legacy_extract_sharp_frames(video_path: str, top_n: int = 1, method: str = "laplacian"):
+    """Previous implementation: keeps a copy of every decoded frame, then sorts."""
+    cap = cv2.VideoCapture(video_path)
+    scores = []
+    frame_idx = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        scores.append((sharpness_score(gray, method), frame_idx, frame.copy()))
+        frame_idx += 1
+    cap.release()
+    scores.sort(key=lambda x: x[0], reverse=True)
+    return scores[:top_n]
+
+
+def measure(func: Callable[[], List]) -> Dict[str, float]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": round(elapsed, 4),
+        "peak_mb": round(peak / 2 ** 20, 2),
+        "best_frame_idx": result[0][1] if result else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("video")
+    parser.add_argument("--top-n", type=int, default=1)
+    parser.add_argument("--stride", type=int, nargs="+", default=[1])
+    parser.add_argument("--score-width", type=int, default=640)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    results = []
+    for method in METHODS:
+        if not args.skip_legacy:
+            row = {"impl": "legacy", "method": method, "stride": 1}
+            row.update(measure(lambda: legacy_extract_sharp_frames(args.video, args.top_n, method)))
+            results.append(row)
+        for stride in args.stride:
+            row = {"impl": "streaming", "method": method, "stride": stride}
+            row.update(measure(lambda: VideoPipe.extract_sharp_frames(
+                args.video, args.top_n, method, stride=stride, score_width=args.score_width
+            )))
+            results.append(row)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""End-to-end VideoPipe benchmark that runs fully offline.
+
+Synthetic inspection videos are generated with ffmpeg lavfi (testsrc2 picture and a
+speech-like tone track with pauses) for every requested length and resolution. The
+transcription service is replaced by a local HTTP stub of ``/transcribe_long`` and the
+LLM by a fake chat model returning canned issues, both with configurable latency.
+
+The report is JSON: throughput, per-stage latency (from the job trace) and peak memory
+for every case, plus the commit and environment, so runs from different commits can be
+compared with ``--baseline``.
+
+Usage (from the ``backend`` directory)::
+
+    python -m benchmarks.videopipe --durations 60 300 --resolutions 640x360 1280x720 \\
+        --modes pipelined sequential --repeat 3 --output bench.json
+    python -m benchmarks.videopipe --baseline bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from services.llm.cache import LLMResultCache
+from services.others.blob_store import BlobStore
+from services.others.limiter import BackendLimiter
+from services.others.transcribe_client import TranscribeClient, close_http_client
+from services.others.video_client import VideoPipe
+from services.others.workspace import ScratchSpace
+
+SAMPLE_RATE = 16000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+PHRASE_SECONDS = 3.0
+
+# 180-260 Hz tone with 4 Hz "syllables", muted for 0.8 s every 4 s to give the splitter pauses
+SPEECH_LIKE_AUDIO = (
+    "aevalsrc='0.4*sin(2*PI*(220+40*sin(2*PI*0.7*t))*t)*(0.6+0.4*sin(2*PI*4*t))*gt(mod(t\\,4)\\,0.8)'"
+    ":s=48000:d={duration}"
+)
+
+
+def generate_video(path: str, duration: float, width: int, height: int, fps: int = 25) -> str:
+    """Renders a synthetic H.264/AAC video, reusing an existing file with the same name."""
+    if os.path.exists(path):
+        return path
+    command = [
+        "ffmpeg", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+        "-f", "lavfi", "-i", SPEECH_LIKE_AUDIO.format(duration=duration),
+        "-c:v", "libx264", "-preset", "veryfast", "-g", str(fps * 2), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "64k",
+        "-shortest", "-y", path,
+    ]
+    subprocess.run(command, check=True)
+    return path
+
+
+class TranscribeStub(BaseHTTPRequestHandler):
+    """Fake ``/transcribe_long``: one phrase every PHRASE_SECONDS of received PCM."""
+
+    latency_per_audio_second = 0.0
+    requests = 0
+    lock = threading.Lock()
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        with self.lock:
+            type(self).requests += 1
+        audio_seconds = len(body) / BYTES_PER_SECOND
+        time.sleep(audio_seconds * self.latency_per_audio_second)
+        phrases = []
+        start = 0.0
+        while start < max(audio_seconds, 0.5):
+            phrases.append({
+                "start_time": round(start, 3),
+                "end_time": round(min(start + PHRASE_SECONDS * 0.8, max(audio_seconds, 0.5)), 3),
+                "text": f"Фраза {len(phrases)}: на участке видно отсутствие крепежа",
+            })
+            start += PHRASE_SECONDS
+        payload = json.dumps({"message": phrases}, ensure_ascii=False).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_transcribe_stub(latency_per_audio_second: float) -> Tuple[ThreadingHTTPServer, str]:
+    TranscribeStub.latency_per_audio_second = latency_per_audio_second
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TranscribeStub)
+    threading.Thread(target=server.serve_forever, name="transcribe-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/transcribe_long"
+
+
+class FakeResponse:
+    def __init__(self, content: str) -> None:
+        self.content = content
+
+
+class FakeChatModel:
+    """Stands in for ChatOpenAI: reports every ``issue_every``-th phrase as an issue."""
+
+    model_name = "fake-benchmark"
+
+    def __init__(self, latency: float = 0.5, issue_every: int = 10) -> None:
+        self.latency = latency
+        self.issue_every = max(1, issue_every)
+        self.calls = 0
+
+    async def ainvoke(self, messages) -> FakeResponse:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        indices = [
+            int(match.group(1))
+            for line in messages[-1].content.splitlines()
+            if (match := re.match(r"^(\d+) --> ", line))
+        ]
+        issues = [
+            {"idx": idx, "description": f"Отсутствие крепежных элементов (фраза {idx})"}
+            for idx in indices if idx % self.issue_every == 0
+        ]
+        return FakeResponse(json.dumps({"issues": issues}, ensure_ascii=False))
+
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def max_rss_kb() -> Dict[str, int]:
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def ffmpeg_version() -> Optional[str]:
+    try:
+        result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.splitlines()[0] if result.stdout else None
+
+
+def build_pipe(args, url: str, work_dir: str, mode: str, cache_path: str) -> Tuple[VideoPipe, FakeChatModel]:
+    llm = FakeChatModel(args.llm_latency, args.issue_every)
+    transcriber = TranscribeClient(url) if args.config_limits else TranscribeClient(
+        url, limiter=BackendLimiter("transcribe", max_concurrency=args.transcribe_concurrency, max_queue=10_000)
+    )
+    pipe = VideoPipe(
+        llm,
+        trr_serv_url=url,
+        transcriber=transcriber,
+        pipelined=mode != "sequential",
+        stream_audio=mode == "pipelined",
+        audio_normalize=args.normalize,
+        # a fresh cache per run, so repeats never hit answers cached by earlier runs
+        llm_cache=LLMResultCache(cache_path, ttl_seconds=3600, max_bytes=64 * 1024 ** 2),
+        llm_limiter=None if args.config_limits else BackendLimiter("llm", max_concurrency=64, max_queue=10_000),
+        blob_store=BlobStore(os.path.join(work_dir, "blobs")),
+        scratch=ScratchSpace(fallback_root=work_dir),
+    )
+    return pipe, llm
+
+
+async def run_case(args, url: str, work_dir: str, video: str, duration: float, mode: str) -> Dict:
+    video_input = video
+    if args.input == "bytes":
+        with open(video, "rb") as f:
+            video_input = f.read()
+    runs = []
+    for _ in range(args.repeat):
+        fd, cache_path = tempfile.mkstemp(suffix=".db", dir=work_dir)
+        os.close(fd)
+        pipe, llm = build_pipe(args, url, work_dir, mode, cache_path)
+        requests_before = TranscribeStub.requests
+        if args.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        result = await pipe(video_input)
+        seconds = time.perf_counter() - started
+        peak_python = None
+        if args.trace_memory:
+            peak_python = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        pipe.llm_cache.close()
+        for path in (cache_path, cache_path + "-wal", cache_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        trace = pipe.last_trace.as_dict() if pipe.last_trace is not None else {}
+        runs.append({
+            "seconds": seconds,
+            "ok": result is not None,
+            "phrases": len(result[0]) if result else 0,
+            "issues": len(result[1]) if result else 0,
+            "stage_seconds": pipe.last_timings,
+            "failed_stages": [stage for stage in trace.get("stages", []) if stage["status"] != "ok"],
+            "transcribe_requests": TranscribeStub.requests - requests_before,
+            "llm_calls": llm.calls,
+            "peak_python_bytes": peak_python,
+        })
+    seconds = [run["seconds"] for run in runs]
+    best = min(seconds)
+    stages = sorted({stage for run in runs for stage in run["stage_seconds"]})
+    size = os.path.getsize(video)
+    return {
+        "video": os.path.basename(video),
+        "duration_s": duration,
+        "mode": mode,
+        "ok": all(run["ok"] for run in runs),
+        "seconds_min": round(best, 4),
+        "seconds_median": round(statistics.median(seconds), 4),
+        "video_seconds_per_second": round(duration / best, 2),
+        "megabytes_per_second": round(size / 1024 ** 2 / best, 2),
+        "stage_seconds_median": {
+            stage: round(statistics.median(run["stage_seconds"].get(stage, 0.0) for run in runs), 4)
+            for stage in stages
+        },
+        "peak_python_bytes": max((run["peak_python_bytes"] or 0 for run in runs), default=0) or None,
+        "max_rss_kb": max_rss_kb(),
+        "runs": runs,
+    }
+
+
+async def run_all(args, url: str, work_dir: str, videos: List[Tuple[str, float, str]]) -> List[Dict]:
+    results = []
+    try:
+        for video, duration, _ in videos:
+            for mode in args.modes:
+                results.append(await run_case(args, url, work_dir, video, duration, mode))
+    finally:
+        await close_http_client()
+    return results
+
+
+def compare(report: Dict, baseline: Dict) -> List[Dict]:
+    """Speedup of every case relative to the same case in the baseline report (>1 means faster)."""
+    reference = {(case["video"], case["mode"]): case for case in baseline.get("results", [])}
+    rows = []
+    for case in report.get("results", []):
+        old = reference.get((case["video"], case["mode"]))
+        if old is None:
+            continue
+        rows.append({
+            "video": case["video"],
+            "mode": case["mode"],
+            "speedup": round(old["seconds_min"] / case["seconds_min"], 3),
+            "stage_speedup": {
+                stage: round(old["stage_seconds_median"][stage] / seconds, 3)
+                for stage, seconds in case["stage_seconds_median"].items()
+                if seconds and old["stage_seconds_median"].get(stage)
+            },
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[60.0, 300.0])
+    parser.add_argument("--resolutions", nargs="+", default=["640x360", "1280x720"])
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--modes", nargs="+", choices=["pipelined", "buffered", "sequential"],
+                        default=["pipelined", "sequential"],
+                        help="pipelined streams audio; buffered is pipelined with buffered audio extraction")
+    parser.add_argument("--normalize", default="loudnorm", help="audio normalization mode passed to VideoPipe")
+    parser.add_argument("--input", choices=["path", "bytes"], default="path")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--transcribe-latency", type=float, default=0.02,
+                        help="stub latency, seconds per second of audio")
+    parser.add_argument("--transcribe-concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake LLM latency per call, seconds")
+    parser.add_argument("--issue-every", type=int, default=10, help="every N-th phrase is reported as an issue")
+    parser.add_argument("--config-limits", action="store_true",
+                        help="use the rate limits from config.py instead of unlimited backends")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="track peak Python allocations with tracemalloc (slows the run down)")
+    parser.add_argument("--work-dir", default=None, help="where videos and scratch files go (kept between runs)")
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), "videopipe-bench")
+    os.makedirs(work_dir, exist_ok=True)
+    videos = []
+    for resolution in args.resolutions:
+        width, height = parse_resolution(resolution)
+        for duration in args.durations:
+            path = os.path.join(work_dir, f"synthetic_{width}x{height}_{duration:g}s_{args.fps}fps.mp4")
+            videos.append((generate_video(path, duration, width, height, args.fps), duration, resolution))
+
+    server, url = start_transcribe_stub(args.transcribe_latency)
+    try:
+        results = asyncio.run(run_all(args, url, work_dir, videos))
+    finally:
+        server.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": ffmpeg_version(),
+        },
+        "args": vars(args),
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
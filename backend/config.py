@@ -6,3 +6,57 @@ load_dotenv(find_dotenv())
 DEBUG_MODE = os.getenv("DEBUG_MODE")
 
 SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
+
+# путь к файлу кэша ответов LLM (например, в каталоге данных); пусто - кэш выключен
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+TRANSCRIBE_MAX_CONCURRENCY = int(os.getenv("TRANSCRIBE_MAX_CONCURRENCY", 4))
+TRANSCRIBE_REQUESTS_PER_SECOND = float(os.getenv("TRANSCRIBE_REQUESTS_PER_SECOND", 2))
+TRANSCRIBE_MAX_QUEUE = int(os.getenv("TRANSCRIBE_MAX_QUEUE", 64))
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_REQUESTS_PER_SECOND = float(os.getenv("LLM_REQUESTS_PER_SECOND", 5))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", 200000))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 128))
+
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH", "./blobs")
+BLOB_STORE_WORKERS = int(os.getenv("BLOB_STORE_WORKERS", 0))
+
+SCRATCH_TMPFS_DIRS = os.getenv("SCRATCH_TMPFS_DIRS", "/mnt/ramdisk:/dev/shm")
+SCRATCH_FALLBACK_DIR = os.getenv("SCRATCH_FALLBACK_DIR", "")
+SCRATCH_BUDGET_BYTES = int(os.getenv("SCRATCH_BUDGET_BYTES", 2 * 1024 ** 3))
+SCRATCH_ORPHAN_MAX_AGE = float(os.getenv("SCRATCH_ORPHAN_MAX_AGE", 6 * 3600))
+SCRATCH_SWEEP_INTERVAL = float(os.getenv("SCRATCH_SWEEP_INTERVAL", 600))
+
+PHOTO_LLM_MODEL = os.getenv("PHOTO_LLM_MODEL", "gpt-4o-mini")
+PHOTO_LLM_BASE_URL = os.getenv("PHOTO_LLM_BASE_URL", "")
+PHOTO_LLM_API_KEY = os.getenv("PHOTO_LLM_API_KEY", "")
+PHOTO_LLM_TIMEOUT = float(os.getenv("PHOTO_LLM_TIMEOUT", 90))
+# заглушка распознавания (фиксированный документ) вместо модели - только для тестов и локального запуска
+PHOTO_FAKE_BACKEND = os.getenv("PHOTO_FAKE_BACKEND", "").lower() in ("1", "true", "yes")
+PHOTO_TARGET_DPI = int(os.getenv("PHOTO_TARGET_DPI", 150))
+PHOTO_BATCH_MAX_PAGES = int(os.getenv("PHOTO_BATCH_MAX_PAGES", 20))
+PHOTO_BATCH_CONCURRENCY = int(os.getenv("PHOTO_BATCH_CONCURRENCY", 4))
+
+OKPD_INDEX_PATH = os.getenv("OKPD_INDEX_PATH", "./data/okpd2.csv")
+OKPD_MIN_SCORE = float(os.getenv("OKPD_MIN_SCORE", 0.35))
+
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", 1000))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 6))
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 200 * 1024 * 1024))
+
+EXPIRING_HORIZON_DAYS = int(os.getenv("EXPIRING_HORIZON_DAYS", 30))
+EXPIRING_MAX_DAYS = int(os.getenv("EXPIRING_MAX_DAYS", 365))
+EXPIRING_SCAN_AT = os.getenv("EXPIRING_SCAN_AT", "06:00")
+
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", 25 * 1024 * 1024))
+PHOTO_MAX_PIXELS = int(os.getenv("PHOTO_MAX_PIXELS", 100_000_000))
+
+DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", 2))
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", 80))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", 256))
+PREVIEW_SIZE = int(os.getenv("PREVIEW_SIZE", 1024))
@@ -1,12 +1,20 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Response, UploadFile, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from services.auth import get_current_user
 from services.db import schema
 from services.db.db import get_db
-from services.db.service import CheckService, IncidentService, ObjectService, SubObjectService
+from services.db.service import (
+    CheckService,
+    IncidentService,
+    ObjectService,
+    SubObjectService,
+    UploadService,
+)
+from services.others.uploads import hash_upload
 from services.others.video_client import analyze_video
 
 router = APIRouter(prefix="/checks", tags=["checks"])
@@ -129,17 +137,47 @@ def delete_check(check_id: int, db: Session = Depends(get_db)) -> None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Check not found")
 
 
+def _existing_video_response(
+    db: Session, subobject_id: int, content_hash: str
+) -> Optional[schema.VideoProcessingResponse]:
+    """Return the result of an earlier upload of the same video, if it still exists."""
+
+    upload_service = UploadService(db)
+    existing_upload = upload_service.find_upload(
+        schema.UploadKindEnum.VIDEO, subobject_id, content_hash
+    )
+    if not existing_upload:
+        return None
+    existing_check = CheckService(db).get_check(existing_upload.check_id)
+    if existing_check:
+        return schema.VideoProcessingResponse(
+            check=schema.Check.model_validate(existing_check),
+            incidents=[
+                schema.Incident.model_validate(item)
+                for item in IncidentService(db).list_incidents_by_check(existing_check.check_id)
+            ],
+        )
+    # проверку удалили - индекс устарел, обрабатываем заново
+    upload_service.delete_upload(existing_upload.upload_id)
+    return None
+
+
 @router.post(
     "/process-video",
     response_model=schema.VideoProcessingResponse,
     status_code=status.HTTP_201_CREATED,
 )
 async def process_video(
+    response: Response,
     subobject_id: int = Form(...),
     video: UploadFile = File(...),
     db: Session = Depends(get_db),
 ) -> schema.VideoProcessingResponse:
-    """Accept a video, forward it to the analysis service and persist results."""
+    """Accept a video, forward it to the analysis service and persist results.
+
+    A repeated upload of the same file for the same subobject returns the
+    previously created check and incidents without running the analysis again.
+    """
 
     current_user = get_current_user()
     if current_user.role is not schema.RoleEnum.INSPECTOR:
@@ -162,6 +200,12 @@ async def process_video(
 
     _ensure_subobject_access(db, subobject_id, current_user)
 
+    content_hash, size = await hash_upload(video)
+    existing = _existing_video_response(db, subobject_id, content_hash)
+    if existing:
+        response.status_code = status.HTTP_200_OK
+        return existing
+
     video_bytes = await video.read()
     check_data, incidents_data = analyze_video(video_bytes)
 
@@ -171,26 +215,22 @@ async def process_video(
         location=check_data.location,
         status_check=check_data.status_check,
     )
-
-    check_service = CheckService(db)
-    incident_service = IncidentService(db)
-
-    created_check = check_service.create_check(check_create)
-    saved_incidents: list[schema.Incident] = []
-    for incident_data in incidents_data:
-        incident_create = schema.IncidentCreate(
-            check_id=created_check.check_id,
-            photo=incident_data.photo,
-            incident_status=incident_data.incident_status,
-            incident_info=incident_data.incident_info,
-            prescription_type=incident_data.prescription_type,
+    upload = UploadService.new_upload(
+        schema.UploadKindEnum.VIDEO, subobject_id, content_hash, size=size
+    )
+    try:
+        created_check, incidents = CheckService(db).create_check_with_incidents(
+            check_create, incidents_data, upload
         )
-        incident = incident_service.create_incident(incident_create)
-        saved_incidents.append(schema.Incident.model_validate(incident))
-
-    response = schema.VideoProcessingResponse(
+    except IntegrityError:
+        # тот же файл параллельно обработан другим запросом - его проверка уже сохранена
+        existing = _existing_video_response(db, subobject_id, content_hash)
+        if not existing:
+            raise
+        response.status_code = status.HTTP_200_OK
+        return existing
+
+    return schema.VideoProcessingResponse(
         check=schema.Check.model_validate(created_check),
-        incidents=saved_incidents,
+        incidents=[schema.Incident.model_validate(item) for item in incidents],
     )
-
-    return response
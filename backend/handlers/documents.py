@@ -1,15 +1,42 @@
-from typing import List
+import asyncio
+import hashlib
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+import config
 from services.db import schema
 from services.db.db import get_db
-from services.db.service import DocumentService, MaterialService
-from services.others.photo_client import analyze_photo
+from services.auth import get_current_user
+from services.db.bulk_import import import_file
+from services.db.service import DocumentService, MaterialService, UploadService
+from services.others.blob_responses import blob_response
+from services.others.blob_store import get_blob_store
+from services.others.derivatives import derivative_response
+from services.others.expiring import get_expiring, query_expiring
+from services.others.photo_client import (
+    PhotoAnalysisError,
+    PhotoBackendUnavailableError,
+    analyze_photo,
+    analyze_photos,
+)
+from services.others.image_prep import InvalidImageError, probe_image_header
+from services.others.uploads import (
+    InvalidUploadError,
+    SpooledUpload,
+    UploadTooLargeError,
+    stream_multipart,
+)
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
+PHOTO_EXTENSIONS = {"image/jpeg": "jpg", "image/jpg": "jpg", "image/png": "png"}
+# расширение берём по формату из заголовка файла, а не по заявленному типу
+PHOTO_FORMAT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png"}
+
 
 @router.post("/", response_model=schema.Document, status_code=status.HTTP_201_CREATED)
 def create_document(
@@ -29,30 +56,48 @@ def list_documents(db: Session = Depends(get_db)) -> List[schema.Document]:
     return [schema.Document.model_validate(item) for item in documents]
 
 
-@router.post(
-    "/process-photo",
-    response_model=schema.PhotoProcessingResponse,
-    status_code=status.HTTP_201_CREATED,
-)
-async def process_photo(
-    user_id: int = Form(...),
-    object_id: int = Form(...),
-    photo: UploadFile = File(...),
-    db: Session = Depends(get_db),
-) -> schema.PhotoProcessingResponse:
-    """Accept a photo, forward it to the analysis service and persist the results."""
+def _existing_photo_response(
+    db: Session, object_id: int, content_hash: str
+) -> Optional[schema.PhotoProcessingResponse]:
+    """Return the result of an earlier upload of the same content, if it still exists."""
 
-    if photo.content_type not in {"image/jpeg", "image/png", "image/jpg"}:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Unsupported file type. Only JPEG and PNG are allowed.",
+    upload_service = UploadService(db)
+    existing_upload = upload_service.find_upload(
+        schema.UploadKindEnum.PHOTO, object_id, content_hash
+    )
+    if not existing_upload:
+        return None
+    existing_document = DocumentService(db).get_document(existing_upload.document_id)
+    if existing_document:
+        return schema.PhotoProcessingResponse(
+            document=schema.Document.model_validate(existing_document),
+            materials=[
+                schema.Material.model_validate(item)
+                for item in MaterialService(db).list_materials_by_document(
+                    existing_document.document_id
+                )
+            ],
         )
+    # документ удалили - индекс устарел, обрабатываем заново
+    upload_service.delete_upload(existing_upload.upload_id)
+    return None
+
 
-    image_bytes = await photo.read()
-    document_data, materials_data = analyze_photo(image_bytes)
+def _save_photo_result(
+    db: Session,
+    response: Response,
+    user_id: int,
+    object_id: int,
+    content_hash: str,
+    size: int,
+    document_data: schema.DocumentBase,
+    materials_data: List[schema.MaterialBase],
+) -> schema.PhotoProcessingResponse:
+    """Persist the document with its materials and the upload index in one transaction.
 
-    document_service = DocumentService(db)
-    material_service = MaterialService(db)
+    If a concurrent request for the same content committed first, its result is
+    returned instead of creating a second document.
+    """
 
     document_create = schema.DocumentCreate(
         user_id=user_id,
@@ -63,28 +108,245 @@ async def process_photo(
         doc_date_end=document_data.doc_date_end,
         doc_image_id=document_data.doc_image_id,
     )
-    document = document_service.create_document(document_create)
-
-    saved_materials: List[schema.Material] = []
-    for material_data in materials_data:
-        material_create = schema.MaterialCreate(
-            name=material_data.name,
-            okpd=material_data.okpd,
-            amount=material_data.amount,
-            uom=material_data.uom,
-            to_be_certified=material_data.to_be_certified,
-            certificate=material_data.certificate,
-            doc_id=document.document_id,
+    upload = UploadService.new_upload(
+        schema.UploadKindEnum.PHOTO, object_id, content_hash, size=size
+    )
+    try:
+        document, materials = DocumentService(db).create_document_with_materials(
+            document_create, materials_data, upload
         )
-        material = material_service.create_material(material_create)
-        saved_materials.append(schema.Material.model_validate(material))
-
-    response = schema.PhotoProcessingResponse(
+    except IntegrityError:
+        existing = _existing_photo_response(db, object_id, content_hash)
+        if not existing:
+            raise
+        response.status_code = status.HTTP_200_OK
+        return existing
+    return schema.PhotoProcessingResponse(
         document=schema.Document.model_validate(document),
-        materials=saved_materials,
+        materials=[schema.Material.model_validate(item) for item in materials],
     )
 
-    return response
+
+def _photo_form_schema(field: str, multiple: bool) -> dict:
+    # тело разбирается вручную (stream_multipart), поэтому форму описываем для OpenAPI сами
+    file_schema = {"type": "string", "format": "binary"}
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["user_id", "object_id", field],
+                        "properties": {
+                            "user_id": {"type": "integer"},
+                            "object_id": {"type": "integer"},
+                            field: {"type": "array", "items": file_schema} if multiple else file_schema,
+                        },
+                    }
+                }
+            },
+        }
+    }
+
+
+async def _receive_photos(
+    request: Request, field: str, max_files: int
+) -> Tuple[int, int, List[SpooledUpload]]:
+    """Stream the photo form into spooled files, rejecting bad uploads before they are buffered.
+
+    Each photo is hashed and size-checked as it arrives, and its image header is parsed
+    from the first bytes to check the format and dimensions before the full decode.
+    """
+
+    try:
+        fields, photos = await stream_multipart(
+            request,
+            max_file_size=config.PHOTO_MAX_BYTES,
+            max_files=max_files,
+            content_types=PHOTO_EXTENSIONS.keys(),
+            inspect=partial(probe_image_header, max_pixels=config.PHOTO_MAX_PIXELS),
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except (InvalidUploadError, InvalidImageError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    for other in [upload for upload in photos if upload.field != field]:
+        other.close()
+    photos = [photo for photo in photos if photo.field == field]
+    try:
+        if not photos:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Field {field!r} is required"
+            )
+        user_id, object_id = (_form_int(fields, name) for name in ("user_id", "object_id"))
+    except HTTPException:
+        for photo in photos:
+            photo.close()
+        raise
+    return user_id, object_id, photos
+
+
+def _form_int(fields: Dict[str, str], name: str) -> int:
+    try:
+        return int(fields[name])
+    except (KeyError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Field {name!r} must be an integer"
+        )
+
+
+async def _run_analysis(analysis):
+    try:
+        return await analysis
+    except InvalidImageError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except PhotoBackendUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except PhotoAnalysisError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Document recognition failed: {e}"
+        )
+
+
+@router.post(
+    "/process-photo",
+    response_model=schema.PhotoProcessingResponse,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra=_photo_form_schema("photo", multiple=False),
+)
+async def process_photo(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+) -> schema.PhotoProcessingResponse:
+    """Accept a photo, forward it to the analysis service and persist the results.
+
+    A repeated upload of the same file for the same object returns the
+    previously created document and materials without running the analysis again.
+    """
+
+    user_id, object_id, photos = await _receive_photos(request, "photo", max_files=1)
+    photo = photos[0]
+    try:
+        existing = _existing_photo_response(db, object_id, photo.content_hash)
+        if existing:
+            response.status_code = status.HTTP_200_OK
+            return existing
+
+        image_bytes = await asyncio.to_thread(photo.read)
+    finally:
+        photo.close()
+    image_key = await asyncio.to_thread(
+        get_blob_store().put_bytes, image_bytes, PHOTO_FORMAT_EXTENSIONS[photo.info.format]
+    )
+    document_data, materials_data = await _run_analysis(analyze_photo(image_bytes, image_key))
+    return _save_photo_result(
+        db, response, user_id, object_id, photo.content_hash, photo.size, document_data, materials_data
+    )
+
+
+@router.post(
+    "/process-photos",
+    response_model=schema.PhotoProcessingResponse,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra=_photo_form_schema("photos", multiple=True),
+)
+async def process_photos(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+) -> schema.PhotoProcessingResponse:
+    """Accept the pages of one multi-page document (in page order) and persist it as one document.
+
+    Pages are recognised concurrently and merged; line items repeated on two
+    adjacent photos are stored once. The same set of pages uploaded again
+    returns the earlier result.
+    """
+
+    user_id, object_id, photos = await _receive_photos(
+        request, "photos", max_files=config.PHOTO_BATCH_MAX_PAGES
+    )
+    try:
+        # ключ пакета - хэш от упорядоченных хэшей страниц
+        content_hash = hashlib.sha256(
+            ":".join(photo.content_hash for photo in photos).encode()
+        ).hexdigest()
+        size = sum(photo.size for photo in photos)
+        existing = _existing_photo_response(db, object_id, content_hash)
+        if existing:
+            response.status_code = status.HTTP_200_OK
+            return existing
+
+        pages = [await asyncio.to_thread(photo.read) for photo in photos]
+    finally:
+        for photo in photos:
+            photo.close()
+    blob_store = get_blob_store()
+    image_keys = await asyncio.gather(*(
+        asyncio.to_thread(blob_store.put_bytes, page, PHOTO_FORMAT_EXTENSIONS[photo.info.format])
+        for page, photo in zip(pages, photos)
+    ))
+    # у документа одно поле под изображение - храним первую страницу
+    document_data, materials_data = await _run_analysis(analyze_photos(pages, image_keys[0]))
+    return _save_photo_result(
+        db, response, user_id, object_id, content_hash, size, document_data, materials_data
+    )
+
+
+@router.post("/import", response_model=schema.ImportReport)
+def import_documents(
+    file: UploadFile = File(..., description="CSV or JSONL (.jsonl/.ndjson)"),
+    object_id: Optional[int] = Form(None),
+    user_id: Optional[int] = Form(None),
+    db: Session = Depends(get_db),
+) -> schema.ImportReport:
+    """Bulk-import historical documents and their materials.
+
+    Rows are validated and written in batches; invalid rows and rows of a batch
+    that fails to write are listed in the report instead of aborting the import.
+    ``object_id``/``user_id`` apply to rows that do not set them.
+    """
+
+    current_user = get_current_user()
+    if current_user.role is not schema.RoleEnum.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions"
+        )
+    if file.size is not None and file.size > config.IMPORT_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File is too large. At most {config.IMPORT_MAX_BYTES} bytes are allowed.",
+        )
+    defaults = {"user_id": user_id or current_user.user_id}
+    if object_id is not None:
+        defaults["object_id"] = object_id
+    return import_file(db, file.file, file.filename or "", defaults)
+
+
+@router.get("/expiring", response_model=List[schema.ExpiringDocument])
+def list_expiring_documents(
+    days: int = Query(30, ge=0, le=config.EXPIRING_MAX_DAYS),
+    object_id: Optional[int] = Query(None),
+    fresh: bool = Query(False, description="Query the database instead of the daily snapshot"),
+    db: Session = Depends(get_db),
+) -> List[schema.ExpiringDocument]:
+    """Documents whose end date falls within the next ``days`` days, soonest first.
+
+    Served from the in-memory snapshot, which is rebuilt after documents change;
+    ``fresh=true`` queries the database directly (e.g. to see writes made by
+    another worker process).
+    """
+
+    current_user = get_current_user()
+    if current_user.role is not schema.RoleEnum.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions"
+        )
+    if fresh:
+        return query_expiring(db, days, object_id)
+    return get_expiring(db, days, object_id)
 
 
 @router.get("/{document_id}", response_model=schema.Document)
@@ -97,6 +359,29 @@ def get_document(document_id: int, db: Session = Depends(get_db)) -> schema.Docu
     return schema.Document.model_validate(document)
 
 
+@router.api_route("/{document_id}/image", methods=["GET", "HEAD"])
+def get_document_image(document_id: int, request: Request, db: Session = Depends(get_db)) -> Response:
+    # фото документа с диска; Range, ETag и 304 - в blob_response
+    document = DocumentService(db).get_document(document_id)
+    if not document:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    return blob_response(request, document.doc_image_id)
+
+
+@router.get("/{document_id}/thumbnail")
+def get_document_thumbnail(
+    document_id: int,
+    request: Request,
+    variant: str = Query("thumb", pattern="^(thumb|preview)$"),
+    db: Session = Depends(get_db),
+) -> Response:
+    # миниатюра фото документа; пока она строится - заглушка
+    document = DocumentService(db).get_document(document_id)
+    if not document:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    return derivative_response(request, document.doc_image_id, variant)
+
+
 @router.put("/{document_id}", response_model=schema.Document)
 def update_document(
     document_id: int, document_in: schema.DocumentUpdate, db: Session = Depends(get_db)
@@ -1,11 +1,13 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
 
 from services.db import schema
 from services.db.db import get_db
 from services.db.service import IncidentService
+from services.others.blob_responses import blob_response
+from services.others.derivatives import derivative_response
 
 router = APIRouter(prefix="/incidents", tags=["incidents"])
 
@@ -35,6 +37,29 @@ def get_incident(incident_id: int, db: Session = Depends(get_db)) -> schema.Inci
     return schema.Incident.model_validate(incident)
 
 
+@router.api_route("/{incident_id}/photo", methods=["GET", "HEAD"])
+def get_incident_photo(incident_id: int, request: Request, db: Session = Depends(get_db)) -> Response:
+    # кадр нарушения с диска; Range, ETag и 304 - в blob_response
+    incident = IncidentService(db).get_incident(incident_id)
+    if not incident:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Incident not found")
+    return blob_response(request, incident.photo)
+
+
+@router.get("/{incident_id}/thumbnail")
+def get_incident_thumbnail(
+    incident_id: int,
+    request: Request,
+    variant: str = Query("thumb", pattern="^(thumb|preview)$"),
+    db: Session = Depends(get_db),
+) -> Response:
+    # миниатюра кадра нарушения; пока она строится - заглушка
+    incident = IncidentService(db).get_incident(incident_id)
+    if not incident:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Incident not found")
+    return derivative_response(request, incident.photo, variant)
+
+
 @router.put("/{incident_id}", response_model=schema.Incident)
 def update_incident(
     incident_id: int, incident_in: schema.IncidentUpdate, db: Session = Depends(get_db)
@@ -1,11 +1,12 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from services.db import schema
 from services.db.db import get_db
 from services.db.service import MaterialService
+from services.others.okpd_index import get_okpd_index
 
 router = APIRouter(prefix="/materials", tags=["materials"])
 
@@ -14,7 +15,7 @@ router = APIRouter(prefix="/materials", tags=["materials"])
 def create_material(
     material_in: schema.MaterialCreate, db: Session = Depends(get_db)
 ) -> schema.Material:
-    # так же реализовать все проверки
+    # так же реализовать все проверки; пустой okpd подбирается по наименованию в сервисе
     service = MaterialService(db)
     material = service.create_material(material_in)
     return schema.Material.model_validate(material)
@@ -28,6 +29,30 @@ def list_materials(db: Session = Depends(get_db)) -> List[schema.Material]:
     return [schema.Material.model_validate(item) for item in materials]
 
 
+@router.get("/okpd", response_model=List[schema.OkpdCandidate])
+def lookup_okpd(
+    q: Optional[str] = Query(None, min_length=2, description="Material name to match"),
+    code: Optional[str] = Query(None, min_length=1, description="OKPD code prefix"),
+    limit: int = Query(5, ge=1, le=50),
+) -> List[schema.OkpdCandidate]:
+    """Return the OKPD codes closest to a material name, or the codes starting with a prefix."""
+
+    index = get_okpd_index()
+    if index is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="OKPD classifier is not loaded"
+        )
+    if q:
+        matches = index.search(q, k=limit)
+    elif code:
+        matches = index.by_prefix(code, limit)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Either q or code is required"
+        )
+    return [schema.OkpdCandidate(**match._asdict()) for match in matches]
+
+
 @router.get("/{material_id}", response_model=schema.Material)
 def get_material(material_id: int, db: Session = Depends(get_db)) -> schema.Material:
     # реализовать проверки и если пользователь привязан к данному материалу - показываем, нет - значит нет, админу все
@@ -0,0 +1,18 @@
+from typing import Dict, List
+
+from fastapi import APIRouter, Query
+from fastapi.responses import PlainTextResponse
+
+from services.others.metrics import REGISTRY, recent_traces
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/metrics/traces", response_model=List[Dict])
+def traces(limit: int = Query(20, ge=1, le=100)) -> List[Dict]:
+    return recent_traces(limit)
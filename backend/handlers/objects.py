@@ -1,12 +1,15 @@
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+import config
 from services.db import schema
 from services.db.db import get_db
-from services.db.service import ObjectService, UserService
+from services.db.service import MaterialService, ObjectService, UserService
 from services.auth import get_current_user
+from services.others import export
 
 router = APIRouter(prefix="/objects", tags=["objects"])
 
@@ -59,14 +62,10 @@ def list_objects(
     return [schema.Object.model_validate(obj) for obj in objects]
 
 
-@router.get("/{object_id}", response_model=schema.Object)
-def get_object(object_id: int, db: Session = Depends(get_db)) -> schema.Object:
-    #  здесь так же реализовать проверку если админ - любой объект можно вернуть, если нет - то только объекты,
-    #  привязанные к тебе
-    # если ты стучишься не будучи админом к объекты, который тебе недоступен - возвращаем нет прав и соот ошибку
+def _get_accessible_object(object_id: int, db: Session):
+    # админу любой объект, инспектору и подрядчику - только свои, к чужому - нет прав
     current_user = get_current_user()
-    service = ObjectService(db)
-    obj = service.get_object(object_id)
+    obj = ObjectService(db).get_object(object_id)
     if not obj:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Object not found")
     if current_user.role == schema.RoleEnum.INSPECTOR and obj.inspector_id != current_user.user_id:
@@ -77,9 +76,60 @@ def get_object(object_id: int, db: Session = Depends(get_db)) -> schema.Object:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions"
         )
+    return obj
+
+
+@router.get("/{object_id}", response_model=schema.Object)
+def get_object(object_id: int, db: Session = Depends(get_db)) -> schema.Object:
+    #  здесь так же реализовать проверку если админ - любой объект можно вернуть, если нет - то только объекты,
+    #  привязанные к тебе
+    # если ты стучишься не будучи админом к объекты, который тебе недоступен - возвращаем нет прав и соот ошибку
+    obj = _get_accessible_object(object_id, db)
     return schema.Object.model_validate(obj)
 
 
+@router.get("/{object_id}/materials/totals", response_model=List[schema.MaterialTotal])
+def get_material_totals(object_id: int, db: Session = Depends(get_db)) -> List[schema.MaterialTotal]:
+    # итоги по материалам объекта в канонических единицах
+    _get_accessible_object(object_id, db)
+    totals = MaterialService(db).totals_by_object(object_id)
+    return [
+        schema.MaterialTotal(name=name or "", uom=uom, amount=amount, materials=count)
+        for name, uom, amount, count in totals
+    ]
+
+
+@router.get("/{object_id}/export")
+def export_object(
+    object_id: int,
+    db: Session = Depends(get_db),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|xlsx)$"),
+    gzip: bool = Query(False, description="Compress the file with gzip on the fly"),
+) -> StreamingResponse:
+    # документы и материалы объекта одной выгрузкой; строки читаются из БД порциями и сразу отдаются
+    _get_accessible_object(object_id, db)
+    if export_format == "xlsx":
+        try:
+            export.require_xlsx()
+        except RuntimeError as e:
+            raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+        body = export.iter_xlsx(export.export_rows(object_id))
+    else:
+        body = export.iter_csv(export.export_rows(object_id))
+
+    filename = f"object_{object_id}.{export_format}"
+    media_type = export.MEDIA_TYPES[export_format]
+    if gzip:
+        body = export.gzip_stream(body, config.EXPORT_GZIP_LEVEL)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.put("/{object_id}", response_model=schema.Object)
 def update_object(
     object_id: int, object_in: schema.ObjectUpdate, db: Session = Depends(get_db)
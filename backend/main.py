@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from typing import Dict
 
 from fastapi import FastAPI
@@ -7,13 +8,30 @@ from handlers.checks import router as checks_router
 from handlers.documents import router as documents_router
 from handlers.incidents import router as incidents_router
 from handlers.materials import router as materials_router
+from handlers.metrics import router as metrics_router
 from handlers.objects import router as objects_router
 from handlers.subobjects import router as subobjects_router
 from services.db.db import create_tables
+from services.others.derivatives import get_derivative_worker
+from services.others.expiring import start_expiring_scan, stop_expiring_scan
+from services.others.transcribe_client import close_http_client
 
 create_tables()
 
-app = FastAPI(title="User Service API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ежедневный пересчёт истекающих документов и миниатюры для новых изображений
+    start_expiring_scan()
+    derivative_worker = get_derivative_worker()
+    yield
+    stop_expiring_scan()
+    derivative_worker.shutdown()
+    # общий пул keep-alive соединений к AI-сервисам
+    await close_http_client()
+
+
+app = FastAPI(title="User Service API", lifespan=lifespan)
 app.include_router(auth_router)
 app.include_router(objects_router)
 app.include_router(subobjects_router)
@@ -21,6 +39,7 @@ app.include_router(checks_router)
 app.include_router(incidents_router)
 app.include_router(documents_router)
 app.include_router(materials_router)
+app.include_router(metrics_router)
 
 
 @app.get("/")
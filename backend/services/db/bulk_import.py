@@ -0,0 +1,298 @@
+"""Bulk import of documents and materials from CSV or JSONL.
+
+Input is read as a stream and processed in batches. Each batch is validated with one
+``TypeAdapter`` call, its rows are grouped into documents in memory, and the batch is
+written in its own transaction with multi-row INSERTs. Bad rows, and every row of a
+batch whose transaction fails, are reported as rejects; the import carries on.
+
+Usage::
+
+    python -m services.db.bulk_import ttn.csv --user-id 1 --object-id 7
+"""
+
+import argparse
+import codecs
+import csv
+import io
+import json
+from collections import OrderedDict
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.orm import Session
+
+import config
+from services.db import model, schema
+from services.others.export import EXPORT_COLUMNS
+from services.others.okpd_index import resolve_okpd
+from services.others.uom import to_canonical
+
+# (line, raw row, parse error)
+RawRow = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+DocumentKey = Tuple[int, str, str, Any]
+
+_ROWS = TypeAdapter(List[schema.ImportRow])
+
+# заголовки выгрузки (services.others.export) -> поля импорта, чтобы выгрузку можно было загрузить обратно
+_HEADER_ALIASES = {title: key for key, title in EXPORT_COLUMNS}
+
+
+def _normalize_header(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {_HEADER_ALIASES.get(key, key): value for key, value in row.items() if key is not None}
+
+
+def read_csv(stream: IO[bytes]) -> Iterator[RawRow]:
+    """Yield CSV rows as dicts keyed by header; the delimiter is sniffed from the first 4 KiB."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(text, dialect=dialect)
+    for row in reader:
+        yield reader.line_num, _normalize_header(row), None
+    text.detach()
+
+
+def read_jsonl(stream: IO[bytes]) -> Iterator[RawRow]:
+    """Yield JSONL rows. A line is either a flat row or a document with a ``materials`` list."""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.removeprefix(codecs.BOM_UTF8)
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "expected a JSON object"
+            continue
+        materials = row.pop("materials", None)
+        if not materials:
+            yield line_number, row, None
+            continue
+        for material in materials:
+            yield line_number, {**row, **material}, None
+
+
+def read_rows(stream: IO[bytes], filename: str) -> Iterator[RawRow]:
+    if filename.lower().endswith((".jsonl", ".ndjson")):
+        return read_jsonl(stream)
+    return read_csv(stream)
+
+
+def _with_defaults(row: Dict[str, Any], defaults: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # пустая ячейка не перекрывает значение по умолчанию
+    filled = {
+        key: value for key, value in row.items()
+        if value is not None and not (isinstance(value, str) and not value.strip())
+    }
+    return {**(defaults or {}), **filled}
+
+
+def _document_key(row: schema.ImportRow) -> DocumentKey:
+    return row.object_id, row.doc_type.value, row.doc_number, row.doc_date_start
+
+
+class BulkImporter:
+    """Write validated import rows in chunked transactions; one instance per import run."""
+
+    def __init__(self, session: Session, batch_size: int = 1000, max_rejects: int = 1000) -> None:
+        self._session = session
+        self.batch_size = batch_size
+        self.max_rejects = max_rejects
+        self.report = schema.ImportReport()
+        # документы, созданные этим импортом: строки одного документа могут прийти в разных пачках
+        self._created: Dict[DocumentKey, int] = {}
+        self._known_objects: Set[int] = set()
+        self._known_users: Set[int] = set()
+
+    def run(self, rows: Iterable[RawRow], defaults: Optional[Dict[str, Any]] = None) -> schema.ImportReport:
+        """Import all rows; ``defaults`` fill fields a row does not set (e.g. object_id, user_id)."""
+        batch: List[RawRow] = []
+        for line, row, error in rows:
+            self.report.rows += 1
+            if error is not None:
+                self._reject(line, error)
+                continue
+            batch.append((line, _with_defaults(row, defaults), None))
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch)
+                batch = []
+        if batch:
+            self._import_batch(batch)
+        return self.report
+
+    def _reject(self, line: int, error: str) -> None:
+        self.report.rejected += 1
+        if len(self.report.rejects) < self.max_rejects:
+            self.report.rejects.append(schema.ImportReject(line=line, error=error))
+
+    def _validate(self, batch: List[RawRow]) -> List[Tuple[int, schema.ImportRow]]:
+        lines = [line for line, _, _ in batch]
+        raw = [row for _, row, _ in batch]
+        try:
+            return list(zip(lines, _ROWS.validate_python(raw)))
+        except ValidationError as e:
+            validation_error = e
+        errors: Dict[int, List[str]] = {}
+        for error in validation_error.errors(include_url=False):
+            index = error["loc"][0]
+            field = ".".join(str(part) for part in error["loc"][1:])
+            errors.setdefault(index, []).append(f"{field}: {error['msg']}" if field else error["msg"])
+        for index, messages in errors.items():
+            self._reject(lines[index], "; ".join(messages))
+        # строки проверяются независимо, поэтому остаток пачки проходит вторую проверку целиком
+        keep = [index for index in range(len(batch)) if index not in errors]
+        return list(zip([lines[i] for i in keep], _ROWS.validate_python([raw[i] for i in keep])))
+
+    def _check_references(self, rows: List[Tuple[int, schema.ImportRow]]) -> List[Tuple[int, schema.ImportRow]]:
+        object_ids = {row.object_id for _, row in rows} - self._known_objects
+        if object_ids:
+            self._known_objects.update(self._session.scalars(
+                select(model.Object.object_id).where(model.Object.object_id.in_(object_ids))
+            ))
+        user_ids = {row.user_id for _, row in rows} - self._known_users
+        if user_ids:
+            self._known_users.update(self._session.scalars(
+                select(model.User.user_id).where(model.User.user_id.in_(user_ids))
+            ))
+        valid = []
+        for line, row in rows:
+            if row.object_id not in self._known_objects:
+                self._reject(line, f"object {row.object_id} not found")
+            elif row.user_id not in self._known_users:
+                self._reject(line, f"user {row.user_id} not found")
+            else:
+                valid.append((line, row))
+        return valid
+
+    def _existing_documents(self, keys: Iterable[DocumentKey]) -> Set[DocumentKey]:
+        keys = [key for key in keys if key not in self._created]
+        if not keys:
+            return set()
+        columns = (
+            model.Document.object_id,
+            model.Document.doc_type,
+            model.Document.doc_number,
+            model.Document.doc_date_start,
+        )
+        found = self._session.execute(
+            select(*columns).where(tuple_(*columns).in_(
+                [(object_id, model.DocTypeEnum(doc_type), number, start) for object_id, doc_type, number, start in keys]
+            ))
+        )
+        return {(object_id, doc_type.value, number, start) for object_id, doc_type, number, start in found}
+
+    def _import_batch(self, batch: List[RawRow]) -> None:
+        rows = self._check_references(self._validate(batch))
+        if not rows:
+            return
+
+        # документы пачки в порядке первого появления; строки материалов - к своему документу
+        documents: "OrderedDict[DocumentKey, schema.ImportRow]" = OrderedDict()
+        materials: List[Tuple[DocumentKey, schema.ImportRow]] = []
+        existing = self._existing_documents({_document_key(row) for _, row in rows})
+        lines = []
+        for line, row in rows:
+            key = _document_key(row)
+            if key in existing:
+                self._reject(line, "document already exists")
+                continue
+            if key not in self._created:
+                documents.setdefault(key, row)
+            if row.name is not None:
+                materials.append((key, row))
+            lines.append(line)
+
+        try:
+            if documents:
+                ids = self._session.scalars(
+                    insert(model.Document).returning(
+                        model.Document.document_id, sort_by_parameter_order=True
+                    ),
+                    [
+                        {
+                            "user_id": row.user_id,
+                            "object_id": row.object_id,
+                            "doc_type": model.DocTypeEnum(row.doc_type.value),
+                            "doc_number": row.doc_number,
+                            "doc_date_start": row.doc_date_start,
+                            "doc_date_end": row.doc_date_end,
+                            "doc_image_id": row.doc_image_id,
+                        }
+                        for row in documents.values()
+                    ],
+                ).all()
+                created = dict(zip(documents, ids))
+            else:
+                created = {}
+            doc_ids = {**self._created, **created}
+            if materials:
+                self._session.execute(insert(model.Material), [
+                    self._material_values(row, doc_ids[key]) for key, row in materials
+                ])
+            self._session.commit()
+        except Exception as e:
+            self._session.rollback()
+            for line in lines:
+                self._reject(line, f"batch write failed: {e}")
+            return
+        self._created.update(created)
+        self.report.documents += len(created)
+        self.report.materials += len(materials)
+
+    @staticmethod
+    def _material_values(row: schema.ImportRow, doc_id: int) -> Dict[str, Any]:
+        amount_canonical, uom_canonical = to_canonical(row.amount, row.uom)
+        return {
+            "name": row.name,
+            "doc_id": doc_id,
+            "okpd": row.okpd or resolve_okpd(row.name),
+            "amount": row.amount,
+            "uom": row.uom,
+            "amount_canonical": amount_canonical,
+            "uom_canonical": uom_canonical,
+            "to_be_certified": row.to_be_certified,
+            "certificate": row.certificate,
+        }
+
+
+def import_file(
+        session: Session,
+        stream: IO[bytes],
+        filename: str,
+        defaults: Optional[Dict[str, Any]] = None,
+        batch_size: int = 0
+) -> schema.ImportReport:
+    importer = BulkImporter(session, batch_size or config.IMPORT_BATCH_SIZE)
+    return importer.run(read_rows(stream, filename), defaults)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk import documents and materials from CSV/JSONL.")
+    parser.add_argument("path", help="CSV or JSONL (.jsonl/.ndjson) file")
+    parser.add_argument("--user-id", type=int, help="user_id for rows that do not set it")
+    parser.add_argument("--object-id", type=int, help="object_id for rows that do not set it")
+    parser.add_argument("--batch-size", type=int, default=config.IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from services.db.db import SessionLocal, create_tables
+
+    create_tables()
+    defaults = {key: value for key, value in (("user_id", args.user_id), ("object_id", args.object_id)) if value}
+    db = SessionLocal()
+    try:
+        with open(args.path, "rb") as f:
+            report = import_file(db, f, args.path, defaults, args.batch_size)
+    finally:
+        db.close()
+    print(report.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 
-from services.db.model import Base
+from services.db.model import Base, Material
+from services.others.uom import to_canonical
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./build_ai_2025.db"
 engine = create_engine(
@@ -13,9 +14,50 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    upgrade_tables()
     print("Таблицы созданы успешно!")
 
 
+def upgrade_tables():
+    """Bring tables created by older versions up to date: add new columns and indexes, backfill values."""
+    inspector = inspect(engine)
+    material_columns = {column["name"] for column in inspector.get_columns(Material.__tablename__)}
+    with engine.begin() as conn:
+        for column in (Material.__table__.c.amount_canonical, Material.__table__.c.uom_canonical):
+            if column.name not in material_columns:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{Material.__tablename__}" ADD COLUMN {column.name} {column_type}'))
+    # create_all не создаёт индексы у уже существующих таблиц
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # каждый запуск: прерванный пересчёт продолжится, уже заполненные строки не выбираются
+    backfill_canonical_uom()
+
+
+def backfill_canonical_uom(batch_size: int = 1000):
+    """Fill canonical amount/uom for materials written before the columns existed."""
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            materials = (
+                db.query(Material)
+                .filter(Material.material_id > last_id, Material.uom_canonical.is_(None), Material.uom.isnot(None))
+                .order_by(Material.material_id)
+                .limit(batch_size)
+                .all()
+            )
+            if not materials:
+                break
+            for material in materials:
+                material.amount_canonical, material.uom_canonical = to_canonical(material.amount, material.uom)
+            db.commit()
+            last_id = materials[-1].material_id
+    finally:
+        db.close()
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Enum, Text, Float, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Enum, Text, Float, Boolean, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import enum
@@ -35,6 +35,11 @@ class DocTypeEnum(enum.Enum):
     OUTPUT = "output"
 
 
+class UploadKindEnum(enum.Enum):
+    VIDEO = "video"
+    PHOTO = "photo"
+
+
 class User(Base):
     __tablename__ = "USER"
 
@@ -103,6 +108,10 @@ class Incident(Base):
 
 class Document(Base):
     __tablename__ = "DOCUMENT"
+    __table_args__ = (
+        # документы объекта и истекающие документы объекта; ведущий object_id заменяет отдельный индекс
+        Index("ix_document_object_date_end", "object_id", "doc_date_end"),
+    )
 
     document_id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("USER.user_id"))
@@ -110,7 +119,8 @@ class Document(Base):
     doc_type = Column(Enum(DocTypeEnum))
     doc_number = Column(String(50))
     doc_date_start = Column(Date)
-    doc_date_end = Column(Date)
+    # диапазонный поиск истекающих документов по всем объектам
+    doc_date_end = Column(Date, index=True)
     doc_image_id = Column(String(100))
 
     user = relationship("User")
@@ -122,11 +132,35 @@ class Material(Base):
 
     material_id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(200))
-    doc_id = Column(Integer, ForeignKey("DOCUMENT.document_id"))
+    doc_id = Column(Integer, ForeignKey("DOCUMENT.document_id"), index=True)
     okpd = Column(String(50), nullable=True)
     amount = Column(Float)
     uom = Column(String(20))
+    # количество и единица, приведённые к канонической (services.others.uom) при записи
+    amount_canonical = Column(Float)
+    uom_canonical = Column(String(20))
     to_be_certified = Column(Boolean)
     certificate = Column(Text)
 
     document = relationship("Document")
+
+
+class Upload(Base):
+    __tablename__ = "UPLOAD"
+    __table_args__ = (
+        UniqueConstraint("kind", "scope_id", "content_hash", name="uq_upload_kind_scope_hash"),
+    )
+
+    upload_id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(Enum(UploadKindEnum), nullable=False)
+    # subobject_id для видео, object_id для фото
+    scope_id = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    size = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # запись индекса удаляется вместе с проверкой/документом
+    check_id = Column(Integer, ForeignKey("CHECK.check_id", ondelete="CASCADE"), nullable=True)
+    document_id = Column(Integer, ForeignKey("DOCUMENT.document_id", ondelete="CASCADE"), nullable=True)
+
+    check = relationship("Check")
+    document = relationship("Document")
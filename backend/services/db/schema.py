@@ -1,9 +1,9 @@
 import enum
 from enum import Enum
 from datetime import date, datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, ConfigDict, field_validator
+from pydantic import BaseModel, ConfigDict, field_validator, model_validator
 
 
 class StatusEnum(str, Enum):
@@ -57,6 +57,11 @@ class DocTypeEnum(str, Enum):
     OUTPUT = "output"
 
 
+class UploadKindEnum(str, Enum):
+    VIDEO = "video"
+    PHOTO = "photo"
+
+
 # Базовые схемы для всех моделей
 class UserBase(BaseModel):
     name: str
@@ -196,6 +201,11 @@ class Document(DocumentBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ExpiringDocument(Document):
+    object_name: Optional[str] = None
+    days_left: int
+
+
 class MaterialBase(BaseModel):
     name: str
     okpd: Optional[str] = None
@@ -212,10 +222,93 @@ class MaterialCreate(MaterialBase):
 class Material(MaterialBase):
     material_id: int
     doc_id: int
+    amount_canonical: Optional[float] = None
+    uom_canonical: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class MaterialTotal(BaseModel):
+    name: str
+    uom: Optional[str] = None
+    amount: float
+    materials: int
+
+
+class ImportRow(BaseModel):
+    """One row of a bulk import: a document and (optionally) one of its materials.
+
+    Rows with the same object, type, number and start date belong to one document.
+    """
+
+    object_id: int
+    user_id: int
+    doc_type: DocTypeEnum
+    doc_number: str
+    doc_date_start: date
+    doc_date_end: Optional[date] = None
+    doc_image_id: str = ""
+    name: Optional[str] = None
+    okpd: Optional[str] = None
+    amount: Optional[float] = None
+    uom: Optional[str] = None
+    to_be_certified: bool = False
+    certificate: Optional[str] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def _clean_strings(cls, values):
+        # пустые ячейки CSV - это отсутствующие значения
+        if isinstance(values, dict):
+            values = {
+                key: (value.strip() or None) if isinstance(value, str) else value
+                for key, value in values.items()
+            }
+            values = {key: value for key, value in values.items() if value is not None}
+        return values
+
+    @field_validator("doc_date_start", "doc_date_end", mode="before")
+    @classmethod
+    def _parse_ru_date(cls, value):
+        if isinstance(value, str) and len(value) == 10 and value[2] == "." and value[5] == ".":
+            return f"{value[6:]}-{value[3:5]}-{value[:2]}"
+        return value
+
+    @field_validator("to_be_certified", mode="before")
+    @classmethod
+    def _parse_ru_bool(cls, value):
+        if isinstance(value, str) and value.lower() in ("да", "нет"):
+            return value.lower() == "да"
+        return value
+
+    @model_validator(mode="after")
+    def _check_material(self):
+        if self.doc_date_end is None:
+            self.doc_date_end = self.doc_date_start
+        if self.name is not None and (self.amount is None or self.uom is None):
+            raise ValueError("material rows need amount and uom")
+        return self
+
+
+class ImportReject(BaseModel):
+    line: int
+    error: str
+
+
+class ImportReport(BaseModel):
+    rows: int = 0
+    documents: int = 0
+    materials: int = 0
+    rejected: int = 0
+    rejects: List[ImportReject] = []
+
+
+class OkpdCandidate(BaseModel):
+    code: str
+    name: str
+    score: float
+
+
 class PhotoProcessingResponse(BaseModel):
     document: Document
     materials: list[Material]
@@ -313,6 +406,7 @@ __all__ = [
     "RoleEnum",
     "PrescriptionTypeEnum",
     "DocTypeEnum",
+    "UploadKindEnum",
     "UserBase",
     "UserCreate",
     "User",
@@ -341,10 +435,16 @@ __all__ = [
     "DocumentCreate",
     "Document",
     "DocumentUpdate",
+    "ExpiringDocument",
     "MaterialBase",
     "MaterialCreate",
     "Material",
     "MaterialUpdate",
+    "MaterialTotal",
+    "ImportRow",
+    "ImportReject",
+    "ImportReport",
+    "OkpdCandidate",
     "PhotoProcessingResponse",
     "UserUpdate",
     "LoginRequest",
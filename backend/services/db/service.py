@@ -1,9 +1,55 @@
-from typing import List, Optional
+from datetime import date
+from typing import Iterator, List, Optional, Tuple
 
+from sqlalchemy import Row, func, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from services.db import model, schema
+from services.others.okpd_index import resolve_okpd
+from services.others.uom import to_canonical
+
+
+def _new_material(material_in: schema.MaterialBase, doc_id: int) -> model.Material:
+    amount_canonical, uom_canonical = to_canonical(material_in.amount, material_in.uom)
+    return model.Material(
+        name=material_in.name,
+        doc_id=doc_id,
+        okpd=material_in.okpd or resolve_okpd(material_in.name),
+        amount=material_in.amount,
+        uom=material_in.uom,
+        amount_canonical=amount_canonical,
+        uom_canonical=uom_canonical,
+        to_be_certified=material_in.to_be_certified,
+        certificate=material_in.certificate,
+    )
+
+
+def _new_check(check_in: schema.CheckCreate) -> model.Check:
+    return model.Check(
+        subobject_id=check_in.subobject_id,
+        location=check_in.location,
+        info=check_in.info,
+        status_check=(
+            model.CheckStatusEnum(check_in.status_check.value)
+            if check_in.status_check
+            else None
+        ),
+    )
+
+
+def _new_incident(incident_in: schema.IncidentBase, check_id: int) -> model.Incident:
+    return model.Incident(
+        check_id=check_id,
+        photo=incident_in.photo,
+        incident_status=incident_in.incident_status,
+        incident_info=incident_in.incident_info,
+        prescription_type=(
+            model.PrescriptionTypeEnum(incident_in.prescription_type.value)
+            if incident_in.prescription_type
+            else None
+        ),
+    )
 
 
 class UserService:
@@ -268,21 +314,43 @@ class CheckService:
         self._session = session
 
     def create_check(self, check_in: schema.CheckCreate) -> model.Check:
-        check = model.Check(
-            subobject_id=check_in.subobject_id,
-            location=check_in.location,
-            info=check_in.info,
-            status_check=(
-                model.CheckStatusEnum(check_in.status_check.value)
-                if check_in.status_check
-                else None
-            ),
-        )
+        check = _new_check(check_in)
         self._session.add(check)
         self._session.commit()
         self._session.refresh(check)
         return check
 
+    def create_check_with_incidents(
+            self,
+            check_in: schema.CheckCreate,
+            incidents_in: List[schema.IncidentBase],
+            upload: Optional[model.Upload] = None,
+    ) -> Tuple[model.Check, List[model.Incident]]:
+        """Create a check and all of its incidents in a single transaction.
+
+        ``upload`` (see :meth:`UploadService.new_upload`) is committed in the same
+        transaction, so a concurrent upload of the same file fails with
+        ``IntegrityError`` instead of creating a second check.
+        """
+        check = _new_check(check_in)
+        try:
+            self._session.add(check)
+            # flush, чтобы получить check_id до коммита
+            self._session.flush()
+            incidents = [_new_incident(incident_in, check.check_id) for incident_in in incidents_in]
+            self._session.add_all(incidents)
+            if upload is not None:
+                upload.check_id = check.check_id
+                self._session.add(upload)
+            self._session.commit()
+        except Exception:
+            self._session.rollback()
+            raise
+        self._session.refresh(check)
+        for incident in incidents:
+            self._session.refresh(incident)
+        return check, incidents
+
     def list_checks(self, *, role: schema.RoleEnum, user_id: int) -> List[model.Check]:
         query = self._session.query(model.Check)
 
@@ -332,6 +400,10 @@ class CheckService:
         check = self.get_check(check_id)
         if not check:
             return False
+        # в существующих БД внешний ключ UPLOAD создан без ON DELETE CASCADE
+        self._session.query(model.Upload).filter(model.Upload.check_id == check_id).delete(
+            synchronize_session=False
+        )
         self._session.delete(check)
         self._session.commit()
         return True
@@ -344,18 +416,7 @@ class IncidentService:
         self._session = session
 
     def create_incident(self, incident_in: schema.IncidentCreate) -> model.Incident:
-        incident = model.Incident(
-            check_id=incident_in.check_id,
-            photo=incident_in.photo,
-            incident_status=incident_in.incident_status,
-            incident_info=incident_in.incident_info,
-            prescription_type=
-            (
-                model.PrescriptionTypeEnum(incident_in.prescription_type.value)
-                if incident_in.prescription_type
-                else None
-            ),
-        )
+        incident = _new_incident(incident_in, incident_in.check_id)
         self._session.add(incident)
         self._session.commit()
         self._session.refresh(incident)
@@ -364,6 +425,14 @@ class IncidentService:
     def list_incidents(self) -> List[model.Incident]:
         return self._session.query(model.Incident).all()
 
+    def list_incidents_by_check(self, check_id: int) -> List[model.Incident]:
+        return (
+            self._session.query(model.Incident)
+            .filter(model.Incident.check_id == check_id)
+            .order_by(model.Incident.incident_id)
+            .all()
+        )
+
     def get_incident(self, incident_id: int) -> Optional[model.Incident]:
         return (
             self._session.query(model.Incident)
@@ -427,9 +496,101 @@ class DocumentService:
         self._session.refresh(document)
         return document
 
+    def create_document_with_materials(
+            self,
+            document_in: schema.DocumentCreate,
+            materials_in: List[schema.MaterialBase],
+            upload: Optional[model.Upload] = None,
+    ) -> Tuple[model.Document, List[model.Material]]:
+        """Create a document and all of its materials in a single transaction.
+
+        ``upload`` (see :meth:`UploadService.new_upload`) is committed in the same
+        transaction, so a concurrent upload of the same file fails with
+        ``IntegrityError`` instead of creating a second document.
+        """
+        document = model.Document(
+            user_id=document_in.user_id,
+            object_id=document_in.object_id,
+            doc_type=model.DocTypeEnum(document_in.doc_type.value),
+            doc_number=document_in.doc_number,
+            doc_date_start=document_in.doc_date_start,
+            doc_date_end=document_in.doc_date_end,
+            doc_image_id=document_in.doc_image_id,
+        )
+        try:
+            self._session.add(document)
+            # flush, чтобы получить document_id до коммита
+            self._session.flush()
+            materials = [_new_material(material_in, document.document_id) for material_in in materials_in]
+            self._session.add_all(materials)
+            if upload is not None:
+                upload.document_id = document.document_id
+                self._session.add(upload)
+            self._session.commit()
+        except Exception:
+            self._session.rollback()
+            raise
+        self._session.refresh(document)
+        for material in materials:
+            self._session.refresh(material)
+        return document, materials
+
     def list_documents(self) -> List[model.Document]:
         return self._session.query(model.Document).all()
 
+    def iter_export_rows(self, object_id: int, yield_per: int = 1000) -> Iterator[Row]:
+        """Yield one row per material of an object's documents (documents without materials once).
+
+        Plain columns from a single outer join, fetched ``yield_per`` rows at a time from a
+        server-side cursor, so memory does not grow with the number of rows.
+        """
+        statement = (
+            select(
+                model.Document.document_id,
+                model.Document.doc_type,
+                model.Document.doc_number,
+                model.Document.doc_date_start,
+                model.Document.doc_date_end,
+                model.Document.doc_image_id,
+                model.Material.material_id,
+                model.Material.name,
+                model.Material.okpd,
+                model.Material.amount,
+                model.Material.uom,
+                model.Material.amount_canonical,
+                model.Material.uom_canonical,
+                model.Material.to_be_certified,
+                model.Material.certificate,
+            )
+            .outerjoin(model.Material, model.Material.doc_id == model.Document.document_id)
+            .where(model.Document.object_id == object_id)
+            .order_by(model.Document.document_id, model.Material.material_id)
+            .execution_options(stream_results=True, yield_per=yield_per)
+        )
+        result = self._session.execute(statement)
+        try:
+            for partition in result.partitions():
+                yield from partition
+        finally:
+            result.close()
+
+    def list_expiring(
+            self, start: date, end: date, object_id: Optional[int] = None
+    ) -> List[Tuple[model.Document, Optional[str]]]:
+        """Documents whose ``doc_date_end`` falls in ``[start, end]``, with their object name.
+
+        A single range query on the ``doc_date_end`` index (or ``(object_id, doc_date_end)``
+        when filtered by object), ordered by expiry date.
+        """
+        query = (
+            self._session.query(model.Document, model.Object.name)
+            .outerjoin(model.Object, model.Document.object_id == model.Object.object_id)
+            .filter(model.Document.doc_date_end >= start, model.Document.doc_date_end <= end)
+        )
+        if object_id is not None:
+            query = query.filter(model.Document.object_id == object_id)
+        return query.order_by(model.Document.doc_date_end, model.Document.document_id).all()
+
     def get_document(self, document_id: int) -> Optional[model.Document]:
         return (
             self._session.query(model.Document)
@@ -467,6 +628,10 @@ class DocumentService:
         document = self.get_document(document_id)
         if not document:
             return False
+        # в существующих БД внешний ключ UPLOAD создан без ON DELETE CASCADE
+        self._session.query(model.Upload).filter(model.Upload.document_id == document_id).delete(
+            synchronize_session=False
+        )
         self._session.delete(document)
         self._session.commit()
         return True
@@ -479,15 +644,7 @@ class MaterialService:
         self._session = session
 
     def create_material(self, material_in: schema.MaterialCreate) -> model.Material:
-        material = model.Material(
-            name=material_in.name,
-            doc_id=material_in.doc_id,
-            okpd=material_in.okpd,
-            amount=material_in.amount,
-            uom=material_in.uom,
-            to_be_certified=material_in.to_be_certified,
-            certificate=material_in.certificate,
-        )
+        material = _new_material(material_in, material_in.doc_id)
         self._session.add(material)
         self._session.commit()
         self._session.refresh(material)
@@ -496,6 +653,33 @@ class MaterialService:
     def list_materials(self) -> List[model.Material]:
         return self._session.query(model.Material).all()
 
+    def list_materials_by_document(self, document_id: int) -> List[model.Material]:
+        return (
+            self._session.query(model.Material)
+            .filter(model.Material.doc_id == document_id)
+            .order_by(model.Material.material_id)
+            .all()
+        )
+
+    def totals_by_object(self, object_id: int) -> List[Tuple[str, Optional[str], float, int]]:
+        """Sum material amounts of an object per name and canonical unit in one GROUP BY query.
+
+        Returns ``(name, uom, amount, materials)`` rows ordered by name.
+        """
+        return (
+            self._session.query(
+                model.Material.name,
+                model.Material.uom_canonical,
+                func.coalesce(func.sum(model.Material.amount_canonical), 0.0),
+                func.count(model.Material.material_id),
+            )
+            .join(model.Document, model.Material.doc_id == model.Document.document_id)
+            .filter(model.Document.object_id == object_id)
+            .group_by(model.Material.name, model.Material.uom_canonical)
+            .order_by(model.Material.name, model.Material.uom_canonical)
+            .all()
+        )
+
     def get_material(self, material_id: int) -> Optional[model.Material]:
         return (
             self._session.query(model.Material)
@@ -524,6 +708,8 @@ class MaterialService:
             material.to_be_certified = material_in.to_be_certified
         if material_in.certificate is not None:
             material.certificate = material_in.certificate
+        if material_in.amount is not None or material_in.uom is not None:
+            material.amount_canonical, material.uom_canonical = to_canonical(material.amount, material.uom)
         self._session.add(material)
         self._session.commit()
         self._session.refresh(material)
@@ -536,3 +722,47 @@ class MaterialService:
         self._session.delete(material)
         self._session.commit()
         return True
+
+
+class UploadService:
+    """Index of processed uploads by content hash, used to deduplicate re-uploads."""
+
+    def __init__(self, session: Session) -> None:
+        self._session = session
+
+    def find_upload(
+            self, kind: schema.UploadKindEnum, scope_id: int, content_hash: str
+    ) -> Optional[model.Upload]:
+        return (
+            self._session.query(model.Upload)
+            .filter(
+                model.Upload.kind == model.UploadKindEnum(kind.value),
+                model.Upload.scope_id == scope_id,
+                model.Upload.content_hash == content_hash,
+            )
+            .first()
+        )
+
+    @staticmethod
+    def new_upload(
+            kind: schema.UploadKindEnum, scope_id: int, content_hash: str, *, size: Optional[int] = None
+    ) -> model.Upload:
+        """Build an index row to be committed together with the check or document it produced."""
+        return model.Upload(
+            kind=model.UploadKindEnum(kind.value),
+            scope_id=scope_id,
+            content_hash=content_hash,
+            size=size,
+        )
+
+    def delete_upload(self, upload_id: int) -> bool:
+        upload = (
+            self._session.query(model.Upload)
+            .filter(model.Upload.upload_id == upload_id)
+            .first()
+        )
+        if not upload:
+            return False
+        self._session.delete(upload)
+        self._session.commit()
+        return True
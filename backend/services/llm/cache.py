@@ -0,0 +1,159 @@
+"""Дисковый кэш ответов LLM (SQLite) с вытеснением по TTL и суммарному размеру."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import config
+from services.others.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(payload: Any, prompt_version: Any, model_name: Optional[str]) -> str:
+    """
+    Ключ кэша: sha256 от канонического JSON (входные данные, версия промпта, модель).
+    """
+    raw = json.dumps(
+        {"payload": payload, "prompt_version": prompt_version, "model": model_name or ""},
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResultCache:
+    """
+    Кэш сериализованных ответов LLM.
+
+    Записи старше ttl_seconds считаются промахом и удаляются; при превышении max_bytes
+    вытесняются записи, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_bytes: int) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at ON llm_cache (accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(now)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+
+    def _evict(self, now: float) -> None:
+        expired = self._conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        self.evictions += max(expired, 0)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at"):
+            if total - freed <= self.max_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[LLMResultCache] = None
+
+
+def get_default_cache() -> Optional[LLMResultCache]:
+    """
+    Кэш по настройкам из config.py; None, если LLM_CACHE_PATH пуст (кэш выключен).
+    """
+    global _default_cache
+    if _default_cache is None and config.LLM_CACHE_PATH:
+        try:
+            _default_cache = LLMResultCache(
+                config.LLM_CACHE_PATH, config.LLM_CACHE_TTL_SECONDS, config.LLM_CACHE_MAX_BYTES
+            )
+        except sqlite3.Error as e:
+            logger.error("Не удалось открыть кэш LLM %s: %s", config.LLM_CACHE_PATH, e)
+            return None
+    return _default_cache
+
+
+def _collect_cache():
+    if _default_cache is None:
+        return
+    stats = _default_cache.stats()
+    for key in ("hits", "misses", "hit_ratio", "evictions", "entries", "bytes"):
+        yield f"llm_cache_{key}", f"LLM result cache {key.replace('_', ' ')}.", [({}, stats[key])]
+
+
+REGISTRY.add_collector(_collect_cache)
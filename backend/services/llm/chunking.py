@@ -0,0 +1,82 @@
+"""Нарезка расшифровки на окна, ограниченные по числу токенов, и склейка ответов LLM по окнам."""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from services.llm.schema import AnswerStruct, Issue
+
+# Грубая оценка без токенизатора: для русского текста у BPE-моделей выходит 2.5-4 символа на токен,
+# берём нижнюю границу, чтобы окно гарантированно влезло в контекст.
+CHARS_PER_TOKEN = 2.5
+
+
+def estimate_tokens(text: str, chars_per_token: float = CHARS_PER_TOKEN) -> int:
+    return int(len(text) / chars_per_token) + 1
+
+
+class PhraseWindow(NamedTuple):
+    """Окно фраз [start, end) в глобальной нумерации расшифровки."""
+    start: int
+    end: int
+
+
+def split_phrase_windows(
+        lines: Sequence[str],
+        max_tokens: int,
+        overlap: int = 2,
+        chars_per_token: float = CHARS_PER_TOKEN
+) -> List[PhraseWindow]:
+    """
+    Делит строки расшифровки на окна не длиннее max_tokens (оценочно).
+
+    Соседние окна перекрываются на overlap фраз, чтобы нарушение, описанное на стыке, не потерялось.
+    Фраза длиннее max_tokens попадает в окно одна.
+    """
+    costs = [estimate_tokens(line, chars_per_token) for line in lines]
+    windows: List[PhraseWindow] = []
+    start = 0
+    while start < len(lines):
+        end, used = start, 0
+        while end < len(lines) and (end == start or used + costs[end] <= max_tokens):
+            used += costs[end]
+            end += 1
+        windows.append(PhraseWindow(start, end))
+        if end >= len(lines):
+            break
+        # перекрытие не должно откатывать начало назад дальше текущего окна
+        start = max(start + 1, end - overlap)
+    return windows
+
+
+def merge_window_answers(
+        windows: Sequence[PhraseWindow],
+        answers: Iterable[Optional[AnswerStruct]]
+) -> Optional[AnswerStruct]:
+    """
+    Переводит локальные индексы фраз в глобальные и объединяет нарушения всех окон.
+
+    В одной фразе может быть несколько нарушений - они сохраняются все. Фразу из зоны перекрытия
+    описывают оба соседних окна, поэтому её нарушения берутся только из первого окна, которое
+    на неё указало. Индексы вне окна отбрасываются. Окна без ответа (ошибка LLM) пропускаются;
+    если ответа нет ни у одного окна - None.
+    """
+    merged: Dict[int, List[Issue]] = {}
+    owners: Dict[int, int] = {}
+    answered = False
+    for number, (window, answer) in enumerate(zip(windows, answers)):
+        if answer is None:
+            continue
+        answered = True
+        for issue in answer.issues:
+            if not 0 <= issue.idx < window.end - window.start:
+                continue
+            global_idx = window.start + issue.idx
+            if owners.setdefault(global_idx, number) != number:
+                continue
+            issues = merged.setdefault(global_idx, [])
+            if all(issue.description != known.description for known in issues):
+                issues.append(Issue(idx=global_idx, description=issue.description))
+    if not answered:
+        return None
+    return AnswerStruct(issues=[issue for idx in sorted(merged) for issue in merged[idx]])
@@ -22,3 +22,20 @@ class Document(BaseModel):
     # executor_signatory: str = Field(..., description="подрядчик/получатель/кладовщик")
     # position_type: Literal["work", "material"] = Field(..., description="Тип позиции")
     item_list: List[ItemsList] = Field(..., description="Список элементов")
+
+
+class Issue(BaseModel):
+    idx: int = Field(
+        description="Индекс фразы из расшифровки",
+        examples=[1, 7]
+    )
+    description: str = Field(
+        description="Описание выявленного нарушения",
+        examples=["Отсутствие крепежных болтов поперечных балок"]
+    )
+
+
+class AnswerStruct(BaseModel):
+    issues: List[Issue] = Field(
+        description="Список выявленных нарушений с описанием"
+    )
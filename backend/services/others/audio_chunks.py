@@ -0,0 +1,205 @@
+"""Нарезка 16 кГц s16le PCM на перекрывающиеся окна по паузам и склейка расшифровок окон."""
+
+from __future__ import annotations
+
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # s16le
+
+
+class AudioWindow(NamedTuple):
+    """
+    Окно аудио в сэмплах: [start, end) отправляется на транскрибацию,
+    [keep_start, keep_end) - часть, за фразы из которой отвечает это окно.
+    """
+    start: int
+    end: int
+    keep_start: int
+    keep_end: int
+
+    def pcm(self, audio_bytes: bytes) -> bytes:
+        return audio_bytes[self.start * SAMPLE_WIDTH:self.end * SAMPLE_WIDTH]
+
+
+def frame_energy(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    """
+    RMS-энергия по кадрам длиной frame_len сэмплов (хвост короче кадра отбрасывается).
+    """
+    n_frames = len(samples) // frame_len
+    frames = samples[:n_frames * frame_len].astype(np.float32).reshape(n_frames, frame_len)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def _search_frames(last_cut: int, window: int, frame_len: int, search_frames: int) -> Tuple[int, int]:
+    """
+    Диапазон кадров [lo, target], в котором ищется следующая граница окна.
+    """
+    target = (last_cut + window) // frame_len
+    return max(last_cut // frame_len + 1, target - search_frames), target
+
+
+def _quiet_cut(energy: np.ndarray, lo: int, frame_len: int) -> int:
+    # режем по середине самого тихого кадра
+    return (lo + int(np.argmin(energy))) * frame_len + frame_len // 2
+
+
+def split_on_silence(
+        audio_bytes: bytes,
+        sample_rate: int = SAMPLE_RATE,
+        window_s: float = 120.0,
+        overlap_s: float = 2.0,
+        search_s: float = 15.0,
+        frame_ms: float = 30.0
+) -> List[AudioWindow]:
+    """
+    Делит запись на окна примерно по window_s секунд.
+
+    Границу окна ищем в последних search_s секундах перед целевой точкой - кадр с минимальной энергией,
+    чтобы не резать фразу посередине. Соседние окна перекрываются на overlap_s секунд с каждой стороны.
+    """
+    samples = np.frombuffer(audio_bytes[:len(audio_bytes) - len(audio_bytes) % SAMPLE_WIDTH], dtype="<i2")
+    total = len(samples)
+    window = int(window_s * sample_rate)
+    if total <= window + int(search_s * sample_rate):
+        return [AudioWindow(0, total, 0, total)]
+
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    energy = frame_energy(samples, frame_len)
+    search_frames = max(1, int(search_s * sample_rate) // frame_len)
+    overlap = int(overlap_s * sample_rate)
+
+    cuts = [0]
+    while total - cuts[-1] > window + search_frames * frame_len:
+        lo, target = _search_frames(cuts[-1], window, frame_len, search_frames)
+        cuts.append(_quiet_cut(energy[lo:target + 1], lo, frame_len))
+    cuts.append(total)
+
+    return [
+        AudioWindow(max(0, keep_start - overlap), min(total, keep_end + overlap), keep_start, keep_end)
+        for keep_start, keep_end in zip(cuts[:-1], cuts[1:])
+    ]
+
+
+class StreamingSplitter:
+    """
+    Потоковый вариант split_on_silence: PCM подаётся кусками по мере извлечения,
+    окно отдаётся, как только за ним накоплено достаточно аудио. Границы окон те же,
+    что дал бы split_on_silence на всей записи; в памяти держится только ещё не отданный хвост.
+    """
+
+    def __init__(
+            self,
+            sample_rate: int = SAMPLE_RATE,
+            window_s: float = 120.0,
+            overlap_s: float = 2.0,
+            search_s: float = 15.0,
+            frame_ms: float = 30.0
+    ) -> None:
+        self.window = int(window_s * sample_rate)
+        self.search = int(search_s * sample_rate)
+        self.frame_len = max(1, int(sample_rate * frame_ms / 1000))
+        self.search_frames = max(1, self.search // self.frame_len)
+        self.overlap = int(overlap_s * sample_rate)
+        self.cuts = [0]
+        self.emitted = 0
+        self._buffer = bytearray()
+        self._offset = 0  # сколько сэмплов от начала записи уже выброшено из буфера
+        self._pending = b""
+
+    @property
+    def total(self) -> int:
+        return self._offset + len(self._buffer) // SAMPLE_WIDTH
+
+    def _pcm(self, start: int, end: int) -> bytes:
+        return bytes(self._buffer[(start - self._offset) * SAMPLE_WIDTH:(end - self._offset) * SAMPLE_WIDTH])
+
+    def feed(self, chunk: bytes) -> List[Tuple[AudioWindow, bytes]]:
+        """
+        Добавляет кусок PCM и возвращает окна (с их PCM), которые уже можно транскрибировать.
+        """
+        data = self._pending + chunk
+        cut = len(data) - len(data) % SAMPLE_WIDTH
+        self._buffer += data[:cut]
+        self._pending = data[cut:]
+        total = self.total
+        # пока записи не больше одного окна с запасом на поиск, split_on_silence её не режет
+        if total > self.window + self.search:
+            while total - self.cuts[-1] > self.window + self.search_frames * self.frame_len:
+                lo, target = _search_frames(self.cuts[-1], self.window, self.frame_len, self.search_frames)
+                samples = np.frombuffer(self._pcm(lo * self.frame_len, (target + 1) * self.frame_len), dtype="<i2")
+                self.cuts.append(_quiet_cut(frame_energy(samples, self.frame_len), lo, self.frame_len))
+        return self._ready(final=False)
+
+    def finish(self) -> List[Tuple[AudioWindow, bytes]]:
+        """
+        Запись закончилась: возвращает оставшиеся окна.
+        """
+        total = self.total
+        if len(self.cuts) == 1 and total <= self.window + self.search:
+            self.emitted = 1
+            return [(AudioWindow(0, total, 0, total), self._pcm(0, total))]
+        self.cuts.append(total)
+        return self._ready(final=True)
+
+    def _ready(self, final: bool) -> List[Tuple[AudioWindow, bytes]]:
+        total = self.total
+        ready = []
+        while self.emitted + 1 < len(self.cuts):
+            keep_start, keep_end = self.cuts[self.emitted], self.cuts[self.emitted + 1]
+            end = keep_end + self.overlap
+            if final:
+                end = min(total, end)
+            elif end > total:
+                break
+            window = AudioWindow(max(0, keep_start - self.overlap), end, keep_start, keep_end)
+            ready.append((window, self._pcm(window.start, window.end)))
+            self.emitted += 1
+            # начало следующего окна - дальше в буфере ничего не понадобится
+            drop = max(0, keep_end - self.overlap) - self._offset
+            if drop > 0:
+                del self._buffer[:drop * SAMPLE_WIDTH]
+                self._offset += drop
+        return ready
+
+
+def _same_phrase(a: Dict, b: Dict) -> bool:
+    content_a = {k: v for k, v in a.items() if k not in ("start_time", "end_time")}
+    content_b = {k: v for k, v in b.items() if k not in ("start_time", "end_time")}
+    return content_a == content_b and a["start_time"] < b["end_time"] and b["start_time"] < a["end_time"]
+
+
+def merge_phrases(
+        windows: Sequence[AudioWindow],
+        results: Sequence[List[Dict]],
+        sample_rate: int = SAMPLE_RATE
+) -> List[Dict]:
+    """
+    Склеивает расшифровки окон в одну, сохраняя формат фраз сервиса транскрибации.
+
+    Время фраз сдвигается на начало окна. Фраза из зоны перекрытия остаётся только у того окна,
+    которому принадлежит её середина; совпадающие пересекающиеся фразы на стыке схлопываются.
+    """
+    merged: List[Dict] = []
+    for window, phrases in zip(windows, results):
+        offset = window.start / sample_rate
+        keep_start = window.keep_start / sample_rate
+        keep_end = window.keep_end / sample_rate
+        for phrase in phrases or []:
+            shifted = dict(phrase)
+            shifted["start_time"] = float(phrase["start_time"]) + offset
+            shifted["end_time"] = float(phrase["end_time"]) + offset
+            middle = (shifted["start_time"] + shifted["end_time"]) / 2
+            if not keep_start <= middle < keep_end and not (window.keep_end == window.end and middle >= keep_end):
+                continue
+            merged.append(shifted)
+    merged.sort(key=lambda p: p["start_time"])
+
+    deduped: List[Dict] = []
+    for phrase in merged:
+        if deduped and _same_phrase(deduped[-1], phrase):
+            continue
+        deduped.append(phrase)
+    return deduped
@@ -0,0 +1,185 @@
+"""Извлечение аудиодорожки из видео в 16 кГц s16le PCM: целиком или потоково по кускам."""
+
+from __future__ import annotations
+
+import asyncio
+import subprocess
+import threading
+from typing import AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+
+from services.others.metrics import in_context, record_subprocess
+
+# loudnorm - однопроходная EBU R128, самый медленный фильтр цепочки;
+# dynaudnorm - динамическая нормализация, заметно дешевле и тоже работает потоково;
+# peak/rms - постоянное усиление numpy по пику/среднеквадратичному уровню (нужна вся запись)
+FFMPEG_FILTERS = {
+    "loudnorm": "loudnorm",
+    "dynaudnorm": "dynaudnorm=f=250:g=15",
+}
+NUMPY_MODES = ("peak", "rms")
+NORMALIZE_MODES = tuple(FFMPEG_FILTERS) + NUMPY_MODES
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def resolve_normalize(normalize) -> Optional[str]:
+    """
+    True - loudnorm (прежнее поведение), False/None - без нормализации, иначе имя режима.
+    """
+    if normalize is True:
+        return "loudnorm"
+    if not normalize:
+        return None
+    if normalize not in NORMALIZE_MODES:
+        raise ValueError(f"Неизвестный режим нормализации: {normalize}")
+    return normalize
+
+
+def audio_command(video_input: Optional[bytes | str], mode: Optional[str]) -> List[str]:
+    is_bytes = isinstance(video_input, bytes)
+    command = [
+        "ffmpeg",
+        "-v", "error",
+        "-i", "pipe:0" if is_bytes else video_input,
+        "-vn",
+        "-f", "s16le",
+        "-acodec", "pcm_s16le",
+        "-ac", "1",
+        "-ar", "16000",
+    ]
+    if mode in FFMPEG_FILTERS:
+        command += ["-af", FFMPEG_FILTERS[mode]]
+    command += [
+        "-y",
+        "-"
+    ]
+    return command
+
+
+def apply_gain(audio_bytes: bytes, mode: str, target_peak: float = 0.9, target_rms: float = 0.1) -> bytes:
+    """
+    Постоянное усиление всей записи до целевого пика или RMS (доли полной шкалы), с ограничением клиппинга.
+    """
+    samples = np.frombuffer(audio_bytes, dtype="<i2").astype(np.float32)
+    if not len(samples):
+        return audio_bytes
+    full_scale = 32767.0
+    if mode == "peak":
+        level = float(np.abs(samples).max()) / full_scale
+        target = target_peak
+    elif mode == "rms":
+        level = float(np.sqrt(np.mean(samples * samples))) / full_scale
+        target = target_rms
+    else:
+        raise ValueError(f"Неизвестный режим усиления: {mode}")
+    if level <= 0:
+        return audio_bytes
+    gained = np.clip(samples * (target / level), -32768, 32767)
+    return gained.astype("<i2").tobytes()
+
+
+def iter_audio_chunks(
+        video_input: Optional[bytes | str],
+        normalize="dynaudnorm",
+        chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Отдаёт PCM кусками по мере того, как ffmpeg их выдаёт. Длина каждого куска кратна 2.
+    Поддерживаются только потоковые режимы нормализации ffmpeg (loudnorm, dynaudnorm) или без неё.
+    """
+    mode = resolve_normalize(normalize)
+    if mode in NUMPY_MODES:
+        raise ValueError(f"Режим {mode} требует всю запись и не поддерживается потоково")
+    is_bytes = isinstance(video_input, bytes)
+    process = subprocess.Popen(
+        audio_command(video_input, mode),
+        stdin=subprocess.PIPE if is_bytes else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stderr_chunks: List[bytes] = []
+    # stdin и stderr обслуживаются отдельными потоками, иначе ffmpeg может встать на полном буфере
+    threads = [threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)]
+    if is_bytes:
+        def feed() -> None:
+            try:
+                process.stdin.write(video_input)
+            except (BrokenPipeError, ValueError):
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+        threads.append(threading.Thread(target=feed, daemon=True))
+    for thread in threads:
+        thread.start()
+    carry = b""
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            chunk = carry + chunk
+            cut = len(chunk) - len(chunk) % 2
+            carry = chunk[cut:]
+            if cut:
+                yield chunk[:cut]
+        returncode = process.wait()
+        for thread in threads:
+            thread.join()
+        record_subprocess("ffmpeg", returncode)
+        if returncode != 0:
+            raise RuntimeError(f"FFmpeg error: {b''.join(stderr_chunks).decode(errors='replace')}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+async def astream_audio(
+        video_input: Optional[bytes | str],
+        normalize="dynaudnorm",
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        max_queued: int = 64
+) -> AsyncIterator[bytes]:
+    """
+    Асинхронная обёртка над iter_audio_chunks: ffmpeg читается в отдельном потоке,
+    очередь ограничена max_queued кусками (если потребитель отстаёт, чтение приостанавливается).
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+    stop = threading.Event()
+    done = object()
+
+    def produce() -> None:
+        try:
+            for chunk in iter_audio_chunks(video_input, normalize, chunk_size):
+                if stop.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+            item = done
+        except BaseException as e:
+            item = e
+        if not stop.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    # контекст (текущая стадия трассы) переносится в поток, чтобы код выхода ffmpeg попал в трассу
+    producer = loop.run_in_executor(None, in_context(produce))
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # освобождаем производителя, если он ждёт места в очереди
+        while not queue.empty():
+            queue.get_nowait()
+        await producer
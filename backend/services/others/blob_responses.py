@@ -0,0 +1,49 @@
+"""HTTP-ответы с файлами хранилища блобов.
+
+Файлы отдаются FileResponse прямо с диска кусками (без чтения в память и base64), с поддержкой
+Range. Ключи контентно-адресуемые, поэтому содержимое по ключу не меняется: ETag строгий
+(sha256 из ключа), кэш неизменяемый, If-None-Match даёт 304 без чтения файла.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import FileResponse
+
+from services.others.blob_store import CONTENT_TYPES, get_blob_store
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Совпадает ли If-None-Match с etag (для If-None-Match допускается слабое сравнение).
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in tags
+
+
+def immutable_file_response(request: Request, path: str, etag: str, media_type: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # FileResponse сам отвечает на Range (206/416) и сверяет If-Range с этим ETag
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def blob_response(request: Request, key: Optional[str]) -> Response:
+    """
+    Оригинал изображения по ключу блоба; 404, если ключа нет или файл не найден.
+    """
+    store = get_blob_store()
+    if not store.exists(key):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    digest, ext = key.split(".", 1)
+    return immutable_file_response(request, store.path_for(key), f'"{digest}"', CONTENT_TYPES[ext])
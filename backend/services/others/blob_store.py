@@ -0,0 +1,163 @@
+"""Локальное контентно-адресуемое хранилище изображений (кадры нарушений, фото документов).
+
+Ключ блоба - "<sha256 содержимого>.<расширение>", файл лежит в <root>/<ab>/<cd>/<ключ>.
+В БД и JSON-ответах хранится только ключ. Производные (миниатюры, превью) лежат рядом
+с оригиналом как "<sha256>.<вариант>.webp".
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+import cv2
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+KEY_RE = re.compile(r"^[0-9a-f]{64}\.(jpg|png|webp)$")
+VARIANT_RE = re.compile(r"^[a-z]+-\d+$")
+
+FORMATS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+
+class BlobStore:
+    """
+    Хранилище блобов на диске: атомарная запись, дедупликация по хэшу,
+    кодирование кадров в JPEG/WebP на пуле потоков (cv2.imencode отпускает GIL).
+    """
+
+    def __init__(self, root: str, workers: Optional[int] = None) -> None:
+        self.root = os.path.abspath(root)
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # вызываются с ключом после каждой записи блоба (например, очередь производных)
+        self._listeners: List[Callable[[str], None]] = []
+        os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="blob-store")
+        return self._pool
+
+    @staticmethod
+    def is_valid_key(key: Optional[str]) -> bool:
+        return bool(key) and KEY_RE.match(key) is not None
+
+    def path_for(self, key: str) -> str:
+        if not self.is_valid_key(key):
+            raise ValueError(f"Некорректный ключ блоба: {key!r}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return self.is_valid_key(key) and os.path.exists(self.path_for(key))
+
+    def derivative_path(self, key: str, variant: str) -> str:
+        """
+        Путь производной рядом с оригиналом: <root>/<ab>/<cd>/<sha256>.<variant>.webp.
+        """
+        if not VARIANT_RE.match(variant):
+            raise ValueError(f"Некорректный вариант производной: {variant!r}")
+        path = self.path_for(key)
+        return f"{path.rsplit('.', 1)[0]}.{variant}.webp"
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, key: str) -> None:
+        for listener in self._listeners:
+            try:
+                listener(key)
+            except Exception as e:
+                logger.error("Ошибка обработчика записи блоба %s: %s", key, e)
+
+    @staticmethod
+    def write_atomic(path: str, data: bytes) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # пишем во временный файл в той же директории и атомарно переименовываем:
+        # читатели никогда не видят недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put_bytes(self, data: bytes, ext: str) -> str:
+        """
+        Сохраняет уже закодированное изображение и возвращает его ключ.
+        Повторная запись того же содержимого ничего не пишет.
+        """
+        key = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            self.write_atomic(path, data)
+        self._notify(key)
+        return key
+
+    @staticmethod
+    def encode_frame(frame: np.ndarray, fmt: str = "jpg", quality: int = 90) -> bytes:
+        if fmt not in FORMATS:
+            raise ValueError(f"Неподдерживаемый формат: {fmt}")
+        ext, quality_flag = FORMATS[fmt]
+        ok, buffer = cv2.imencode(ext, frame, [quality_flag, quality])
+        if not ok:
+            raise RuntimeError(f"Не удалось закодировать кадр в {fmt}")
+        return buffer.tobytes()
+
+    def put_frame(self, frame: np.ndarray, fmt: str = "jpg", quality: int = 90) -> str:
+        return self.put_bytes(self.encode_frame(frame, fmt, quality), fmt)
+
+    async def put_frames(
+            self, frames: Iterable[Optional[np.ndarray]], fmt: str = "jpg", quality: int = 90
+    ) -> List[Optional[str]]:
+        """
+        Кодирует и сохраняет кадры параллельно; для None возвращает None.
+        """
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(self.pool, self.put_frame, frame, fmt, quality) if frame is not None else None
+            for frame in frames
+        ]
+        return [await future if future is not None else None for future in futures]
+
+    def read(self, key: str) -> bytes:
+        with open(self.path_for(key), "rb") as f:
+            return f.read()
+
+
+_default_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """
+    Хранилище по настройкам из config.py.
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = BlobStore(config.BLOB_STORE_PATH, config.BLOB_STORE_WORKERS or None)
+    return _default_store
@@ -0,0 +1,207 @@
+"""Производные изображений для списков в мобильном приложении: миниатюры и превью в WebP.
+
+Пул потоков получает ключ каждого записанного блоба (слушатель BlobStore) и рядом с оригиналом
+пишет уменьшенные копии фиксированного размера. Запрос производной никогда не декодирует
+оригинал: готовая производная отдаётся с диска, иначе отдаётся заглушка, а генерация ставится
+в очередь.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
+
+from fastapi import HTTPException, Request, Response, status
+from PIL import Image, ImageOps
+
+import config
+from services.others.blob_responses import immutable_file_response
+from services.others.blob_store import BlobStore, get_blob_store
+from services.others.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+READY = "ready"
+PENDING = "pending"
+FAILED = "failed"
+MISSING = "missing"
+
+DERIVATIVES_GENERATED = REGISTRY.counter(
+    "derivatives_generated_total", "Image derivatives written, by variant and outcome.", ("variant", "outcome")
+)
+
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 {size} {size}">'
+    '<rect width="100%" height="100%" fill="#e5e7eb"/></svg>'
+)
+
+
+def variant_sizes() -> Dict[str, int]:
+    """
+    Варианты по настройкам: имя варианта -> длинная сторона в пикселях.
+    """
+    return {"thumb": config.THUMBNAIL_SIZE, "preview": config.PREVIEW_SIZE}
+
+
+def variant_name(variant: str, size: int) -> str:
+    # размер входит в имя файла: смена настроек даёт новые файлы, а не перезапись старых
+    return f"{variant}-{size}"
+
+
+def placeholder(size: int) -> bytes:
+    return PLACEHOLDER_SVG.format(size=size).encode("utf-8")
+
+
+def render_derivative(path: str, size: int, quality: int = 80) -> bytes:
+    """
+    Уменьшенная копия изображения в WebP с длинной стороной не больше size.
+    JPEG декодируется сразу в уменьшенном масштабе (draft), без полного разрешения.
+    """
+    with Image.open(path) as image:
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGB")
+        image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+class DerivativeWorker:
+    """
+    Фоновый генератор производных: каждый ключ обрабатывается одной задачей на все варианты,
+    повторная постановка того же ключа до завершения игнорируется.
+    """
+
+    def __init__(
+            self,
+            store: BlobStore,
+            sizes: Dict[str, int],
+            workers: int = 2,
+            quality: int = 80
+    ) -> None:
+        self.store = store
+        self.sizes = sizes
+        self.quality = quality
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="derivatives")
+        self._lock = threading.Lock()
+        self._pending: Set[str] = set()
+        self._failed: Set[str] = set()
+
+    def path_for(self, key: str, variant: str) -> str:
+        return self.store.derivative_path(key, variant_name(variant, self.sizes[variant]))
+
+    def submit(self, key: str) -> bool:
+        """
+        Ставит генерацию производных ключа в очередь; False - уже в очереди, готово или не получилось.
+        """
+        if not self.store.is_valid_key(key) or self._all_ready(key):
+            return False
+        with self._lock:
+            if key in self._pending or key in self._failed:
+                return False
+            self._pending.add(key)
+        self._pool.submit(self._generate, key)
+        return True
+
+    def status(self, key: str, variant: str) -> str:
+        if os.path.exists(self.path_for(key, variant)):
+            return READY
+        with self._lock:
+            if key in self._pending:
+                return PENDING
+            if key in self._failed:
+                return FAILED
+        return MISSING
+
+    def _all_ready(self, key: str) -> bool:
+        return all(os.path.exists(self.path_for(key, variant)) for variant in self.sizes)
+
+    def _generate(self, key: str) -> None:
+        failed = False
+        try:
+            source = self.store.path_for(key)
+            for variant, size in self.sizes.items():
+                path = self.path_for(key, variant)
+                if os.path.exists(path):
+                    continue
+                try:
+                    self.store.write_atomic(path, render_derivative(source, size, self.quality))
+                    DERIVATIVES_GENERATED.inc(variant=variant, outcome="ok")
+                except Exception as e:
+                    failed = True
+                    DERIVATIVES_GENERATED.inc(variant=variant, outcome="failed")
+                    logger.error("Не удалось построить %s для %s: %s", variant, key, e)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+                if failed:
+                    self._failed.add(key)
+
+    def queue_size(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def derivative_response(request: Request, key: Optional[str], variant: str) -> Response:
+    """
+    Готовая производная (кэшируется навсегда: имя файла зависит от содержимого и размера) или
+    SVG-заглушка нужного размера, пока производная строится. 404 - у записи нет изображения.
+    """
+    worker = get_derivative_worker()
+    store = worker.store
+    if variant not in worker.sizes:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown variant {variant!r}")
+    if not store.exists(key):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    state = worker.status(key, variant)
+    if state == READY:
+        name = variant_name(variant, worker.sizes[variant])
+        response = immutable_file_response(
+            request, worker.path_for(key, variant), f'"{key.split(".")[0]}.{name}"', "image/webp"
+        )
+        response.headers["X-Derivative-Status"] = READY
+        return response
+    if state == MISSING:
+        # оригинал записан до запуска генератора или процесс перезапускался
+        worker.submit(key)
+        state = PENDING
+    return Response(
+        placeholder(worker.sizes[variant]),
+        media_type="image/svg+xml",
+        headers={"Cache-Control": "no-store", "X-Derivative-Status": state},
+    )
+
+
+_default_worker: Optional[DerivativeWorker] = None
+
+
+def get_derivative_worker() -> DerivativeWorker:
+    """
+    Генератор по настройкам из config.py, подписанный на записи общего хранилища блобов.
+    """
+    global _default_worker
+    if _default_worker is None:
+        store = get_blob_store()
+        _default_worker = DerivativeWorker(
+            store, variant_sizes(), config.DERIVATIVE_WORKERS, config.DERIVATIVE_QUALITY
+        )
+        store.add_listener(_default_worker.submit)
+    return _default_worker
+
+
+def _collect_derivatives():
+    if _default_worker is None:
+        return
+    yield "derivatives_pending", "Images waiting for derivative generation.", [({}, _default_worker.queue_size())]
+
+
+REGISTRY.add_collector(_collect_derivatives)
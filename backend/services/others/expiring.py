@@ -0,0 +1,151 @@
+"""Истекающие документы: снимок на EXPIRING_HORIZON_DAYS дней вперёд.
+
+Снимок строится одним диапазонным запросом по doc_date_end (раз в сутки - DailyJob) и отдаётся
+из памяти. Любая закоммиченная запись в DOCUMENT (сервис, пакетный импорт) сбрасывает снимок,
+следующий запрос строит его заново; запрос за пределами горизонта идёт в БД напрямую.
+Снимок свой у каждого процесса: записи другого процесса он увидит только после пересчёта.
+"""
+
+import logging
+import threading
+from datetime import date, timedelta
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import config
+from services.db import model, schema
+from services.db.db import SessionLocal
+from services.db.service import DocumentService
+from services.others.scheduler import DailyJob, parse_time
+
+logger = logging.getLogger(__name__)
+
+# метка в Session.info: в текущей транзакции менялись документы
+DOCUMENTS_CHANGED = "expiring_documents_changed"
+
+
+class ExpiringSnapshot(NamedTuple):
+    day: date
+    horizon_days: int
+    documents: List[schema.ExpiringDocument]
+
+
+_snapshot: Optional[ExpiringSnapshot] = None
+# растёт при каждом сбросе: снимок, начатый до записи, не сохраняется после неё
+_generation = 0
+_snapshot_lock = threading.Lock()
+_job: Optional[DailyJob] = None
+
+
+def query_expiring(
+        db: Session, days: int, object_id: Optional[int] = None, today: Optional[date] = None
+) -> List[schema.ExpiringDocument]:
+    today = today or date.today()
+    rows = DocumentService(db).list_expiring(today, today + timedelta(days=days), object_id)
+    return [
+        schema.ExpiringDocument.model_validate({
+            **schema.Document.model_validate(document).model_dump(),
+            "object_name": object_name,
+            "days_left": (document.doc_date_end - today).days,
+        })
+        for document, object_name in rows
+    ]
+
+
+def invalidate_expiring() -> None:
+    """
+    Сбрасывает снимок после изменения документов.
+    """
+    global _snapshot, _generation
+    with _snapshot_lock:
+        _snapshot = None
+        _generation += 1
+
+
+def _refresh(db: Session) -> ExpiringSnapshot:
+    global _snapshot
+    with _snapshot_lock:
+        generation = _generation
+    today = date.today()
+    snapshot = ExpiringSnapshot(
+        today, config.EXPIRING_HORIZON_DAYS, query_expiring(db, config.EXPIRING_HORIZON_DAYS, today=today)
+    )
+    with _snapshot_lock:
+        if generation == _generation:
+            _snapshot = snapshot
+    return snapshot
+
+
+def scan_expiring() -> ExpiringSnapshot:
+    """
+    Пересчитывает снимок истекающих документов по всем объектам.
+    """
+    db = SessionLocal()
+    try:
+        snapshot = _refresh(db)
+    finally:
+        db.close()
+    logger.info("Истекающих документов на %s дней: %s", snapshot.horizon_days, len(snapshot.documents))
+    return snapshot
+
+
+def get_expiring(db: Session, days: int, object_id: Optional[int] = None) -> List[schema.ExpiringDocument]:
+    """
+    Документы, истекающие в ближайшие days дней: из сегодняшнего снимка (при необходимости
+    он пересчитывается), а за пределами горизонта снимка - запросом в БД.
+    """
+    if days > config.EXPIRING_HORIZON_DAYS:
+        return query_expiring(db, days, object_id)
+    with _snapshot_lock:
+        snapshot = _snapshot
+    if snapshot is None or snapshot.day != date.today() or snapshot.horizon_days != config.EXPIRING_HORIZON_DAYS:
+        snapshot = _refresh(db)
+    return [
+        document for document in snapshot.documents
+        if document.days_left <= days and (object_id is None or document.object_id == object_id)
+    ]
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flushed_documents(session: Session, flush_context) -> None:
+    changed = (*session.new, *session.dirty, *session.deleted)
+    if any(isinstance(item, model.Document) for item in changed):
+        session.info[DOCUMENTS_CHANGED] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_documents(orm_execute_state) -> None:
+    # insert(model.Document) пакетного импорта и массовые update/delete идут мимо flush
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ is model.Document:
+        orm_execute_state.session.info[DOCUMENTS_CHANGED] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session: Session) -> None:
+    if session.info.pop(DOCUMENTS_CHANGED, False):
+        invalidate_expiring()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop(DOCUMENTS_CHANGED, None)
+
+
+def start_expiring_scan() -> DailyJob:
+    global _job
+    if _job is None:
+        _job = DailyJob("expiring-documents", scan_expiring, parse_time(config.EXPIRING_SCAN_AT))
+        _job.start()
+    return _job
+
+
+def stop_expiring_scan() -> None:
+    global _job
+    if _job is not None:
+        _job.stop()
+        _job = None
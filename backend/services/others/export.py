@@ -0,0 +1,147 @@
+"""Выгрузка документов и материалов объекта в CSV/XLSX потоком, с постоянным расходом памяти.
+
+Строки читаются из БД порциями (серверный курсор), CSV кодируется и отдаётся кусками по мере
+чтения, gzip при необходимости сжимает поток на лету. XLSX - zip-архив, его нельзя отдать
+раньше, чем он дописан: xlsxwriter в режиме constant_memory пишет строки во временный файл,
+и файл отдаётся после закрытия книги.
+"""
+
+import csv
+import io
+import os
+import tempfile
+import zlib
+from datetime import date
+from enum import Enum
+from typing import Any, Iterable, Iterator, List, Sequence
+
+import config
+from services.db.db import SessionLocal
+from services.db.service import DocumentService
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+XLSX_MAX_ROWS = 1048576
+
+EXPORT_COLUMNS = (
+    ("document_id", "ID документа"),
+    ("doc_type", "Вид документа"),
+    ("doc_number", "Номер документа"),
+    ("doc_date_start", "Дата начала"),
+    ("doc_date_end", "Дата окончания"),
+    ("doc_image_id", "Фото документа"),
+    ("material_id", "ID материала"),
+    ("name", "Наименование"),
+    ("okpd", "ОКПД2"),
+    ("amount", "Количество"),
+    ("uom", "Ед. изм."),
+    ("amount_canonical", "Количество (приведённое)"),
+    ("uom_canonical", "Ед. изм. (приведённая)"),
+    ("to_be_certified", "Подлежит сертификации"),
+    ("certificate", "Сертификат"),
+)
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _row_values(row: Sequence[Any]) -> List[Any]:
+    return [_cell(value) for value in row]
+
+
+def export_rows(object_id: int, yield_per: int = 0) -> Iterator[Sequence[Any]]:
+    """
+    Строки выгрузки объекта. Сессия своя: генератор живёт дольше запроса, а сессия из get_db
+    закрывается раньше, чем StreamingResponse начнёт отдавать тело.
+    """
+    db = SessionLocal()
+    try:
+        yield from DocumentService(db).iter_export_rows(object_id, yield_per or config.EXPORT_YIELD_PER)
+    finally:
+        db.close()
+
+
+def iter_csv(rows: Iterable[Sequence[Any]], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    CSV кусками около chunk_size байт; заголовок отдаётся сразу, до первой строки из БД.
+    Разделитель ";" и BOM - чтобы Excel с русской локалью открывал файл без мастера импорта.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";", lineterminator="\r\n")
+    writer.writerow([title for _, title in EXPORT_COLUMNS])
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        writer.writerow(_row_values(row))
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def require_xlsx() -> None:
+    """
+    RuntimeError, если xlsxwriter не установлен; проверяется до начала ответа.
+    """
+    try:
+        import xlsxwriter  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Для выгрузки в XLSX нужен пакет xlsxwriter") from e
+
+
+def iter_xlsx(rows: Iterable[Sequence[Any]], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    XLSX через xlsxwriter в режиме constant_memory: в памяти только текущая строка,
+    готовый файл читается с диска кусками и удаляется.
+    """
+    import xlsxwriter
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "tmpdir": os.path.dirname(path)})
+        bold = workbook.add_format({"bold": True})
+        sheet, index = None, XLSX_MAX_ROWS
+        for row in rows:
+            # лист вмещает XLSX_MAX_ROWS строк, дальше - следующий лист с тем же заголовком
+            if index >= XLSX_MAX_ROWS:
+                sheet = workbook.add_worksheet(f"Материалы {len(workbook.worksheets()) + 1}")
+                sheet.write_row(0, 0, [title for _, title in EXPORT_COLUMNS], bold)
+                index = 1
+            sheet.write_row(index, 0, _row_values(row))
+            index += 1
+        if sheet is None:
+            workbook.add_worksheet("Материалы 1").write_row(0, 0, [title for _, title in EXPORT_COLUMNS], bold)
+        workbook.close()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Сжимает поток в формат gzip на лету; пустые куски компрессора не отдаются.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,358 @@
+"""Оценка резкости кадров и параллельный выбор лучших кадров из сегментов видео."""
+
+from __future__ import annotations
+
+import heapq
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from services.others.metrics import record_subprocess
+
+METHODS = ("laplacian", "sobel", "tenengrad")
+
+# full - полное декодирование всех кадров; keyframes - только ключевые кадры;
+# stride - каждый N-й кадр; в двух последних ffmpeg сразу отдаёт уменьшенные серые кадры
+CANDIDATE_MODES = ("full", "keyframes", "stride")
+
+_PTS_TIME_RE = re.compile(r"pts_time:\s*(-?[0-9.]+)")
+
+ScoredFrame = Tuple[float, int, np.ndarray]
+
+
+def sharpness_score(gray: np.ndarray, method: str = "laplacian") -> float:
+    """
+    Оценка резкости кадра в оттенках серого (чем больше, тем резче).
+    """
+    if method == "laplacian":
+        return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    if method == "sobel":
+        return float(cv2.magnitude(grad_x, grad_y).var())
+    if method == "tenengrad":
+        return float((grad_x ** 2 + grad_y ** 2).mean())
+    raise ValueError(f"Неизвестный метод оценки резкости: {method}")
+
+
+def batch_sharpness_scores(grays: np.ndarray, method: str = "laplacian") -> np.ndarray:
+    """
+    Векторизованная оценка резкости пачки кадров одинакового размера (B, H, W).
+
+    Ядра те же, что у cv2.Laplacian/cv2.Sobel(ksize=3), края отражаются как BORDER_REFLECT_101,
+    поэтому результат совпадает с sharpness_score с точностью до float32.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод оценки резкости: {method}")
+    p = np.pad(grays.astype(np.float32, copy=False), ((0, 0), (1, 1), (1, 1)), mode="reflect")
+    center = p[:, 1:-1, 1:-1]
+    if method == "laplacian":
+        lap = p[:, :-2, 1:-1] + p[:, 2:, 1:-1] + p[:, 1:-1, :-2] + p[:, 1:-1, 2:] - 4 * center
+        return lap.var(axis=(1, 2), dtype=np.float64)
+    col = p[:, :-2, :] + 2 * p[:, 1:-1, :] + p[:, 2:, :]
+    row = p[:, :, :-2] + 2 * p[:, :, 1:-1] + p[:, :, 2:]
+    grad_x = col[:, :, 2:] - col[:, :, :-2]
+    grad_y = row[:, 2:, :] - row[:, :-2, :]
+    energy = grad_x ** 2 + grad_y ** 2
+    if method == "sobel":
+        return np.sqrt(energy).var(axis=(1, 2), dtype=np.float64)
+    return energy.mean(axis=(1, 2), dtype=np.float64)
+
+
+def to_score_gray(frame: np.ndarray, score_width: Optional[int]) -> np.ndarray:
+    """
+    Переводит BGR-кадр в оттенки серого и уменьшает до score_width по ширине.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if score_width and gray.shape[1] > score_width:
+        height = max(1, round(gray.shape[0] * score_width / gray.shape[1]))
+        gray = cv2.resize(gray, (score_width, height), interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def frame_count(video_path: str) -> int:
+    """
+    Количество кадров по метаданным контейнера (0, если неизвестно).
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
+
+
+def _push_top(heap: List[ScoredFrame], top_n: int, item: ScoredFrame) -> None:
+    # frame_idx уникален, поэтому до сравнения самих кадров в кортеже дело не доходит
+    if len(heap) < top_n:
+        heapq.heappush(heap, item)
+    elif item[0] > heap[0][0]:
+        heapq.heapreplace(heap, item)
+
+
+def select_sharp_frames(
+        video_path: str,
+        top_n: int = 1,
+        method: str = "laplacian",
+        stride: int = 1,
+        score_width: Optional[int] = 640,
+        start_frame: int = 0,
+        stop_frame: Optional[int] = None,
+        batch_size: int = 0
+) -> List[ScoredFrame]:
+    """
+    Потоково выбирает top_n самых резких кадров в диапазоне [start_frame, stop_frame).
+
+    В памяти держится не больше top_n кадров (min-heap по оценке резкости),
+    плюс при batch_size > 0 - пачка кадров, ожидающих векторизованной оценки.
+    Возвращает список (score, frame_idx, frame), отсортированный по убыванию score.
+    """
+    if top_n <= 0:
+        return []
+    stride = max(1, int(stride))
+    heap: List[ScoredFrame] = []
+    pending_frames: List[Tuple[int, np.ndarray]] = []
+    pending_grays: List[np.ndarray] = []
+
+    def flush() -> None:
+        scores = batch_sharpness_scores(np.stack(pending_grays), method)
+        for score, (idx, frame) in zip(scores.tolist(), pending_frames):
+            _push_top(heap, top_n, (score, idx, frame))
+        pending_frames.clear()
+        pending_grays.clear()
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_idx = start_frame - 1
+        while stop_frame is None or frame_idx + 1 < stop_frame:
+            if not cap.grab():
+                break
+            frame_idx += 1
+            if frame_idx % stride:
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            gray = to_score_gray(frame, score_width)
+            if batch_size > 0:
+                pending_frames.append((frame_idx, frame))
+                pending_grays.append(gray)
+                if len(pending_grays) >= batch_size:
+                    flush()
+            else:
+                _push_top(heap, top_n, (sharpness_score(gray, method), frame_idx, frame))
+        if pending_grays:
+            flush()
+    finally:
+        cap.release()
+    return sorted(heap, key=lambda x: x[0], reverse=True)
+
+
+def _score_size(video_path: str, score_width: int) -> Tuple[int, int, float]:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    finally:
+        cap.release()
+    if width <= 0 or height <= 0:
+        raise RuntimeError(f"Не удалось определить размер кадра: {video_path}")
+    out_width = min(score_width, width) // 2 * 2
+    out_height = max(2, round(height * out_width / width) // 2 * 2)
+    return out_width, out_height, fps
+
+
+def decode_candidates(
+        video_path: str,
+        mode: str = "keyframes",
+        stride: int = 10,
+        score_width: int = 320
+) -> List[Tuple[float, np.ndarray]]:
+    """
+    Декодирует кандидатов в уменьшенном сером виде силами ffmpeg: (время кадра, серый кадр).
+
+    keyframes - декодер пропускает все кадры, кроме ключевых (-skip_frame nokey);
+    stride - декодируются все кадры, но масштабируется и отдаётся только каждый stride-й.
+    Время берётся из фильтра showinfo, поэтому точно соответствует отданному кадру.
+    """
+    width, height, _ = _score_size(video_path, score_width)
+    filters = []
+    command = ["ffmpeg", "-v", "info", "-nostats"]
+    if mode == "keyframes":
+        command += ["-skip_frame", "nokey"]
+    elif mode == "stride":
+        filters.append(f"select=not(mod(n\\,{max(1, int(stride))}))")
+    else:
+        raise ValueError(f"Неизвестный режим выбора кандидатов: {mode}")
+    filters += [f"scale={width}:{height}:flags=area", "format=gray", "showinfo"]
+    command += [
+        "-i", video_path,
+        "-an",
+        "-vf", ",".join(filters),
+        "-vsync", "passthrough",
+        "-f", "rawvideo",
+        "-pix_fmt", "gray",
+        "-"
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    record_subprocess("ffmpeg", result.returncode)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg error for candidates of {video_path}: {result.stderr.decode(errors='replace')}")
+    timestamps = [
+        float(match.group(1))
+        for line in result.stderr.decode(errors="replace").splitlines()
+        if "Parsed_showinfo" in line and (match := _PTS_TIME_RE.search(line))
+    ]
+    frame_size = width * height
+    frames = np.frombuffer(result.stdout, dtype=np.uint8)
+    n_frames = min(len(timestamps), len(frames) // frame_size)
+    frames = frames[:n_frames * frame_size].reshape(n_frames, height, width)
+    return list(zip(timestamps[:n_frames], frames))
+
+
+def decode_frame_at(video_path: str, timestamp: float) -> Optional[np.ndarray]:
+    """
+    Полностью декодирует один кадр в исходном разрешении по времени (секунды).
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000.0)
+        ret, frame = cap.read()
+    finally:
+        cap.release()
+    return frame if ret else None
+
+
+def select_sharp_candidates(
+        video_path: str,
+        top_n: int = 1,
+        method: str = "laplacian",
+        mode: str = "keyframes",
+        stride: int = 10,
+        score_width: int = 320
+) -> List[ScoredFrame]:
+    """
+    Быстрый выбор: кандидаты ранжируются в низком разрешении пачкой,
+    в исходном разрешении декодируются только top_n победителей.
+    Формат результата как у select_sharp_frames; frame_idx пересчитан из времени по FPS.
+    """
+    if top_n <= 0:
+        return []
+    candidates = decode_candidates(video_path, mode, stride, score_width)
+    if not candidates:
+        return []
+    scores = batch_sharpness_scores(np.stack([gray for _, gray in candidates]), method)
+    _, _, fps = _score_size(video_path, score_width)
+    best = heapq.nlargest(top_n, zip(scores.tolist(), (ts for ts, _ in candidates)))
+    result = []
+    for score, timestamp in best:
+        frame = decode_frame_at(video_path, timestamp)
+        if frame is not None:
+            result.append((score, round(timestamp * fps) if fps else 0, frame))
+    return result
+
+
+class FrameQualityStage:
+    """
+    Параллельная оценка резкости: сегменты и их куски декодируются на пуле потоков.
+
+    OpenCV отпускает GIL на декодировании и фильтрах, поэтому потоков достаточно,
+    чтобы загрузить все ядра. Длинные сегменты режутся на куски по chunk_frames кадров,
+    каждый кусок выбирает свой top_n, затем результаты сливаются.
+    """
+
+    def __init__(
+            self,
+            workers: Optional[int] = None,
+            chunk_frames: int = 300,
+            top_n: int = 1,
+            method: str = "laplacian",
+            stride: int = 1,
+            score_width: Optional[int] = 640,
+            batch_size: int = 0,
+            candidate_mode: str = "full"
+    ) -> None:
+        if method not in METHODS:
+            raise ValueError(f"Неизвестный метод оценки резкости: {method}")
+        if candidate_mode not in CANDIDATE_MODES:
+            raise ValueError(f"Неизвестный режим выбора кандидатов: {candidate_mode}")
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_frames = chunk_frames
+        self.top_n = top_n
+        self.method = method
+        self.stride = stride
+        self.score_width = score_width
+        self.batch_size = batch_size
+        self.candidate_mode = candidate_mode
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        # пул общий для всех вызовов: параллельные задачи не создают по пулу на ядро каждая
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="frame-quality")
+            return self._pool
+
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _chunks(self, video_path: str) -> List[Tuple[int, Optional[int]]]:
+        if self.candidate_mode != "full":
+            # быстрые режимы проходят сегмент одним процессом ffmpeg
+            return [(0, None)]
+        total = frame_count(video_path) if self.chunk_frames > 0 else 0
+        if total <= self.chunk_frames:
+            return [(0, None)]
+        bounds = list(range(0, total, self.chunk_frames))
+        # последний кусок открыт справа: счётчик кадров в контейнере бывает неточным
+        return [(start, start + self.chunk_frames) for start in bounds[:-1]] + [(bounds[-1], None)]
+
+    def _score_chunk(self, video_path: str, start: int, stop: Optional[int]) -> List[ScoredFrame]:
+        if self.candidate_mode != "full":
+            return select_sharp_candidates(
+                video_path,
+                top_n=self.top_n,
+                method=self.method,
+                mode=self.candidate_mode,
+                stride=self.stride,
+                score_width=self.score_width or 320
+            )
+        return select_sharp_frames(
+            video_path,
+            top_n=self.top_n,
+            method=self.method,
+            stride=self.stride,
+            score_width=self.score_width,
+            start_frame=start,
+            stop_frame=stop,
+            batch_size=self.batch_size
+        )
+
+    def __call__(self, video_paths: Sequence[str]) -> List[List[ScoredFrame]]:
+        """
+        Возвращает для каждого сегмента список лучших кадров (score, frame_idx, frame).
+        """
+        if not video_paths:
+            return []
+        futures = [
+            [self.pool.submit(self._score_chunk, path, start, stop) for start, stop in self._chunks(path)]
+            for path in video_paths
+        ]
+        results = []
+        for chunk_futures in futures:
+            candidates = [item for future in chunk_futures for item in future.result()]
+            results.append(heapq.nlargest(self.top_n, candidates, key=lambda x: x[0]))
+        return results
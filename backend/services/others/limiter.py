@@ -0,0 +1,168 @@
+"""Общие ограничители нагрузки на внешние AI-сервисы (транскрибация, LLM).
+
+Для каждого бэкенда: семафор на число одновременных запросов, token bucket на запросы в секунду
+и на токены в минуту, ограниченная очередь ожидания с метриками глубины и времени ожидания.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import config
+from services.others.metrics import REGISTRY
+
+
+class LimiterQueueFull(RuntimeError):
+    """Очередь ожидания бэкенда переполнена - запрос отклонён без ожидания."""
+
+
+class TokenBucket:
+    """
+    Token bucket: rate единиц в секунду, не больше capacity про запас. rate <= 0 - без ограничения.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def take(self, amount: float = 1.0) -> None:
+        if self.rate <= 0 or amount <= 0:
+            return
+        # запрос больше ёмкости иначе не дождался бы никогда
+        amount = min(amount, self.capacity)
+        # под замком ждёт только голова очереди, остальные встают за ней (FIFO)
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+
+class BackendLimiter:
+    """
+    Ограничитель одного бэкенда, общий для всех запросов процесса.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            max_concurrency: int,
+            requests_per_second: float = 0.0,
+            tokens_per_minute: float = 0.0,
+            max_queue: int = 100
+    ) -> None:
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._requests = TokenBucket(requests_per_second)
+        self._tokens = TokenBucket(tokens_per_minute / 60.0, capacity=tokens_per_minute or None)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @asynccontextmanager
+    async def acquire(self, tokens: float = 0.0) -> AsyncIterator[None]:
+        """
+        Занимает слот бэкенда на время блока. tokens - оценка токенов запроса для лимита в минуту.
+        """
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise LimiterQueueFull(f"Очередь к '{self.name}' переполнена ({self.queue_depth}/{self.max_queue})")
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        started = time.monotonic()
+        acquired = False
+        try:
+            await self._semaphore.acquire()
+            acquired = True
+            await self._requests.take(1)
+            await self._tokens.take(tokens)
+        except BaseException:
+            if acquired:
+                self._semaphore.release()
+            raise
+        finally:
+            self.queue_depth -= 1
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "wait_seconds_avg": self.wait_seconds_total / self.acquired if self.acquired else 0.0,
+        }
+
+
+_limiters: Dict[str, BackendLimiter] = {}
+
+
+def _from_config(name: str) -> BackendLimiter:
+    prefix = name.upper()
+    return BackendLimiter(
+        name,
+        max_concurrency=getattr(config, f"{prefix}_MAX_CONCURRENCY", 4),
+        requests_per_second=getattr(config, f"{prefix}_REQUESTS_PER_SECOND", 0.0),
+        tokens_per_minute=getattr(config, f"{prefix}_TOKENS_PER_MINUTE", 0.0),
+        max_queue=getattr(config, f"{prefix}_MAX_QUEUE", 100),
+    )
+
+
+def get_limiter(name: str) -> BackendLimiter:
+    """
+    Общий ограничитель бэкенда ('transcribe', 'llm'); параметры берутся из config.py по префиксу имени.
+    """
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = _limiters[name] = _from_config(name)
+    return limiter
+
+
+def limiters_stats() -> Dict[str, Dict[str, float]]:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+
+def _collect_limiters():
+    stats = limiters_stats()
+    for key, help_text in (
+            ("queue_depth", "Requests waiting for a backend slot."),
+            ("in_flight", "Requests currently running against a backend."),
+            ("acquired", "Requests admitted to a backend since start."),
+            ("rejected", "Requests rejected because the backend queue was full."),
+            ("wait_seconds_total", "Total time requests waited for a backend slot."),
+            ("wait_seconds_max", "Longest wait for a backend slot."),
+    ):
+        yield f"backend_limiter_{key}", help_text, [({"backend": name}, values[key]) for name, values in stats.items()]
+
+
+REGISTRY.add_collector(_collect_limiters)
@@ -0,0 +1,397 @@
+"""Метрики в формате Prometheus и трассировка задач VideoPipe по стадиям.
+
+Для каждой стадии задачи (audio, transcribe, llm, segments, frames, cleanup, ...) пишется
+время, CPU, объём данных, коды выхода подпроцессов и причина ошибки - и в гистограммы/счётчики
+процесса, и в трассу самой задачи.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+            self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# сборщик снимает текущие значения (gauge) в момент запроса /metrics:
+# возвращает (имя, описание, [(метки, значение), ...])
+Collector = Callable[[], Iterable[Tuple[str, str, List[Tuple[Dict[str, str], float]]]]]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(
+            self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Все метрики в текстовом формате Prometheus (text/plain; version=0.0.4).
+        """
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.error("Ошибка сборщика метрик %r: %s", collector, e)
+                continue
+            for name, help_text, values in samples:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+                for labels, value in values:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "videopipe_stage_seconds", "Wall time of a VideoPipe stage.", ("stage", "status")
+)
+STAGE_CPU_SECONDS = REGISTRY.histogram(
+    "videopipe_stage_cpu_seconds", "CPU time of a VideoPipe stage (worker thread and child processes).", ("stage",)
+)
+STAGE_BYTES = REGISTRY.counter(
+    "videopipe_stage_bytes_total", "Bytes consumed and produced by VideoPipe stages.", ("stage", "direction")
+)
+STAGE_FAILURES = REGISTRY.counter(
+    "videopipe_stage_failures_total", "Failed VideoPipe stages by reason.", ("stage", "reason")
+)
+SUBPROCESS_EXITS = REGISTRY.counter(
+    "videopipe_subprocess_exits_total", "Exit codes of ffmpeg/ffprobe subprocesses.", ("command", "code")
+)
+JOBS = REGISTRY.counter("videopipe_jobs_total", "Finished VideoPipe jobs by outcome.", ("status",))
+JOB_SECONDS = REGISTRY.histogram("videopipe_job_seconds", "Wall time of a whole VideoPipe job.", ("status",))
+
+
+class StageRecord:
+    """
+    Один прогон стадии в трассе задачи.
+    """
+
+    def __init__(self, stage: str, offset: float, detail: Optional[str] = None) -> None:
+        self.stage = stage
+        self.detail = detail
+        self.offset = offset
+        self.wall_seconds = 0.0
+        self.cpu_seconds: Optional[float] = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.exit_codes: List[Tuple[str, int]] = []
+        self.status = "running"
+        self.reason: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def fail(self, reason: str, error: Optional[str] = None) -> None:
+        """
+        Помечает стадию как неудачную без исключения (ошибка обработана внутри, например, пустой ответ).
+        """
+        self.status = "failed"
+        self.reason = reason
+        self.error = error[:500] if error else None
+
+    def add_cpu(self, seconds: float) -> None:
+        self.cpu_seconds = (self.cpu_seconds or 0.0) + seconds
+
+    def as_dict(self) -> Dict:
+        return {
+            "stage": self.stage,
+            "detail": self.detail,
+            "offset": round(self.offset, 4),
+            "wall_seconds": round(self.wall_seconds, 4),
+            "cpu_seconds": round(self.cpu_seconds, 4) if self.cpu_seconds is not None else None,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "exit_codes": [{"command": command, "code": code} for command, code in self.exit_codes],
+            "status": self.status,
+            "reason": self.reason,
+            "error": self.error,
+        }
+
+
+_current_stage: contextvars.ContextVar[Optional[StageRecord]] = contextvars.ContextVar(
+    "videopipe_stage", default=None
+)
+
+
+def record_subprocess(command: str, returncode: int) -> None:
+    """
+    Учитывает код выхода подпроцесса; если вызов идёт внутри стадии, код попадает и в её трассу.
+    """
+    SUBPROCESS_EXITS.inc(command=command, code=returncode)
+    record = _current_stage.get()
+    if record is not None:
+        record.exit_codes.append((command, returncode))
+
+
+def mark_stage_failed(reason: str, error: Optional[str] = None) -> None:
+    """
+    Помечает текущую стадию трассы как неудачную (для ошибок, которые функция стадии гасит сама).
+    """
+    record = _current_stage.get()
+    if record is not None:
+        record.fail(reason, error)
+
+
+def _children_cpu() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class JobTrace:
+    """
+    Трасса одной задачи VideoPipe: все прогоны стадий в порядке запуска.
+    Стадии могут идти параллельно (например, segments/frames по разным нарушениям).
+    """
+
+    def __init__(self, job_id: Optional[str] = None) -> None:
+        self.job_id = job_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.records: List[StageRecord] = []
+        self.status = "running"
+        self.total_seconds: Optional[float] = None
+
+    @asynccontextmanager
+    async def stage(self, name: str, detail: Optional[str] = None, bytes_in: int = 0) -> AsyncIterator[StageRecord]:
+        """
+        Замеряет стадию; исключение помечает стадию как failed (причина - тип исключения) и пробрасывается.
+        """
+        record = StageRecord(name, time.perf_counter() - self.started, detail)
+        record.bytes_in = bytes_in
+        self.records.append(record)
+        token = _current_stage.set(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.status = "cancelled" if isinstance(e, asyncio.CancelledError) else "failed"
+            record.reason = type(e).__name__
+            record.error = str(e)[:500]
+            raise
+        else:
+            if record.status == "running":
+                record.status = "ok"
+        finally:
+            _current_stage.reset(token)
+            record.wall_seconds = time.perf_counter() - started
+            self._observe(record)
+
+    async def run(
+            self,
+            name: str,
+            func: Callable,
+            *args,
+            detail: Optional[str] = None,
+            bytes_in: int = 0,
+            bytes_out: Optional[Callable] = None
+    ):
+        """
+        Выполняет синхронную функцию стадии в потоке и учитывает CPU этого потока
+        и дочерних процессов (последнее - по всему процессу, при параллельных задачах с погрешностью).
+        bytes_out - функция от результата, возвращающая объём выходных данных.
+        """
+        async with self.stage(name, detail, bytes_in) as record:
+            result = await asyncio.to_thread(self._measured, record, func, *args)
+            if bytes_out is not None:
+                record.bytes_out = bytes_out(result)
+            return result
+
+    @staticmethod
+    def _measured(record: StageRecord, func: Callable, *args):
+        thread_started = time.thread_time()
+        children_started = _children_cpu()
+        try:
+            return func(*args)
+        finally:
+            record.add_cpu(time.thread_time() - thread_started + max(0.0, _children_cpu() - children_started))
+
+    @staticmethod
+    def _observe(record: StageRecord) -> None:
+        STAGE_SECONDS.observe(record.wall_seconds, stage=record.stage, status=record.status)
+        if record.cpu_seconds is not None:
+            STAGE_CPU_SECONDS.observe(record.cpu_seconds, stage=record.stage)
+        if record.bytes_in:
+            STAGE_BYTES.inc(record.bytes_in, stage=record.stage, direction="in")
+        if record.bytes_out:
+            STAGE_BYTES.inc(record.bytes_out, stage=record.stage, direction="out")
+        if record.status != "ok":
+            STAGE_FAILURES.inc(stage=record.stage, reason=record.reason)
+
+    def finish(self, status: str) -> None:
+        self.status = status
+        self.total_seconds = time.perf_counter() - self.started
+        JOBS.inc(status=status)
+        JOB_SECONDS.observe(self.total_seconds, status=status)
+        _recent_traces.append(self)
+
+    def timings(self) -> Dict[str, float]:
+        """
+        Суммарное время по стадиям (как last_timings VideoPipe) и общее время задачи.
+        """
+        timings: Dict[str, float] = {}
+        for record in self.records:
+            timings[record.stage] = timings.get(record.stage, 0.0) + record.wall_seconds
+        timings["total"] = self.total_seconds if self.total_seconds is not None else time.perf_counter() - self.started
+        return timings
+
+    def failed_stage(self) -> Optional[StageRecord]:
+        return next((record for record in self.records if record.status == "failed"), None)
+
+    def as_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "started_at": self.started_at,
+            "status": self.status,
+            "total_seconds": round(self.total_seconds, 4) if self.total_seconds is not None else None,
+            "stages": [record.as_dict() for record in self.records],
+        }
+
+
+_recent_traces: Deque[JobTrace] = deque(maxlen=100)
+
+
+def recent_traces(limit: int = 20) -> List[Dict]:
+    """
+    Трассы последних завершённых задач, новые первыми.
+    """
+    return [trace.as_dict() for trace in list(_recent_traces)[::-1][:max(0, limit)]]
+
+
+def in_context(func: Callable) -> Callable:
+    """
+    Оборачивает функцию для запуска в другом потоке с текущим контекстом (стадией трассы).
+    """
+    return functools.partial(contextvars.copy_context().run, func)
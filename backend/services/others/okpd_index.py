@@ -0,0 +1,261 @@
+"""Индекс классификатора ОКПД2 в памяти: поиск кода по наименованию материала.
+
+Коды лежат в префиксном дереве (поиск по началу кода, признак конечной позиции),
+наименования - в инвертированном индексе символьных триграмм. Запрос оценивается
+векторно в numpy: косинусная близость по триграммам с весами IDF, затем top-k.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+NGRAM = 3
+
+
+class OkpdMatch(NamedTuple):
+    code: str
+    name: str
+    score: float
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(re.sub(r"[^\w]+", " ", name.lower().replace("ё", "е")).split())
+
+
+def name_ngrams(name: str, n: int = NGRAM) -> List[str]:
+    """
+    Уникальные символьные n-граммы нормализованного наименования (с пробелами по краям).
+    """
+    text = f" {normalize_name(name)} "
+    if len(text.strip()) == 0:
+        return []
+    return list(dict.fromkeys(text[i:i + n] for i in range(max(1, len(text) - n + 1))))
+
+
+def _code_key(code: str) -> str:
+    return re.sub(r"\D", "", code)
+
+
+class _TrieNode:
+    __slots__ = ("children", "entry")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _TrieNode] = {}
+        self.entry: Optional[int] = None
+
+
+class CodeTrie:
+    """
+    Префиксное дерево по цифрам кода (точки не учитываются).
+    """
+
+    def __init__(self) -> None:
+        self.root = _TrieNode()
+
+    def insert(self, code: str, entry: int) -> None:
+        node = self.root
+        for digit in _code_key(code):
+            node = node.children.setdefault(digit, _TrieNode())
+        node.entry = entry
+
+    def find(self, code: str) -> Optional[int]:
+        node = self._node(code)
+        return node.entry if node is not None else None
+
+    def _node(self, prefix: str) -> Optional[_TrieNode]:
+        node = self.root
+        for digit in _code_key(prefix):
+            node = node.children.get(digit)
+            if node is None:
+                return None
+        return node
+
+    def with_prefix(self, prefix: str, limit: int = 20) -> List[int]:
+        """
+        Записи с кодом, начинающимся на prefix, в порядке кодов (обход в глубину).
+        """
+        node = self._node(prefix)
+        if node is None:
+            return []
+        found: List[int] = []
+        stack = [node]
+        while stack and len(found) < limit:
+            node = stack.pop()
+            if node.entry is not None:
+                found.append(node.entry)
+            stack.extend(node.children[digit] for digit in sorted(node.children, reverse=True))
+        return found
+
+    def leaves(self, size: int) -> np.ndarray:
+        """
+        Маска записей без дочерних кодов (самые детальные позиции классификатора).
+        """
+        mask = np.zeros(size, dtype=bool)
+
+        def visit(node: _TrieNode) -> bool:
+            below = False
+            for child in node.children.values():
+                below = visit(child) or below
+            if node.entry is not None and not below:
+                mask[node.entry] = True
+            return below or node.entry is not None
+
+        visit(self.root)
+        return mask
+
+
+class OkpdIndex:
+    """
+    Индекс классификатора: codes/names - позиции, trie - коды, CSR-матрица триграмма -> позиции.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]) -> None:
+        self.codes: List[str] = []
+        self.names: List[str] = []
+        self.trie = CodeTrie()
+        for code, name in entries:
+            code, name = code.strip(), name.strip()
+            if not code or not name or self.trie.find(code) is not None:
+                continue
+            self.trie.insert(code, len(self.codes))
+            self.codes.append(code)
+            self.names.append(name)
+        self._build_ngrams()
+        self.is_leaf = self.trie.leaves(len(self.codes))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def _build_ngrams(self) -> None:
+        vocabulary: Dict[str, int] = {}
+        postings: List[List[int]] = []
+        for entry, name in enumerate(self.names):
+            for gram in name_ngrams(name):
+                gram_id = vocabulary.setdefault(gram, len(vocabulary))
+                if gram_id == len(postings):
+                    postings.append([])
+                postings[gram_id].append(entry)
+        self.vocabulary = vocabulary
+        lengths = np.array([len(p) for p in postings], dtype=np.int64)
+        self.indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+        self.indices = np.fromiter(
+            (entry for posting in postings for entry in posting), dtype=np.int32, count=int(lengths.sum())
+        )
+        n_entries = max(1, len(self.codes))
+        self.idf = np.log((1 + n_entries) / (1 + lengths)).astype(np.float32) + 1.0
+        # норма записи - корень из суммы квадратов IDF её триграмм
+        squared = np.repeat(self.idf * self.idf, lengths)
+        self.norms = np.sqrt(np.bincount(self.indices, weights=squared, minlength=len(self.codes))).astype(np.float32)
+        self.norms[self.norms == 0] = 1.0
+
+    def get(self, code: str) -> Optional[OkpdMatch]:
+        entry = self.trie.find(code)
+        if entry is None:
+            return None
+        return OkpdMatch(self.codes[entry], self.names[entry], 1.0)
+
+    def by_prefix(self, prefix: str, limit: int = 20) -> List[OkpdMatch]:
+        return [OkpdMatch(self.codes[e], self.names[e], 1.0) for e in self.trie.with_prefix(prefix, limit)]
+
+    def search(self, name: str, k: int = 5, leaves_only: bool = True, min_score: float = 0.0) -> List[OkpdMatch]:
+        """
+        top-k позиций, наиболее похожих на наименование (косинус по триграммам с весами IDF).
+        leaves_only - только конечные позиции классификатора.
+        """
+        grams = name_ngrams(name)
+        gram_ids = np.array([self.vocabulary[gram] for gram in grams if gram in self.vocabulary], dtype=np.int64)
+        if not len(gram_ids) or not len(self.codes) or k <= 0:
+            return []
+        starts, ends = self.indptr[gram_ids], self.indptr[gram_ids + 1]
+        lengths = ends - starts
+        # индексы всех вхождений нужных триграмм одним массивом, без цикла по триграммам
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+        weights = self.idf[gram_ids]
+        scores = np.bincount(
+            self.indices[offsets], weights=np.repeat(weights * weights, lengths), minlength=len(self.codes)
+        ).astype(np.float32)
+        # в норме запроса учитываются и триграммы, которых нет в словаре (вес как у самой редкой)
+        unknown = len(grams) - len(gram_ids)
+        query_norm = float(np.sqrt(np.sum(weights * weights) + unknown * float(self.idf.max()) ** 2))
+        scores /= self.norms * query_norm
+        if leaves_only:
+            scores[~self.is_leaf] = 0.0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            OkpdMatch(self.codes[e], self.names[e], round(float(scores[e]), 4))
+            for e in top if scores[e] > 0 and scores[e] >= min_score
+        ]
+
+
+def read_classifier(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Читает классификатор: .jsonl с полями code/name или CSV (разделитель определяется сам,
+    первые два столбца - код и наименование, строка заголовка пропускается).
+    """
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    yield str(row["code"]), str(row["name"])
+        return
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+        except csv.Error:
+            dialect = csv.excel
+        for row in csv.reader(f, dialect):
+            if len(row) < 2 or not re.match(r"^\s*\d", row[0]):
+                continue
+            yield row[0], row[1]
+
+
+_default_index: Optional[OkpdIndex] = None
+_default_loaded = False
+_load_lock = threading.Lock()
+
+
+def get_okpd_index() -> Optional[OkpdIndex]:
+    """
+    Индекс из файла OKPD_INDEX_PATH (загружается один раз); None, если файл не настроен или не найден.
+    """
+    global _default_index, _default_loaded
+    if not _default_loaded:
+        with _load_lock:
+            if not _default_loaded:
+                path = config.OKPD_INDEX_PATH
+                if path and os.path.exists(path):
+                    _default_index = OkpdIndex(read_classifier(path))
+                    logger.info("Классификатор ОКПД2 загружен: %s позиций из %s", len(_default_index), path)
+                else:
+                    logger.warning("Файл классификатора ОКПД2 не найден (%s), подбор кодов выключен", path)
+                _default_loaded = True
+    return _default_index
+
+
+def resolve_okpd(name: str) -> Optional[str]:
+    """
+    Лучший код ОКПД2 для наименования, если он достаточно похож (OKPD_MIN_SCORE); иначе None.
+    """
+    index = get_okpd_index()
+    if index is None:
+        return None
+    matches = index.search(name, k=1, min_score=config.OKPD_MIN_SCORE)
+    return matches[0].code if matches else None
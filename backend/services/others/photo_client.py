@@ -1,33 +1,321 @@
+"""Распознавание фото документов (ТТН, акты): документ и список материалов.
+
+Фото сначала готовится (services.others.image_prep), затем отдаётся бэкенду распознавания.
+Бэкенд подменяемый: LLMVisionBackend - мультимодальная модель через langchain,
+FakeExtractionBackend - фиксированный ответ для тестов и локального запуска (только явно,
+через PHOTO_FAKE_BACKEND).
+"""
+
 from __future__ import annotations
 
-from datetime import date, timedelta
-from typing import List, Tuple
-from uuid import uuid4
+import asyncio
+import base64
+import json
+import logging
+import re
+from datetime import date
+from typing import List, Optional, Protocol, Sequence, Tuple
 
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+from pydantic import ValidationError
+
+import config
 from services.db import schema
+from services.llm import schema as llm_schema
+from services.llm.chunking import estimate_tokens
+from services.others.image_prep import PreparedImage, preprocess_image
+from services.others.limiter import BackendLimiter, get_limiter
+
+logger = logging.getLogger(__name__)
+
+# грубая оценка токенов на изображение для лимита токенов в минуту
+IMAGE_TOKENS = 1000
+
+DOCUMENT_PROMPT = """Ты — помощник инспектора строительного контроля.
+Входные данные: фотография документа — транспортной накладной (ТТН) или акта выполненных работ.
+
+ЗАДАЧА:
+Извлеки из документа его вид, номер, даты и табличную часть (позиции с количеством).
+Для накладной дата начала и дата окончания совпадают с датой документа.
+Единицы измерения приведи к одной из: "шт", "м", "м2".
+
+ФОРМАТ ОТВЕТА:
+Верни ТОЛЬКО валидный JSON-объект в следующем формате:
+{
+"doc_name": "<вид документа, например: Транспортная накладная>",
+"doc_number": "<номер документа>",
+"doc_date_start": "<ГГГГ-ММ-ДД>",
+"doc_date_end": "<ГГГГ-ММ-ДД>",
+"item_list": [
+    {"item_name": "<наименование>", "UOM": "<шт|м|м2>", "amount": <количество>},
+    ...
+]
+}
+
+НЕ ДОБАВЛЯЙ ПОЯСНЕНИЙ, КОММЕНТАРИЕВ, МАРКДАУНА ИЛИ ДОПОЛНИТЕЛЬНОГО ТЕКСТА. ТОЛЬКО ЧИСТЫЙ JSON."""
+
+
+class PhotoAnalysisError(RuntimeError):
+    """Бэкенд не смог распознать документ (ошибка вызова, таймаут, невалидный ответ)."""
+
+
+class PhotoBackendUnavailableError(PhotoAnalysisError):
+    """Бэкенд распознавания не настроен: нет PHOTO_LLM_API_KEY и заглушка не включена."""
+
+
+class ExtractionBackend(Protocol):
+    async def extract(self, image: PreparedImage) -> llm_schema.Document:
+        ...
+
+
+def _strip_fences(content: str) -> str:
+    cleaned = content.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else cleaned
+        if cleaned.endswith("```"):
+            cleaned = cleaned.rsplit("\n", 1)[0]
+    return cleaned
+
+
+class LLMVisionBackend:
+    """
+    Распознавание мультимодальной моделью: изображение уходит в запросе как data URL.
+    Вызовы идут через общий ограничитель LLM.
+    """
+
+    def __init__(
+            self,
+            llm: ChatOpenAI,
+            timeout: float = 90.0,
+            limiter: Optional[BackendLimiter] = None
+    ) -> None:
+        self.llm = llm
+        self.timeout = timeout
+        self.limiter = limiter or get_limiter("llm")
+
+    async def extract(self, image: PreparedImage) -> llm_schema.Document:
+        data_url = f"data:{image.mime_type};base64,{base64.b64encode(image.data).decode('ascii')}"
+        messages = [
+            SystemMessage(content=DOCUMENT_PROMPT),
+            HumanMessage(content=[
+                {"type": "text", "text": "Распознай документ на фотографии."},
+                {"type": "image_url", "image_url": {"url": data_url}},
+            ]),
+        ]
+        cleaned = ""
+        try:
+            async with self.limiter.acquire(tokens=estimate_tokens(DOCUMENT_PROMPT) + IMAGE_TOKENS):
+                async with asyncio.timeout(self.timeout):
+                    response = await self.llm.ainvoke(messages)
+            cleaned = _strip_fences(response.content)
+            return llm_schema.Document.model_validate(json.loads(cleaned))
+        except (json.JSONDecodeError, ValidationError) as e:
+            raise PhotoAnalysisError(f"Не удалось распарсить или валидировать ответ модели: {e}\nОтвет: {cleaned}") from e
+        except TimeoutError as e:
+            raise PhotoAnalysisError(f"Таймаут при вызове модели: {self.timeout} секунд") from e
+        except PhotoAnalysisError:
+            raise
+        except Exception as e:
+            raise PhotoAnalysisError(f"Ошибка при вызове модели: {e}") from e
+
+
+class FakeExtractionBackend:
+    """
+    Возвращает заданный документ без обращения к модели; принятые изображения копятся в calls.
+    """
+
+    def __init__(self, document: Optional[llm_schema.Document] = None) -> None:
+        today = date.today()
+        self.document = document or llm_schema.Document(
+            doc_name="Транспортная накладная",
+            doc_number="TEST-0001",
+            doc_date_start=today,
+            doc_date_end=today,
+            item_list=[llm_schema.ItemsList(item_name="Generic Construction Material", UOM="шт", amount=100.0)],
+        )
+        self.calls: List[PreparedImage] = []
+
+    async def extract(self, image: PreparedImage) -> llm_schema.Document:
+        self.calls.append(image)
+        return self.document
+
 
+def doc_type_for(doc_name: str) -> schema.DocTypeEnum:
+    name = doc_name.lower()
+    if "накладн" in name or "ттн" in name:
+        return schema.DocTypeEnum.TTN
+    return schema.DocTypeEnum.OUTPUT
 
-def analyze_photo(image_bytes: bytes) -> Tuple[schema.DocumentBase, List[schema.MaterialBase]]:
-    """Mock photo analysis services that returns document and material metadata."""
 
-    today = date.today()
+def to_db_schemas(
+        document: llm_schema.Document, image_key: str
+) -> Tuple[schema.DocumentBase, List[schema.MaterialBase]]:
+    """
+    Переводит ответ распознавания в схемы БД. Материалы из накладной (поставка) подлежат
+    сертификации, позиции акта (работы) - нет.
+    """
+    doc_type = doc_type_for(document.doc_name)
     document_data = schema.DocumentBase(
-        doc_type=schema.DocTypeEnum.TTN,
-        doc_number=f"DOC-{uuid4().hex[:8].upper()}",
-        doc_date_start=today,
-        doc_date_end=today + timedelta(days=30),
-        doc_image_id=uuid4().hex,
+        doc_type=doc_type,
+        doc_number=document.doc_number,
+        doc_date_start=document.doc_date_start,
+        doc_date_end=document.doc_date_end,
+        doc_image_id=image_key,
     )
-
     materials_data = [
         schema.MaterialBase(
-            name="Generic Construction Material",
-            okpd="12.34.56",
-            amount=100.0,
-            uom="kg",
-            to_be_certified=True,
-            certificate="Generated certificate data",
+            name=item.item_name,
+            amount=item.amount,
+            uom=item.UOM,
+            to_be_certified=doc_type == schema.DocTypeEnum.TTN,
         )
+        for item in document.item_list
     ]
-
     return document_data, materials_data
+
+
+def _item_key(item: llm_schema.ItemsList) -> Tuple[str, str, float]:
+    name = re.sub(r"[^\w]+", " ", item.item_name.lower()).strip()
+    return name, item.UOM, round(item.amount, 3)
+
+
+def _boundary_overlap(previous: List[llm_schema.ItemsList], current: List[llm_schema.ItemsList], limit: int) -> int:
+    """
+    Сколько первых строк страницы повторяют последние строки предыдущей (строка, попавшая на оба фото).
+    """
+    for size in range(min(limit, len(previous), len(current)), 0, -1):
+        if [_item_key(item) for item in previous[-size:]] == [_item_key(item) for item in current[:size]]:
+            return size
+    return 0
+
+
+def merge_pages(documents: Sequence[llm_schema.Document], max_overlap: int = 3) -> llm_schema.Document:
+    """
+    Склеивает страницы в один документ: реквизиты с первой страницы, где они распознаны,
+    период - от самой ранней до самой поздней даты, строки - по порядку страниц.
+    Строки, повторённые на стыке соседних страниц (до max_overlap подряд), берутся один раз.
+    """
+    if not documents:
+        raise PhotoAnalysisError("Нет страниц для склейки")
+    first = documents[0]
+    items: List[llm_schema.ItemsList] = list(first.item_list)
+    previous = first.item_list
+    for document in documents[1:]:
+        overlap = _boundary_overlap(previous, document.item_list, max_overlap)
+        if overlap:
+            logger.info("На стыке страниц пропущено повторяющихся строк: %s", overlap)
+        items.extend(document.item_list[overlap:])
+        previous = document.item_list
+    return llm_schema.Document(
+        doc_name=next((d.doc_name for d in documents if d.doc_name.strip()), first.doc_name),
+        doc_number=next((d.doc_number for d in documents if d.doc_number.strip()), first.doc_number),
+        doc_date_start=min(d.doc_date_start for d in documents),
+        doc_date_end=max(d.doc_date_end for d in documents),
+        item_list=items,
+    )
+
+
+class PhotoPipe:
+    """
+    Асинхронный конвейер: подготовка изображения в потоке, затем вызов бэкенда распознавания.
+    """
+
+    def __init__(
+            self,
+            backend: ExtractionBackend,
+            target_dpi: int = 150,
+            grayscale: bool = True,
+            deskew: bool = True
+    ) -> None:
+        self.backend = backend
+        self.target_dpi = target_dpi
+        self.grayscale = grayscale
+        self.deskew = deskew
+
+    async def __call__(
+            self, image_bytes: bytes, image_key: str = ""
+    ) -> Tuple[schema.DocumentBase, List[schema.MaterialBase]]:
+        return to_db_schemas(await self.extract_page(image_bytes), image_key)
+
+    async def extract_page(self, image_bytes: bytes) -> llm_schema.Document:
+        prepared = await asyncio.to_thread(
+            preprocess_image, image_bytes, self.target_dpi, self.grayscale, self.deskew
+        )
+        logger.info(
+            "Фото подготовлено: %sx%s -> %sx%s, %s -> %s байт, наклон %.1f°",
+            *prepared.original_size, prepared.width, prepared.height,
+            len(image_bytes), len(prepared.data), prepared.skew_angle,
+        )
+        return await self.backend.extract(prepared)
+
+    async def extract_pages(self, pages: Sequence[bytes], max_concurrency: int = 4) -> llm_schema.Document:
+        """
+        Распознаёт страницы многостраничного документа параллельно (не больше max_concurrency
+        одновременно) и склеивает их в один документ. Ошибка любой страницы - ошибка всего документа.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(page: bytes) -> llm_schema.Document:
+            async with semaphore:
+                return await self.extract_page(page)
+
+        tasks = [asyncio.create_task(run(page)) for page in pages]
+        try:
+            documents = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return merge_pages(documents)
+
+
+_default_pipe: Optional[PhotoPipe] = None
+
+
+def get_photo_pipe() -> PhotoPipe:
+    """
+    Конвейер по настройкам из config.py. FakeExtractionBackend - только при PHOTO_FAKE_BACKEND;
+    без него и без PHOTO_LLM_API_KEY - PhotoBackendUnavailableError, а не документ-заглушка в БД.
+    """
+    global _default_pipe
+    if _default_pipe is None:
+        if config.PHOTO_LLM_API_KEY:
+            backend = LLMVisionBackend(
+                ChatOpenAI(
+                    model=config.PHOTO_LLM_MODEL,
+                    base_url=config.PHOTO_LLM_BASE_URL or None,
+                    api_key=config.PHOTO_LLM_API_KEY,
+                    temperature=0,
+                ),
+                timeout=config.PHOTO_LLM_TIMEOUT,
+            )
+        elif config.PHOTO_FAKE_BACKEND:
+            logger.warning("PHOTO_FAKE_BACKEND включён - фото распознаются заглушкой FakeExtractionBackend")
+            backend = FakeExtractionBackend()
+        else:
+            raise PhotoBackendUnavailableError("Распознавание фото не настроено: задайте PHOTO_LLM_API_KEY")
+        _default_pipe = PhotoPipe(backend, target_dpi=config.PHOTO_TARGET_DPI)
+    return _default_pipe
+
+
+async def analyze_photos(
+        pages: Sequence[bytes], image_key: str = "", max_concurrency: Optional[int] = None
+) -> Tuple[schema.DocumentBase, List[schema.MaterialBase]]:
+    """
+    Распознаёт многостраничный документ (по фото на страницу) как один документ.
+    image_key - ключ фото первой страницы в хранилище блобов.
+    """
+    document = await get_photo_pipe().extract_pages(pages, max_concurrency or config.PHOTO_BATCH_CONCURRENCY)
+    return to_db_schemas(document, image_key)
+
+
+async def analyze_photo(
+        image_bytes: bytes, image_key: str = ""
+) -> Tuple[schema.DocumentBase, List[schema.MaterialBase]]:
+    """
+    Распознаёт фото документа; image_key - ключ исходного фото в хранилище блобов.
+    InvalidImageError - файл не изображение, PhotoAnalysisError - документ не распознан,
+    PhotoBackendUnavailableError - распознавание не настроено.
+    """
+    return await get_photo_pipe()(image_bytes, image_key)
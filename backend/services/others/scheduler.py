@@ -0,0 +1,73 @@
+"""Простой планировщик внутри процесса: задача раз в сутки в заданное время.
+
+Поток-демон ждёт до следующего запуска на threading.Event, поэтому остановка мгновенная,
+а ошибка задачи не останавливает расписание. Для распределённого запуска не подходит:
+каждый процесс приложения выполняет задачу сам.
+"""
+
+import logging
+import threading
+from datetime import datetime, time, timedelta
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time(value: str) -> time:
+    """
+    Время запуска из строки "ЧЧ:ММ".
+    """
+    hours, minutes = value.strip().split(":")
+    return time(int(hours), int(minutes))
+
+
+def seconds_until(at: time, now: Optional[datetime] = None) -> float:
+    """
+    Секунды до ближайшего наступления времени at (сегодня или завтра).
+    """
+    now = now or datetime.now()
+    run_at = datetime.combine(now.date(), at)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+
+class DailyJob:
+    """
+    Вызывает func каждый день в at (локальное время); run_on_start - ещё и сразу после запуска.
+    """
+
+    def __init__(self, name: str, func: Callable[[], object], at: time, run_on_start: bool = True) -> None:
+        self.name = name
+        self.func = func
+        self.at = at
+        self.run_on_start = run_on_start
+        self.last_run: Optional[datetime] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> None:
+        started = datetime.now()
+        try:
+            self.func()
+        except Exception as e:
+            logger.error("Ошибка задачи %s: %s", self.name, e)
+            return
+        self.last_run = started
+        logger.info("Задача %s выполнена за %.2f с", self.name, (datetime.now() - started).total_seconds())
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        def loop() -> None:
+            if self.run_on_start:
+                self.run_once()
+            while not self._stop.wait(seconds_until(self.at)):
+                self.run_once()
+
+        self._thread = threading.Thread(target=loop, name=f"daily-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,285 @@
+"""Асинхронный клиент сервиса транскрибации (/transcribe_long)."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from services.others.audio_chunks import SAMPLE_RATE, StreamingSplitter, merge_phrases, split_on_silence
+from services.others.limiter import BackendLimiter, LimiterQueueFull, get_limiter
+from services.others.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_ATTEMPTS = REGISTRY.counter(
+    "transcribe_attempts_total", "Requests to the transcription service by outcome.", ("outcome",)
+)
+CIRCUIT_OPENED = REGISTRY.counter(
+    "transcribe_circuit_opened_total", "Times the transcription circuit breaker opened."
+)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Общий HTTP-клиент с пулом keep-alive соединений для внешних AI-сервисов.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(None, connect=5.0),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """
+    Закрывает общий HTTP-клиент (вызывать при остановке приложения).
+    """
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class TranscribeError(RuntimeError):
+    """Сервис транскрибации не вернул корректный результат."""
+
+
+class CircuitOpenError(TranscribeError):
+    """Запрос не отправлен: предохранитель разомкнут после серии ошибок."""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель: после failure_threshold ошибок подряд запросы отклоняются
+    reset_timeout секунд, затем пропускается один пробный запрос.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """
+        Пробный запрос завершился без ответа сервиса и без ошибки связи (отмена, очередь
+        ограничителя, ошибка разбора ответа): следующий запрос снова может стать пробным.
+        """
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                CIRCUIT_OPENED.inc()
+            self._opened_at = time.monotonic()
+
+
+class TranscribeClient:
+    """
+    Клиент /transcribe_long: потоковая отправка PCM, таймаут на каждую попытку,
+    повторы с экспоненциальной задержкой и джиттером, предохранитель.
+    """
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(
+            self,
+            url: str,
+            client: Optional[httpx.AsyncClient] = None,
+            attempts: int = 4,
+            attempt_timeout: float = 300.0,
+            backoff_base: float = 0.5,
+            backoff_max: float = 10.0,
+            chunk_size: int = 64 * 1024,
+            breaker: Optional[CircuitBreaker] = None,
+            window_s: float = 120.0,
+            overlap_s: float = 2.0,
+            max_concurrency: int = 4,
+            limiter: Optional[BackendLimiter] = None
+    ) -> None:
+        self.url = url
+        self._client = client
+        self.attempts = max(1, attempts)
+        self.attempt_timeout = attempt_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.chunk_size = chunk_size
+        self.breaker = breaker or CircuitBreaker()
+        self.window_s = window_s
+        self.overlap_s = overlap_s
+        self.max_concurrency = max(1, max_concurrency)
+        self.limiter = limiter or get_limiter("transcribe")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_http_client()
+
+    async def _body(self, audio_bytes: bytes) -> AsyncIterator[bytes]:
+        view = memoryview(audio_bytes)
+        for offset in range(0, len(view), self.chunk_size):
+            yield bytes(view[offset:offset + self.chunk_size])
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _parse(json_data) -> List[Dict]:
+        if not isinstance(json_data, dict) or "message" not in json_data:
+            raise TranscribeError(f"Ключ 'message' отсутствует в ответе: {json_data}")
+        message = json_data["message"]
+        if not isinstance(message, list) or not message:
+            raise TranscribeError(f"'message' является пустым списком: {json_data}")
+        if not all(isinstance(item, dict) for item in message):
+            raise TranscribeError(f"Не все элементы 'message' являются словарями: {json_data}")
+        return message
+
+    async def _attempt(self, audio_bytes: bytes) -> httpx.Response:
+        # слот общего ограничителя держится только на время попытки, не на паузу между повторами
+        async with self.limiter.acquire(), asyncio.timeout(self.attempt_timeout):
+            return await self.client.post(
+                self.url,
+                content=self._body(audio_bytes),
+                headers={
+                    "Content-Type": "application/octet-stream",
+                    "Content-Length": str(len(audio_bytes)),
+                },
+            )
+
+    async def transcribe(self, audio_bytes: bytes) -> List[Dict]:
+        """
+        Отправляет сырые int16 PCM байты и возвращает список фраз из 'message'.
+        """
+        last_error: Optional[Exception] = None
+        for attempt in range(self.attempts):
+            probe = self.breaker.state == "half_open"
+            if not self.breaker.allow():
+                TRANSCRIBE_ATTEMPTS.inc(outcome="circuit_open")
+                raise CircuitOpenError(f"Сервис транскрибации недоступен: {last_error or 'предохранитель разомкнут'}")
+            try:
+                response = await self._attempt(audio_bytes)
+            except LimiterQueueFull as e:
+                TRANSCRIBE_ATTEMPTS.inc(outcome="rejected")
+                raise TranscribeError(str(e)) from e
+            except (httpx.TransportError, TimeoutError) as e:
+                TRANSCRIBE_ATTEMPTS.inc(outcome=type(e).__name__)
+                self.breaker.record_failure()
+                last_error = e
+                logger.warning("Попытка %s/%s: ошибка запроса к %s: %r", attempt + 1, self.attempts, self.url, e)
+            else:
+                TRANSCRIBE_ATTEMPTS.inc(outcome=str(response.status_code))
+                if response.status_code in self.RETRY_STATUSES:
+                    self.breaker.record_failure()
+                    last_error = TranscribeError(f"HTTP {response.status_code}: {response.text[:500]}")
+                    logger.warning("Попытка %s/%s: %s", attempt + 1, self.attempts, last_error)
+                else:
+                    # сервис ответил - для предохранителя это успех, даже если ответ некорректный
+                    self.breaker.record_success()
+                    if response.is_error:
+                        raise TranscribeError(f"HTTP {response.status_code}: {response.text[:500]}")
+                    try:
+                        json_data = response.json()
+                    except ValueError as e:
+                        raise TranscribeError(f"Сервер вернул некорректный JSON: {response.text[:500]}") from e
+                    return self._parse(json_data)
+            finally:
+                if probe:
+                    self.breaker.release_probe()
+            if attempt + 1 < self.attempts:
+                await asyncio.sleep(self._backoff(attempt))
+        raise TranscribeError(f"Транскрибация не удалась после {self.attempts} попыток: {last_error}")
+
+    async def transcribe_chunked(self, audio_bytes: bytes) -> List[Dict]:
+        """
+        Транскрибирует длинную запись параллельно по окнам, нарезанным по паузам.
+
+        Время фраз пересчитывается от начала записи, дубли в зонах перекрытия убираются,
+        формат фраз совпадает с transcribe. Окно без речи или с ошибкой пропускается;
+        если не удалось ни одно окно - TranscribeError.
+        """
+        windows = split_on_silence(audio_bytes, window_s=self.window_s, overlap_s=self.overlap_s)
+        if len(windows) == 1:
+            return await self.transcribe(audio_bytes)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*(self._window(semaphore, window, window.pcm(audio_bytes)) for window in windows))
+        if all(result is None for result in results):
+            raise TranscribeError(f"Не удалось транскрибировать ни одно из {len(windows)} окон")
+        return merge_phrases(windows, results)
+
+    async def _window(self, semaphore: asyncio.Semaphore, window, pcm: bytes) -> Optional[List[Dict]]:
+        async with semaphore:
+            try:
+                return await self.transcribe(pcm)
+            except TranscribeError as e:
+                logger.warning("Окно %.1f-%.1f с пропущено: %s", window.start / SAMPLE_RATE, window.end / SAMPLE_RATE, e)
+                return None
+
+    async def transcribe_stream(self, chunks: AsyncIterable[bytes], chunked: bool = True) -> List[Dict]:
+        """
+        Транскрибирует PCM, который ещё извлекается: каждое окно отправляется, как только нарезано,
+        не дожидаясь конца записи. Результат тот же, что у transcribe_chunked на всей записи.
+        chunked=False - поток собирается целиком и отправляется одним запросом.
+        """
+        if not chunked:
+            return await self.transcribe(b"".join([chunk async for chunk in chunks]))
+
+        splitter = StreamingSplitter(window_s=self.window_s, overlap_s=self.overlap_s)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        windows = []
+        tasks: List[asyncio.Task] = []
+
+        def dispatch(ready) -> None:
+            for window, pcm in ready:
+                windows.append(window)
+                tasks.append(asyncio.create_task(self._window(semaphore, window, pcm)))
+
+        try:
+            async for chunk in chunks:
+                dispatch(splitter.feed(chunk))
+            ready = splitter.finish()
+            if not tasks and len(ready) == 1:
+                # короткая запись - одно окно, ошибки как у transcribe
+                return await self.transcribe(ready[0][1])
+            dispatch(ready)
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        if all(result is None for result in results):
+            raise TranscribeError(f"Не удалось транскрибировать ни одно из {len(windows)} окон")
+        return merge_phrases(windows, results)
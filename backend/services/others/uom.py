@@ -0,0 +1,65 @@
+"""Единицы измерения материалов: приведение записи единицы к канонической с пересчётом количества.
+
+В документах единицы пишутся как угодно ("шт.", "кв. м", "kg", "т"), поэтому при записи
+материала рядом с исходными uom/amount сохраняются каноническая единица и количество в ней -
+по ним итоги считаются в SQL простым GROUP BY.
+"""
+
+import re
+from typing import Dict, Optional, Tuple
+
+# каноническая единица -> {вариант записи: множитель к канонической}
+UOM_TABLE: Dict[str, Dict[str, float]] = {
+    "шт": {
+        "шт": 1.0, "штук": 1.0, "штука": 1.0, "штуки": 1.0, "ед": 1.0, "pcs": 1.0, "pc": 1.0, "ea": 1.0,
+        "тыс.шт": 1000.0, "тысшт": 1000.0,
+    },
+    "компл": {"компл": 1.0, "комплект": 1.0, "к-т": 1.0, "set": 1.0},
+    "м": {
+        "м": 1.0, "п.м": 1.0, "пм": 1.0, "пог.м": 1.0, "м.п": 1.0, "мп": 1.0, "m": 1.0,
+        "мм": 0.001, "mm": 0.001, "см": 0.01, "cm": 0.01, "км": 1000.0, "km": 1000.0,
+    },
+    "м2": {
+        "м2": 1.0, "кв.м": 1.0, "квм": 1.0, "m2": 1.0, "sq.m": 1.0, "sqm": 1.0,
+        "см2": 0.0001, "мм2": 0.000001, "га": 10000.0,
+    },
+    "м3": {
+        "м3": 1.0, "куб.м": 1.0, "кубм": 1.0, "m3": 1.0, "cu.m": 1.0,
+        "л": 0.001, "l": 0.001, "дм3": 0.001,
+    },
+    "кг": {
+        "кг": 1.0, "kg": 1.0, "г": 0.001, "гр": 0.001, "g": 0.001,
+        "т": 1000.0, "тн": 1000.0, "тонна": 1000.0, "тонн": 1000.0, "t": 1000.0,
+    },
+}
+
+_ALIASES: Dict[str, Tuple[str, float]] = {
+    alias: (canonical, factor) for canonical, aliases in UOM_TABLE.items() for alias, factor in aliases.items()
+}
+
+
+def uom_key(uom: str) -> str:
+    """
+    Ключ записи единицы: нижний регистр, без пробелов и точки на конце, ²/³ -> 2/3.
+    """
+    key = re.sub(r"\s+", "", uom.lower()).replace("²", "2").replace("³", "3")
+    return key.rstrip(".")
+
+
+def lookup_uom(uom: str) -> Optional[Tuple[str, float]]:
+    """
+    (каноническая единица, множитель) или None, если единица не из таблицы.
+    """
+    return _ALIASES.get(uom_key(uom))
+
+
+def to_canonical(amount: Optional[float], uom: Optional[str]) -> Tuple[Optional[float], Optional[str]]:
+    """
+    Количество и единица в каноническом виде. Неизвестная единица остаётся как есть
+    (в виде ключа, чтобы одинаково записанные единицы суммировались вместе) с множителем 1.
+    """
+    if not uom or not uom.strip():
+        return amount, None
+    found = lookup_uom(uom)
+    canonical, factor = found if found is not None else (uom_key(uom), 1.0)
+    return (amount * factor if amount is not None else None), canonical
@@ -0,0 +1,224 @@
+"""Helpers for reading uploaded files in bounded chunks."""
+
+from __future__ import annotations
+
+import hashlib
+import tempfile
+from typing import Any, Callable, Collection, Dict, List, Optional, Tuple
+
+import python_multipart
+from fastapi import Request, UploadFile
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartState, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# начало файла, которое держим для разбора заголовка: пробуем с 16 КиБ, дальше в 4 раза больше
+HEAD_MIN_SIZE = 16 * 1024
+HEAD_MAX_SIZE = 1024 * 1024
+# запас на заголовки частей и текстовые поля сверх размера файлов
+MULTIPART_OVERHEAD = 1024 * 1024
+
+# (начало файла, файл получен целиком) -> описание файла; None - нужно больше данных
+HeadInspector = Callable[[bytes, bool], Optional[Any]]
+
+
+class UploadTooLargeError(ValueError):
+    """The request body or one of its files exceeds the allowed size."""
+
+
+class InvalidUploadError(ValueError):
+    """The request is not an acceptable multipart upload."""
+
+
+async def hash_upload(upload: UploadFile) -> Tuple[str, int]:
+    """Return the sha256 hex digest and size of an upload, reading it chunk by chunk.
+
+    The file position is rewound afterwards so the upload can be read again.
+    """
+
+    digest = hashlib.sha256()
+    size = 0
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    await upload.seek(0)
+    return digest.hexdigest(), size
+
+
+class SpooledUpload:
+    """A file part of a multipart request, written to a spooled temporary file as it arrives.
+
+    The sha256 and size are computed on the fly, and the first bytes are passed to
+    ``inspect`` so a bad file is rejected before the rest of it is received.
+    """
+
+    def __init__(
+        self,
+        field: str,
+        filename: str,
+        content_type: str,
+        max_size: int,
+        inspect: Optional[HeadInspector] = None,
+        spool_size: int = UPLOAD_CHUNK_SIZE,
+    ) -> None:
+        self.field = field
+        self.filename = filename
+        self.content_type = content_type
+        self.max_size = max_size
+        self.size = 0
+        # результат inspect, например формат и размеры изображения
+        self.info: Optional[Any] = None
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self._digest = hashlib.sha256()
+        self._inspect = inspect
+        self._head = bytearray()
+        self._next_probe = HEAD_MIN_SIZE
+
+    @property
+    def content_hash(self) -> str:
+        return self._digest.hexdigest()
+
+    async def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadTooLargeError(f"File is too large. At most {self.max_size} bytes are allowed.")
+        self._digest.update(data)
+        if self._inspect is not None and self.info is None:
+            self._head += data[:HEAD_MAX_SIZE - len(self._head)]
+            if len(self._head) >= self._next_probe:
+                self._probe(complete=False)
+        # после перехода на диск запись блокирующая - уводим её из цикла событий
+        if getattr(self.file, "_rolled", False):
+            await run_in_threadpool(self.file.write, data)
+        else:
+            self.file.write(data)
+
+    def _probe(self, complete: bool) -> None:
+        self.info = self._inspect(bytes(self._head), complete)
+        if self.info is None:
+            if complete or len(self._head) >= HEAD_MAX_SIZE:
+                raise InvalidUploadError("Could not read the file header.")
+            self._next_probe = min(self._next_probe * 4, HEAD_MAX_SIZE)
+
+    def finish(self) -> None:
+        if self._inspect is not None and self.info is None:
+            self._probe(complete=True)
+        self._head = bytearray()
+        self.file.seek(0)
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+async def stream_multipart(
+    request: Request,
+    max_file_size: int,
+    max_files: int = 1,
+    content_types: Optional[Collection[str]] = None,
+    inspect: Optional[HeadInspector] = None,
+    max_field_size: int = 64 * 1024,
+) -> Tuple[Dict[str, str], List[SpooledUpload]]:
+    """Parse a multipart/form-data body while it is being received.
+
+    Unlike ``await request.form()``, the checks run before the body is buffered: a
+    declared body that cannot fit, a file larger than ``max_file_size``, a part type
+    outside ``content_types`` or a header rejected by ``inspect`` stops the upload as
+    soon as it is seen. Returns the text fields and the file parts; the caller closes
+    the files.
+    """
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise InvalidUploadError("Expected a multipart/form-data request.")
+    content_length = request.headers.get("content-length", "")
+    max_body_size = max_files * max_file_size + MULTIPART_OVERHEAD
+    if content_length.isdigit() and int(content_length) > max_body_size:
+        raise UploadTooLargeError(f"Request is too large. At most {max_body_size} bytes are allowed.")
+
+    # колбэки парсера синхронные - копим события и обрабатываем их после каждого куска
+    events: List[Tuple[str, Any]] = []
+    headers: Dict[bytes, bytes] = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_header_end() -> None:
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished() -> None:
+        events.append(("begin", dict(headers)))
+        headers.clear()
+
+    parser = python_multipart.MultipartParser(boundary, {
+        "on_header_field": lambda data, start, end: header_field.extend(data[start:end]),
+        "on_header_value": lambda data, start, end: header_value.extend(data[start:end]),
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+    })
+
+    fields: Dict[str, str] = {}
+    uploads: List[SpooledUpload] = []
+    current: Optional[SpooledUpload] = None
+    field_name = ""
+    field_value = bytearray()
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, payload in events:
+                if kind == "begin":
+                    _, options = parse_options_header(payload.get(b"content-disposition", b""))
+                    name = options.get(b"name", b"").decode("utf-8", "replace")
+                    if b"filename" not in options:
+                        current, field_name = None, name
+                        field_value.clear()
+                        continue
+                    if len(uploads) >= max_files:
+                        raise InvalidUploadError(f"Too many files. At most {max_files} are allowed.")
+                    part_type = payload.get(b"content-type", b"").decode("latin-1")
+                    if content_types is not None and part_type not in content_types:
+                        raise InvalidUploadError(
+                            f"Unsupported file type {part_type!r}. Allowed: {', '.join(sorted(content_types))}."
+                        )
+                    current = SpooledUpload(
+                        name, options[b"filename"].decode("utf-8", "replace"), part_type, max_file_size, inspect
+                    )
+                    uploads.append(current)
+                elif kind == "data":
+                    if current is not None:
+                        await current.write(payload)
+                    else:
+                        field_value.extend(payload)
+                        if len(field_value) > max_field_size:
+                            raise UploadTooLargeError(f"Form field {field_name!r} is too large.")
+                elif current is not None:
+                    current.finish()
+                    current = None
+                else:
+                    fields[field_name] = field_value.decode("utf-8", "replace")
+            events.clear()
+        parser.finalize()
+        # тело оборвалось до закрывающей границы - недописанную часть не принимаем
+        if current is not None or parser.state != MultipartState.END:
+            raise InvalidUploadError("Malformed multipart body: the closing boundary is missing.")
+    except MultipartParseError as e:
+        for upload in uploads:
+            upload.close()
+        raise InvalidUploadError(f"Malformed multipart body: {e}") from e
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+    return fields, uploads
@@ -2,57 +2,40 @@
 
 from __future__ import annotations
 
-from typing import List, Tuple
-
-from services.db import schema
-
-
-def analyze_video(video_bytes: bytes) -> Tuple[schema.CheckBase, List[schema.IncidentBase]]:
-    """Mock video analysis that returns check and incident metadata.
-
-    This function pretends to forward the provided video to an external
-    detection service. Until the real integration is implemented we return
-    deterministic metadata that can be stored in the database.
-    """
-
-    check_data = schema.CheckBase(
-        info="Automatically generated inspection from video",
-        location="Video stream location",
-        status_check=schema.CheckStatusEnum.INCIDENT,
-    )
-
-    incidents_data = [
-        schema.IncidentBase(
-            photo="video_frame_reference",
-            incident_status=True,
-            incident_info="Potential safety violation detected in the video",
-            prescription_type=schema.PrescriptionTypeEnum.TYPE_1,
-        )
-    ]
-
-    return check_data, incidents_data
-
-
-
 import os
 import io
-import cv2
 import json
+import bisect
 import numpy as np
 import asyncio
 import requests
 import subprocess
-from pydantic import BaseModel, Field, ValidationError
-from typing import Dict, Optional
+from pydantic import ValidationError
+from typing import Dict, Iterator, List, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from PIL import Image
 import logging
-from __future__ import annotations
-
-from typing import List, Tuple
 
 from services.db import schema
+from services.llm.cache import LLMResultCache, get_default_cache, make_cache_key
+from services.llm.chunking import estimate_tokens, merge_window_answers, split_phrase_windows
+from services.llm.schema import AnswerStruct
+from services.others.audio_stream import (
+    NUMPY_MODES,
+    STREAM_CHUNK_SIZE,
+    apply_gain,
+    astream_audio,
+    audio_command,
+    iter_audio_chunks,
+    resolve_normalize,
+)
+from services.others.blob_store import BlobStore, get_blob_store
+from services.others.frame_quality import FrameQualityStage, select_sharp_frames
+from services.others.limiter import BackendLimiter, get_limiter
+from services.others.metrics import JobTrace, mark_stage_failed, record_subprocess
+from services.others.transcribe_client import TranscribeClient, TranscribeError
+from services.others.workspace import ScratchSpace, get_scratch_space
 
 
 def analyze_video(video_bytes: bytes) -> Tuple[schema.CheckBase, List[schema.IncidentBase]]:
@@ -80,6 +63,7 @@ def analyze_video(video_bytes: bytes) -> Tuple[schema.CheckBase, List[schema.Inc
 
     return check_data, incidents_data
 
+
 logger = logging.getLogger(__name__)
 handler = logging.StreamHandler()
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -88,51 +72,197 @@ logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
 
+# Версия промпта входит в ключ кэша ответов LLM: меняешь промпт - увеличь версию
+ISSUES_PROMPT_VERSION = 1
+ISSUES_PROMPT = """Ты — многофункциональный помощник \
+инспектора строительного контроля.
+Входные данные: расшифровка видеозаписи процесса обследования строительного объекта \
+(транскрибированный текст) в формате: <индекс> --> <текст фразы>
+
+ЗАДАЧА:
+Проанализируй расшифровку и найди фразы, в которых пользователь \
+указывает на наличие нарушений (дефектов, отклонений, несоответствий).
+Для каждой такой фразы запомни её индекс и сформулируй краткое описание нарушения \
+в строгом деловом стиле, принятом в строительной документации.
+
+ФОРМАТ ОТВЕТА:
+Верни ТОЛЬКО валидный JSON-объект в следующем формате:
+{
+"issues": [
+    {"idx": <номер фразы>, "description": "<описание нарушения>"},
+    ...
+]
+}
+Если нарушений не найдено, верни: {"issues": []}
+
+НЕ ДОБАВЛЯЙ ПОЯСНЕНИЙ, КОММЕНТАРИЕВ, МАРКДАУНА ИЛИ ДОПОЛНИТЕЛЬНОГО ТЕКСТА. ТОЛЬКО ЧИСТЫЙ JSON."""
+
+
 class VideoPipe:
     def __init__(
             self,
             llm: ChatOpenAI,
-            trr_serv_url: str = "http://0.0.0.0:8008/transcribe_long"
+            trr_serv_url: str = "http://0.0.0.0:8008/transcribe_long",
             # Тут надо будет переделать на адрес моего микросервиса транскрибации
+            frame_stage: Optional[FrameQualityStage] = None,
+            transcriber: Optional[TranscribeClient] = None,
+            chunked_transcribe: bool = True,
+            pipelined: bool = True,
+            llm_cache: Optional[LLMResultCache] = None,
+            llm_window_tokens: int = 6000,
+            llm_window_overlap: int = 2,
+            llm_concurrency: int = 4,
+            llm_limiter: Optional[BackendLimiter] = None,
+            blob_store: Optional[BlobStore] = None,
+            scratch: Optional[ScratchSpace] = None,
+            stream_audio: bool = True,
+            audio_normalize="loudnorm"
     ) -> None:
         """
+        frame_stage - параллельная оценка резкости кадров в сегментах (по умолчанию на всех ядрах).
+        transcriber - асинхронный клиент транскрибации (по умолчанию на общем пуле соединений).
+        chunked_transcribe - длинные записи транскрибируются параллельно по окнам, нарезанным по паузам.
+        pipelined - стадии перекрываются; False - прежний последовательный прогон (для сравнения).
+        llm_cache - кэш ответов LLM по хэшу расшифровки (по умолчанию из config.py, пустой LLM_CACHE_PATH - выключен).
+        llm_window_tokens, llm_window_overlap, llm_concurrency - окна расшифровки для LLM: бюджет токенов,
+        перекрытие во фразах и число одновременно анализируемых окон.
+        llm_limiter - общий для процесса ограничитель запросов к LLM (по умолчанию из config.py).
+        blob_store - хранилище кадров нарушений (по умолчанию из config.py).
+        scratch - временные каталоги задач с общим бюджетом по объёму (по умолчанию из config.py).
+        stream_audio - в режиме pipelined аудио транскрибируется по окнам, пока ffmpeg ещё извлекает запись.
+        audio_normalize - нормализация громкости: "loudnorm", "dynaudnorm" (дешевле), "peak"/"rms"
+        (усиление numpy, только без stream_audio) или None.
         """
         self.trr_serv_url = trr_serv_url
         self.llm = llm
+        self.transcriber = transcriber or TranscribeClient(trr_serv_url)
+        self.chunked_transcribe = chunked_transcribe
+        self.frame_stage = frame_stage or FrameQualityStage()
+        self.pipelined = pipelined
+        self.last_timings: Dict[str, float] = {}
+        self.last_trace: Optional[JobTrace] = None
+        self.llm_cache = llm_cache if llm_cache is not None else get_default_cache()
+        self.llm_window_tokens = llm_window_tokens
+        self.llm_window_overlap = llm_window_overlap
+        self.llm_concurrency = max(1, llm_concurrency)
+        self.llm_limiter = llm_limiter or get_limiter("llm")
+        self.blob_store = blob_store or get_blob_store()
+        self.scratch = scratch or get_scratch_space()
+        self.audio_normalize = resolve_normalize(audio_normalize)
+        # усилению по пику/RMS нужна вся запись, потоковое извлечение с ним невозможно
+        self.stream_audio = stream_audio and self.audio_normalize not in NUMPY_MODES
 
     async def __call__(self, video_input: Optional[bytes | str]):
         """
+        Полный разбор видео: транскрибация, поиск нарушений LLM и выбор кадра для каждого нарушения.
+        В режиме pipelined стадии перекрываются, иначе выполняются строго по очереди.
+        Трасса задачи по стадиям сохраняется в last_trace, суммарное время стадий - в last_timings.
+        """
+        trace = JobTrace()
+        self.last_trace = trace
+        status = "failed"
+        try:
+            async with self.scratch.job(self._scratch_reserve(video_input)) as workspace:
+                if self.pipelined:
+                    result = await self._run_pipelined(video_input, workspace.path, trace)
+                else:
+                    result = await self._run_sequential(video_input, workspace.path, trace)
+            if result is not None:
+                status = "ok"
+            elif trace.failed_stage() is None:
+                status = "empty"
+            return result
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            trace.finish(status)
+            self._log_trace(trace)
+
+    @staticmethod
+    def _scratch_reserve(video_input: Optional[bytes | str]) -> int:
+        """
+        Оценка места под сегменты задачи: сегменты режутся без перекодирования и в сумме не больше видео.
         """
+        if isinstance(video_input, bytes):
+            return len(video_input)
         try:
-            audio_bytes = self.extract_audio_bytes(video_input, normalize=True)
-        except:
+            return os.path.getsize(video_input)
+        except (OSError, TypeError):
+            return 0
+
+    @staticmethod
+    def _issue_ranges(phrases: List[Dict], res) -> Tuple[List[Tuple[float, float]], List[str]]:
+        time_ranges = []
+        descriptions = []
+        for issue in res.issues:
+            idx = issue.idx
+            if idx < len(phrases):
+                phrase = phrases[idx]
+                time_ranges.append((phrase["start_time"], phrase["end_time"]))
+                descriptions.append(issue.description)
+        return time_ranges, descriptions
+
+    def _log_trace(self, trace: JobTrace) -> None:
+        self.last_timings = trace.timings()
+        logger.info(
+            "Задача %s (%s), время стадий, с: %s", trace.job_id, trace.status,
+            ", ".join(f"{k}={v:.3f}" for k, v in self.last_timings.items())
+        )
+        failed = trace.failed_stage()
+        if failed is not None:
+            logger.error("Задача %s: стадия %s завершилась ошибкой %s: %s",
+                         trace.job_id, failed.stage, failed.reason, failed.error)
+        logger.debug("Трасса задачи %s: %s", trace.job_id, json.dumps(trace.as_dict(), ensure_ascii=False))
+
+    @staticmethod
+    def _payload_size(data) -> int:
+        return len(json.dumps(data, ensure_ascii=False, default=str).encode())
+
+    @staticmethod
+    def _file_size(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    async def _run_sequential(self, video_input: Optional[bytes | str], output_dir: str, trace: JobTrace):
+        try:
+            audio_bytes = await trace.run(
+                "audio", self.extract_audio_bytes, video_input, self.audio_normalize,
+                bytes_in=self._scratch_reserve(video_input), bytes_out=len
+            )
+        except Exception:
             return
         try:
-            phrases = self.send_transcribe(audio_bytes)
-            if not isinstance(phrases, List) or not phrases:
-                return
-        except:
+            async with trace.stage("transcribe", bytes_in=len(audio_bytes)) as stage:
+                phrases = await self.transcribe(audio_bytes)
+                stage.bytes_out = self._payload_size(phrases)
+        except Exception:
+            return
+        if not isinstance(phrases, List) or not phrases:
             return
         try:
-            res = await self.llm_analyse(phrases)
-            time_ranges = []
-            descriptions = []
-            for issue in res.issues:
-                idx = issue.idx
-                if idx < len(phrases):
-                    phrase = phrases[idx]
-                    time_ranges.append((phrase["start_time"], phrase["end_time"]))
-                    descriptions.append(issue.description)
-        except Exception as e:
+            async with trace.stage("llm", bytes_in=stage.bytes_out) as stage:
+                res = await self.llm_analyse(phrases)
+                if res is None:
+                    stage.fail("no_answer", "LLM не вернул разбор ни для одного окна")
+                    return
+                stage.bytes_out = len(res.model_dump_json().encode())
+        except Exception:
             return
+        time_ranges, descriptions = self._issue_ranges(phrases, res)
         try:
-            frames_path = self.extract_video_segments(video_input, time_ranges, output_dir="/mnt/ramdisk/")
-        except:
+            async with trace.stage("segments") as stage:
+                frames_path = await asyncio.to_thread(
+                    self.extract_video_segments, video_input, time_ranges, output_dir
+                )
+                stage.bytes_out = sum(self._file_size(path) for path in frames_path)
+        except Exception:
             return
         try:
             issue_images = []
-            for frames in frames_path:
-                best_frames = self.extract_sharp_frames(frames)
+            for best_frames in await trace.run("frames", self.frame_stage, frames_path, bytes_in=stage.bytes_out):
                 if best_frames:
                     best_frame = best_frames[0][2]
                     issue_images.append(best_frame)
@@ -140,58 +270,216 @@ class VideoPipe:
                     issue_images.append(None)
         except Exception:
             return
-        self.cleanup_temp_files(frames_path)  # удаляем временные файлы
-        issues_list = [{"img": img_data, "description": desc}
-                       for img_data, desc in zip(issue_images, descriptions) if img_data is not None]
-        return phrases, issues_list  # Возвращается список словарей с транскрибацией и список фотографи с нарушениями
+        finally:
+            await self._cleanup(trace, frames_path)  # удаляем временные файлы
+        try:
+            async with trace.stage("store") as stage:
+                issues_list = await self._issues_list(issue_images, descriptions)
+        except Exception as e:
+            logger.error("Не удалось сохранить кадры нарушений: %s", e)
+            return
+        return phrases, issues_list  # Возвращается список словарей с транскрибацией и список ключей фото нарушений
 
-    async def llm_analyse(self, phrases: List[Dict], timeout: float = 60.0):
+    async def _run_pipelined(self, video_input: Optional[bytes | str], output_dir: str, trace: JobTrace):
         """
-        Анализирует расшифровку с помощью LLM (DeepSeek), возвращает структурированный результат.
+        Пока идут извлечение аудио, транскрибация и LLM, параллельно индексируются ключевые кадры.
+        Вырезка сегмента и выбор кадра для каждого нарушения стартуют, как только известен его интервал.
         """
+        video_size = self._scratch_reserve(video_input)
+        probe_task = asyncio.create_task(trace.run("probe", self.probe_video, video_input, bytes_in=video_size))
+        try:
+            try:
+                if self.stream_audio:
+                    # извлечение и транскрибация идут одновременно - одна общая стадия
+                    async with trace.stage("audio_transcribe", bytes_in=video_size) as stage:
+                        phrases = await self.transcribe_stream(video_input)
+                        stage.bytes_out = self._payload_size(phrases)
+                else:
+                    audio_bytes = await trace.run(
+                        "audio", self.extract_audio_bytes, video_input, self.audio_normalize,
+                        bytes_in=video_size, bytes_out=len
+                    )
+                    async with trace.stage("transcribe", bytes_in=len(audio_bytes)) as stage:
+                        phrases = await self.transcribe(audio_bytes)
+                        stage.bytes_out = self._payload_size(phrases)
+            except Exception as e:
+                logger.error("Не удалось извлечь аудио: %s", e)
+                return
+            if not isinstance(phrases, List) or not phrases:
+                return
+            async with trace.stage("llm", bytes_in=stage.bytes_out) as stage:
+                res = await self.llm_analyse(phrases)
+                if res is None:
+                    stage.fail("no_answer", "LLM не вернул разбор ни для одного окна")
+                    return
+                stage.bytes_out = len(res.model_dump_json().encode())
+            time_ranges, descriptions = self._issue_ranges(phrases, res)
+            try:
+                probe = await probe_task
+            except Exception as e:
+                logger.warning("Не удалось проиндексировать ключевые кадры: %s", e)
+                probe = {"duration": None, "keyframes": []}
+
+            # одинаковые интервалы (несколько нарушений в одной фразе) обрабатываются один раз
+            issue_tasks: Dict[Tuple[float, float], asyncio.Task] = {}
+            for i, time_range in enumerate(time_ranges):
+                if time_range not in issue_tasks:
+                    issue_tasks[time_range] = asyncio.create_task(
+                        self._issue_frame(video_input, output_dir, i, time_range, probe, trace)
+                    )
+            try:
+                frames = await asyncio.gather(*issue_tasks.values())
+            except Exception as e:
+                logger.error("Ошибка при выборе кадров нарушений: %s", e)
+                for task in issue_tasks.values():
+                    task.cancel()
+                return
+            best_by_range = dict(zip(issue_tasks.keys(), frames))
+            issue_images = [best_by_range[time_range] for time_range in time_ranges]
+        finally:
+            if not probe_task.done():
+                probe_task.cancel()
+        try:
+            async with trace.stage("store"):
+                issues_list = await self._issues_list(issue_images, descriptions)
+        except Exception as e:
+            logger.error("Не удалось сохранить кадры нарушений: %s", e)
+            return
+        return phrases, issues_list
 
-        class Issue(BaseModel):
-            idx: int = Field(
-                description="Индекс фразы из расшифровки",
-                examples=[1, 7]
-            )
-            description: str = Field(
-                description="Описание выявленного нарушения",
-                examples=["Отсутствие крепежных болтов поперечных балок"]
+    async def _issues_list(self, issue_images: List, descriptions: List[str]) -> List[Dict]:
+        """
+        Кадры нарушений кодируются в JPEG и кладутся в хранилище блобов, в результат попадают только ключи.
+        """
+        keys = await self.blob_store.put_frames(issue_images)
+        return [{"img": key, "description": desc}
+                for key, desc in zip(keys, descriptions) if key is not None]
+
+    async def _issue_frame(
+            self, video_input, output_dir: str, i: int, time_range: Tuple[float, float], probe: Dict, trace: JobTrace
+    ):
+        start, end = self.snap_to_keyframes(time_range, probe)
+        output_path = os.path.join(output_dir, f"segment_{i:04d}_{start:.2f}-{end:.2f}.mp4")
+        detail = f"{start:.2f}-{end:.2f}"
+        try:
+            await trace.run(
+                "segments", self.extract_video_segment, video_input, start, end, output_path,
+                detail=detail, bytes_out=self._file_size
             )
+            size = self._file_size(output_path)
+            best_frames = (await trace.run("frames", self.frame_stage, [output_path], detail=detail, bytes_in=size))[0]
+        finally:
+            await self._cleanup(trace, [output_path], detail)
+        return best_frames[0][2] if best_frames else None
 
-        class AnswerStruct(BaseModel):
-            issues: List[Issue] = Field(
-                description="Список выявленных нарушений с описанием"
-            )
+    async def _cleanup(self, trace: JobTrace, paths: List[str], detail: Optional[str] = None) -> None:
+        async with trace.stage("cleanup", detail, bytes_in=sum(self._file_size(path) for path in paths)):
+            self.cleanup_temp_files(paths)
 
-        text = "\n".join(f"{idx} --> {phrase}" for idx, phrase in enumerate(phrases))
-        sys_msg = SystemMessage(content="""Ты — многофункциональный помощник \
-инспектора строительного контроля.
-Входные данные: расшифровка видеозаписи процесса обследования строительного объекта \
-(транскрибированный текст) в формате: <индекс> --> <текст фразы>
+    @staticmethod
+    def snap_to_keyframes(time_range: Tuple[float, float], probe: Dict) -> Tuple[float, float]:
+        """
+        Сдвигает начало интервала на ближайший предыдущий ключевой кадр (сегмент режется без перекодирования)
+        и ограничивает конец длительностью видео.
+        """
+        start, end = float(time_range[0]), float(time_range[1])
+        keyframes = probe.get("keyframes") or []
+        pos = bisect.bisect_right(keyframes, start)
+        if pos:
+            start = keyframes[pos - 1]
+        duration = probe.get("duration")
+        if duration:
+            end = min(end, duration)
+        return start, max(end, start)
 
-ЗАДАЧА:
-Проанализируй расшифровку и найди фразы, в которых пользователь \
-указывает на наличие нарушений (дефектов, отклонений, несоответствий).
-Для каждой такой фразы запомни её индекс и сформулируй краткое описание нарушения \
-в строгом деловом стиле, принятом в строительной документации.
+    @staticmethod
+    def probe_video(video_input: Optional[bytes | str]) -> Dict:
+        """
+        Длительность видео и отсортированные времена ключевых кадров (ffprobe, только ключевые кадры).
+        """
+        is_bytes = isinstance(video_input, bytes)
+        command = [
+            "ffprobe",
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-skip_frame", "nokey",
+            "-show_entries", "format=duration:frame=best_effort_timestamp_time",
+            "-of", "json",
+            "-i", "pipe:0" if is_bytes else video_input,
+        ]
+        result = subprocess.run(
+            command,
+            input=video_input if is_bytes else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        record_subprocess("ffprobe", result.returncode)
+        if result.returncode != 0:
+            raise RuntimeError(f"FFprobe error: {result.stderr.decode()}")
+        data = json.loads(result.stdout or b"{}")
+        keyframes = sorted(
+            float(frame["best_effort_timestamp_time"])
+            for frame in data.get("frames", [])
+            if frame.get("best_effort_timestamp_time") not in (None, "N/A")
+        )
+        duration = data.get("format", {}).get("duration")
+        return {"duration": float(duration) if duration not in (None, "N/A") else None, "keyframes": keyframes}
 
-ФОРМАТ ОТВЕТА:
-Верни ТОЛЬКО валидный JSON-объект в следующем формате:
-{
-"issues": [
-    {"idx": <номер фразы>, "description": "<описание нарушения>"},
-    ...
-]
-}
-Если нарушений не найдено, верни: {"issues": []}
+    async def llm_analyse(self, phrases: List[Dict], timeout: float = 60.0):
+        """
+        Анализирует расшифровку с помощью LLM (DeepSeek), возвращает структурированный результат.
+
+        Длинная расшифровка делится на окна не длиннее llm_window_tokens с перекрытием,
+        окна анализируются параллельно (не больше llm_concurrency одновременно), индексы фраз
+        переводятся в глобальные. Ошибка в одном окне не отменяет результат остальных.
+        """
+        lines = [f"{idx} --> {phrase}" for idx, phrase in enumerate(phrases)]
+        windows = split_phrase_windows(lines, self.llm_window_tokens, self.llm_window_overlap)
+        if len(windows) <= 1:
+            return await self._llm_analyse_window(phrases, timeout)
+
+        logger.info(f"Расшифровка разбита на {len(windows)} окон для LLM")
+        semaphore = asyncio.Semaphore(self.llm_concurrency)
+
+        async def run(window):
+            async with semaphore:
+                return await self._llm_analyse_window(phrases[window.start:window.end], timeout)
+
+        answers = await asyncio.gather(*(run(window) for window in windows))
+        failed = sum(answer is None for answer in answers)
+        if failed:
+            logger.warning(f"LLM не ответил для {failed} из {len(windows)} окон")
+        return merge_window_answers(windows, answers)
 
-НЕ ДОБАВЛЯЙ ПОЯСНЕНИЙ, КОММЕНТАРИЕВ, МАРКДАУНА ИЛИ ДОПОЛНИТЕЛЬНОГО ТЕКСТА. ТОЛЬКО ЧИСТЫЙ JSON.""")
+    async def _llm_analyse_window(self, phrases: List[Dict], timeout: float):
+        """
+        Один вызов LLM для окна расшифровки (индексы фраз локальные, с нуля).
+        Повторный анализ того же окна той же моделью берётся из кэша без обращения к LLM.
+        """
+        cache_key = None
+        if self.llm_cache is not None:
+            model_name = getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None)
+            cache_key = make_cache_key(phrases, ISSUES_PROMPT_VERSION, model_name)
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                try:
+                    answer = AnswerStruct.model_validate_json(cached)
+                except ValidationError as e:
+                    # битая или устаревшая запись (схема сменилась без смены версии промпта) - спрашиваем LLM
+                    logger.warning(f"Запись кэша LLM не прошла валидацию и удалена: {e}")
+                    self.llm_cache.delete(cache_key)
+                else:
+                    logger.info("Ответ LLM взят из кэша")
+                    return answer
+
+        text = "\n".join(f"{idx} --> {phrase}" for idx, phrase in enumerate(phrases))
+        sys_msg = SystemMessage(content=ISSUES_PROMPT)
         usr_msg = HumanMessage(content=text)
         try:
-            async with asyncio.timeout(timeout):
-                response = await self.llm.ainvoke([sys_msg, usr_msg])
+            # ожидание в очереди ограничителя не входит в таймаут самого вызова
+            async with self.llm_limiter.acquire(tokens=estimate_tokens(ISSUES_PROMPT + text)):
+                async with asyncio.timeout(timeout):
+                    response = await self.llm.ainvoke([sys_msg, usr_msg])
             cleaned = response.content.strip()
             if cleaned.startswith("```"):
                 cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else cleaned
@@ -203,6 +491,8 @@ class VideoPipe:
                 logger.warning("Получен пустой список нарушений")
             else:
                 logger.info(f"Получено нарушений: {len(answer.issues)}")
+            if cache_key is not None:
+                self.llm_cache.set(cache_key, answer.model_dump_json())
             return answer
         except (json.JSONDecodeError, ValidationError) as e:
             logger.error(f"Не удалось распарсить или валидировать ответ LLM: {e}\nОтвет: {cleaned}")
@@ -214,6 +504,42 @@ class VideoPipe:
             logger.error(f"Ошибка при вызове LLM: {e}")
             return None
 
+    async def transcribe(self, audio_bytes: bytes) -> List:
+        """
+        Асинхронная транскрибация через пул соединений с повторами.
+        При неудаче возвращает пустой список, как и send_transcribe.
+        """
+        try:
+            if self.chunked_transcribe:
+                message = await self.transcriber.transcribe_chunked(audio_bytes)
+            else:
+                message = await self.transcriber.transcribe(audio_bytes)
+        except TranscribeError as e:
+            logger.error("Ошибка транскрибации: %s", e)
+            mark_stage_failed(type(e).__name__, str(e))
+            return []
+        logger.info("Успешно: 'message' содержит список словарей")
+        logger.debug("Результат: %s", message)
+        return message
+
+    async def transcribe_stream(self, video_input: Optional[bytes | str]) -> List:
+        """
+        Транскрибация аудио, извлекаемого потоково: первые окна уходят в сервис до конца работы ffmpeg.
+        Ошибка извлечения пробрасывается, ошибка транскрибации - пустой список, как в transcribe.
+        """
+        chunks = astream_audio(video_input, self.audio_normalize)
+        try:
+            message = await self.transcriber.transcribe_stream(chunks, chunked=self.chunked_transcribe)
+        except TranscribeError as e:
+            logger.error("Ошибка транскрибации: %s", e)
+            mark_stage_failed(type(e).__name__, str(e))
+            return []
+        finally:
+            await chunks.aclose()
+        logger.info("Успешно: 'message' содержит список словарей")
+        logger.debug("Результат: %s", message)
+        return message
+
     def send_transcribe(self, audio_bytes: bytes) -> List:
         """
         """
@@ -266,35 +592,37 @@ class VideoPipe:
         """
         Извлекает аудио из видео и возвращает его в виде сырых int16 PCM байтов.
         Гарантирует, что длина байтов кратна 2.
+        normalize: True/"loudnorm", "dynaudnorm", "peak", "rms" или False (см. audio_stream).
         """
         is_bytes = isinstance(video_input, bytes)
-        command = [
-            "ffmpeg",
-            "-i", "pipe:0" if is_bytes else video_input,
-            "-f", "s16le",
-            "-acodec", "pcm_s16le",
-            "-ac", "1",
-            "-ar", "16000",
-        ]
-        if normalize:
-            command += ["-af", "loudnorm"]
-        command += [
-            "-y",
-            "-"
-        ]
+        mode = resolve_normalize(normalize)
         result = subprocess.run(
-            command,
+            audio_command(video_input, mode),
             input=video_input if is_bytes else None,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
+        record_subprocess("ffmpeg", result.returncode)
         if result.returncode != 0:
             raise RuntimeError(f"FFmpeg error: {result.stderr.decode()}")
         audio_bytes = result.stdout
         if len(audio_bytes) % 2 != 0:
             audio_bytes = audio_bytes[:-1]
+        if mode in NUMPY_MODES:
+            audio_bytes = apply_gain(audio_bytes, mode)
         return audio_bytes
 
+    @staticmethod
+    def iter_audio_chunks(
+            video_input: Optional[bytes | str],
+            normalize="dynaudnorm",
+            chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """
+        Потоковый вариант extract_audio_bytes: PCM отдаётся кусками по мере работы ffmpeg.
+        """
+        return iter_audio_chunks(video_input, normalize, chunk_size)
+
     @staticmethod
     def extract_frames_at_timestamps(
             video_input: Optional[bytes | str],
@@ -322,6 +650,7 @@ class VideoPipe:
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
             )
+            record_subprocess("ffmpeg", result.returncode)
             if result.returncode != 0:
                 raise RuntimeError(f"FFmpeg error at timestamp {ts}: {result.stderr.decode()}")
             image_bytes = result.stdout
@@ -335,6 +664,38 @@ class VideoPipe:
                 frames.append(frame)
         return frames
 
+    @staticmethod
+    def extract_video_segment(
+            video_input: Optional[bytes | str],
+            start: float,
+            end: float,
+            output_path: str
+    ) -> str:
+        """
+        Вырезает один фрагмент видео без перекодирования и сохраняет его на диск.
+        """
+        is_bytes = isinstance(video_input, bytes)
+        command = [
+            "ffmpeg",
+            "-ss", str(start),
+            "-t", str(end - start),
+            "-i", "pipe:0" if is_bytes else video_input,
+            "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            "-y",
+            output_path
+        ]
+        result = subprocess.run(
+            command,
+            input=video_input if is_bytes else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        record_subprocess("ffmpeg", result.returncode)
+        if result.returncode != 0:
+            raise RuntimeError(f"FFmpeg error for segment {output_path} ({start}s - {end}s): {result.stderr.decode()}")
+        return output_path
+
     @staticmethod
     def extract_video_segments(
             video_input: Optional[bytes | str],
@@ -344,63 +705,29 @@ class VideoPipe:
         """
         Извлекает фрагменты видео по временным меткам и сохраняет их на диск.
         """
-        is_bytes = isinstance(video_input, bytes)
         segments = []
         for i, (start, end) in enumerate(timestamps):
-            duration = end - start
             output_path = os.path.join(output_dir, f"segment_{i:04d}_{start:.2f}-{end:.2f}.mp4")
-            command = [
-                "ffmpeg",
-                "-ss", str(start),
-                "-t", str(duration),
-                "-i", "pipe:0" if is_bytes else video_input,
-                "-c", "copy",
-                "-avoid_negative_ts", "make_zero",
-                "-y",
-                output_path
-            ]
-            result = subprocess.run(
-                command,
-                input=video_input if is_bytes else None,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            if result.returncode != 0:
-                raise RuntimeError(f"FFmpeg error for segment {i} ({start}s - {end}s): {result.stderr.decode()}")
-            segments.append(output_path)
+            segments.append(VideoPipe.extract_video_segment(video_input, start, end, output_path))
         return segments
 
     @staticmethod
-    def extract_sharp_frames(video_path: str, top_n=1, method="laplacian"):
-        """
-        """
-        cap = cv2.VideoCapture(video_path)
-        scores = []
-        frame_idx = 0
-        score = 0
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            if method == "laplacian":
-                score = cv2.Laplacian(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var()
-            elif method == "sobel":
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-                grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-                score = cv2.magnitude(grad_x, grad_y).var()
-            elif method == "tenengrad":
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-                grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-                grad = grad_x ** 2 + grad_y ** 2
-                score = grad.mean()
-            scores.append((score, frame_idx, frame.copy()))
-            frame_idx += 1
-        cap.release()
-        scores.sort(key=lambda x: x[0], reverse=True)
-        top_frames = scores[:top_n]
-        return top_frames
+    def extract_sharp_frames(
+            video_path: str,
+            top_n=1,
+            method="laplacian",
+            stride: int = 1,
+            score_width: Optional[int] = 640
+    ) -> List[Tuple[float, int, np.ndarray]]:
+        """
+        Потоково выбирает top_n самых резких кадров видео.
+
+        В памяти держится не больше top_n кадров (min-heap по оценке резкости).
+        stride - оценивается каждый stride-й кадр, остальные только grab() без декодирования в BGR.
+        score_width - ширина уменьшенного серого изображения для оценки (None - исходный размер).
+        Возвращает список (score, frame_idx, frame), отсортированный по убыванию score.
+        """
+        return select_sharp_frames(video_path, top_n, method, stride=stride, score_width=score_width)
 
     @staticmethod
     def cleanup_temp_files(file_paths: List[str]) -> None:
@@ -0,0 +1,211 @@
+"""Временные рабочие каталоги для задач VideoPipe с общим бюджетом по объёму.
+
+Каталог задачи создаётся в tmpfs (если доступен) или на диске, удаляется при любом выходе
+из задачи; фоновый уборщик удаляет каталоги, оставшиеся после падения процесса.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Sequence, Set
+
+import config
+
+logger = logging.getLogger(__name__)
+
+JOB_PREFIX = "job-"
+
+# каталоги задач, открытые этим процессом: каталог с нашим pid вне этого набора остался
+# от прежнего запуска (в контейнере приложение часто перезапускается с тем же pid, например 1)
+_open_jobs: Set[str] = set()
+_open_jobs_lock = threading.Lock()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobWorkspace:
+    """Каталог одной задачи: имена файлов разных запросов не пересекаются."""
+
+    def __init__(self, path: str, reserved_bytes: int) -> None:
+        self.path = path
+        self.reserved_bytes = reserved_bytes
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def used_bytes(self) -> int:
+        total = 0
+        for directory, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(directory, name))
+                except OSError:
+                    pass
+        return total
+
+
+class ScratchSpace:
+    """
+    Менеджер временных каталогов.
+
+    Перед стартом задача резервирует оценку нужного ей места; пока суммарный резерв превышает
+    budget_bytes, новые задачи ждут (backpressure). Задача, которой нужно больше всего бюджета,
+    запускается одна.
+    """
+
+    def __init__(
+            self,
+            preferred_roots: Sequence[str] = ("/mnt/ramdisk", "/dev/shm"),
+            fallback_root: Optional[str] = None,
+            budget_bytes: int = 2 * 1024 ** 3,
+            orphan_max_age: float = 6 * 3600.0
+    ) -> None:
+        self.budget_bytes = budget_bytes
+        self.orphan_max_age = orphan_max_age
+        self.root = self._choose_root(preferred_roots, fallback_root or tempfile.gettempdir())
+        self.reserved_bytes = 0
+        self.waiting = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _choose_root(preferred_roots: Sequence[str], fallback_root: str) -> str:
+        for root in preferred_roots:
+            if root and os.path.isdir(root) and os.access(root, os.W_OK | os.X_OK):
+                path = os.path.join(root, "videopipe")
+                try:
+                    os.makedirs(path, exist_ok=True)
+                except OSError as e:
+                    logger.warning("tmpfs %s недоступен: %s", root, e)
+                    continue
+                return path
+        path = os.path.join(fallback_root, "videopipe")
+        os.makedirs(path, exist_ok=True)
+        logger.info("tmpfs недоступен, временные файлы VideoPipe пишутся в %s", path)
+        return path
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def job(self, reserve_bytes: int = 0) -> AsyncIterator[JobWorkspace]:
+        """
+        Выделяет каталог задачи и резерв бюджета; каталог удаляется на любом пути выхода.
+        """
+        reserve = max(0, min(int(reserve_bytes), self.budget_bytes))
+        async with self.condition:
+            self.waiting += 1
+            try:
+                await self.condition.wait_for(lambda: self.reserved_bytes + reserve <= self.budget_bytes)
+            finally:
+                self.waiting -= 1
+            self.reserved_bytes += reserve
+        path = None
+        try:
+            with _open_jobs_lock:
+                path = tempfile.mkdtemp(prefix=f"{JOB_PREFIX}{os.getpid()}-", dir=self.root)
+                _open_jobs.add(path)
+            yield JobWorkspace(path, reserve)
+        finally:
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+                with _open_jobs_lock:
+                    _open_jobs.discard(path)
+            async with self.condition:
+                self.reserved_bytes -= reserve
+                self.condition.notify_all()
+
+    def sweep(self) -> int:
+        """
+        Удаляет каталоги задач умерших процессов и прежних запусков с тем же pid, а каталоги
+        без pid в имени - старше orphan_max_age. Возвращает их число.
+        """
+        removed = 0
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+        # набор берётся после просмотра каталога: mkdtemp и регистрация идут под одной блокировкой
+        with _open_jobs_lock:
+            open_jobs = set(_open_jobs)
+        for entry in entries:
+            if not entry.name.startswith(JOB_PREFIX) or not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                pid = int(entry.name[len(JOB_PREFIX):].split("-", 1)[0])
+            except ValueError:
+                pid = None
+            if pid is not None:
+                # каталог живого процесса не трогаем, как бы долго ни шла задача; свои - только открытые
+                if pid == os.getpid():
+                    orphan = entry.path not in open_jobs
+                else:
+                    orphan = not _pid_alive(pid)
+            else:
+                # владелец неизвестен - судим только по возрасту
+                try:
+                    orphan = now - entry.stat(follow_symlinks=False).st_mtime > self.orphan_max_age
+                except FileNotFoundError:
+                    continue
+            if orphan:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+                logger.warning("Удалён осиротевший временный каталог %s", entry.path)
+        return removed
+
+    def start_sweeper(self, interval: float) -> None:
+        if self._sweeper is not None:
+            return
+
+        def loop() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error("Ошибка уборки временных каталогов: %s", e)
+
+        self.sweep()
+        self._sweeper = threading.Thread(target=loop, name="scratch-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+
+
+_default_scratch: Optional[ScratchSpace] = None
+
+
+def get_scratch_space() -> ScratchSpace:
+    """
+    Общий менеджер временных каталогов по настройкам из config.py (с запущенным уборщиком).
+    """
+    global _default_scratch
+    if _default_scratch is None:
+        _default_scratch = ScratchSpace(
+            preferred_roots=[root for root in config.SCRATCH_TMPFS_DIRS.split(":") if root],
+            fallback_root=config.SCRATCH_FALLBACK_DIR or None,
+            budget_bytes=config.SCRATCH_BUDGET_BYTES,
+            orphan_max_age=config.SCRATCH_ORPHAN_MAX_AGE,
+        )
+        _default_scratch.start_sweeper(config.SCRATCH_SWEEP_INTERVAL)
+    return _default_scratch
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# модули приложения импортируются от корня backend (import config, from services.db import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.db import model  # noqa: E402
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sessions on a fresh SQLite file with foreign keys enforced, as PostgreSQL does."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    model.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def site(db):
+    """An admin, an object and a subobject to attach documents and checks to."""
+    user = model.User(name="admin", password="secret", role=model.RoleEnum.ADMIN)
+    db.add(user)
+    db.flush()
+    obj = model.Object(name="ЖК Северный", admin_id=user.user_id)
+    db.add(obj)
+    db.flush()
+    subobject = model.SubObject(name="Корпус 1", object_id=obj.object_id)
+    db.add(subobject)
+    db.commit()
+    return user, obj, subobject
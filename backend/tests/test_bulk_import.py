@@ -0,0 +1,102 @@
+import io
+import json
+
+from services.db import model
+from services.db.bulk_import import BulkImporter, import_file, read_rows
+from services.db.service import DocumentService
+from services.others.export import iter_csv
+
+CSV = (
+    "doc_type;doc_number;doc_date_start;doc_date_end;name;amount;uom;to_be_certified\r\n"
+    "ТТН;101;01.03.2026;01.03.2026;Цемент М500;2;т;true\r\n"
+    "ТТН;101;01.03.2026;01.03.2026;Песок;12;м3;\r\n"
+    "ТТН;101;01.03.2026;01.03.2026;Щебень;5;куб. м;\r\n"
+    "output;A-7;2026-03-02;2026-03-20;Монтаж опалубки;40;кв.м;\r\n"
+    "ТТН;102;not a date;;Арматура;1;т;\r\n"
+)
+
+
+def run_csv(db, site, text, batch_size=2, **defaults):
+    user, obj, _ = site
+    return import_file(
+        db, io.BytesIO(text.encode("utf-8-sig")), "ttn.csv",
+        {"user_id": user.user_id, "object_id": obj.object_id, **defaults}, batch_size,
+    )
+
+
+def test_csv_rows_grouped_into_documents_across_batches(db, site):
+    report = run_csv(db, site, CSV)
+
+    assert (report.rows, report.documents, report.materials, report.rejected) == (5, 2, 4, 1)
+    assert report.rejects[0].line == 6
+    assert "doc_date_start" in report.rejects[0].error
+    ttn = db.query(model.Document).filter_by(doc_number="101").one()
+    materials = db.query(model.Material).filter_by(doc_id=ttn.document_id).order_by(model.Material.material_id).all()
+    assert [(m.name, m.amount_canonical, m.uom_canonical) for m in materials] == [
+        ("Цемент М500", 2000.0, "кг"), ("Песок", 12.0, "м3"), ("Щебень", 5.0, "м3"),
+    ]
+    assert materials[0].to_be_certified and not materials[1].to_be_certified
+
+
+def test_reimport_rejects_existing_documents(db, site):
+    run_csv(db, site, CSV)
+
+    report = run_csv(db, site, CSV)
+
+    assert (report.documents, report.materials, report.rejected) == (0, 0, 5)
+    assert [reject.error for reject in report.rejects].count("document already exists") == 4
+    assert db.query(model.Document).count() == 2
+    assert db.query(model.Material).count() == 4
+
+
+def test_unknown_references_and_bad_lines_are_rejected(db, site):
+    user, obj, _ = site
+    lines = [
+        json.dumps({"doc_type": "ТТН", "doc_number": "1", "doc_date_start": "2026-03-01", "object_id": 999}),
+        json.dumps({"doc_type": "ТТН", "doc_number": "2", "doc_date_start": "2026-03-01", "user_id": 999}),
+        "{not json",
+        "[1, 2]",
+        json.dumps({
+            "doc_type": "ТТН", "doc_number": "3", "doc_date_start": "2026-03-01",
+            "materials": [{"name": "Гвозди", "amount": 5, "uom": "кг"}, {"name": "Клей", "amount": 10, "uom": "л"}],
+        }),
+    ]
+    stream = io.BytesIO("\n".join(lines).encode())
+
+    report = import_file(db, stream, "docs.jsonl", {"user_id": user.user_id, "object_id": obj.object_id})
+
+    assert (report.rows, report.documents, report.materials, report.rejected) == (6, 1, 2, 4)
+    assert [(reject.line, reject.error.split(":")[0]) for reject in report.rejects] == [
+        (3, "invalid JSON"), (4, "expected a JSON object"), (1, "object 999 not found"), (2, "user 999 not found"),
+    ]
+
+
+def test_reject_list_is_capped(db, site):
+    user, obj, _ = site
+    rows = [(line, None, "broken") for line in range(1, 11)]
+
+    report = BulkImporter(db, max_rejects=3).run(rows, {"user_id": user.user_id, "object_id": obj.object_id})
+
+    assert report.rejected == 10
+    assert [reject.line for reject in report.rejects] == [1, 2, 3]
+
+
+def test_export_can_be_imported_into_another_object(db, site):
+    user, obj, _ = site
+    run_csv(db, site, CSV)
+    other = model.Object(name="ЖК Южный", admin_id=user.user_id)
+    db.add(other)
+    db.commit()
+    exported = b"".join(iter_csv(DocumentService(db).iter_export_rows(obj.object_id)))
+
+    report = import_file(db, io.BytesIO(exported), "export.csv", {"user_id": user.user_id, "object_id": other.object_id})
+
+    assert (report.documents, report.materials, report.rejected) == (2, 4, 0)
+    assert db.query(model.Document).filter_by(object_id=other.object_id).count() == 2
+
+
+def test_reader_chooses_format_by_extension():
+    rows = list(read_rows(io.BytesIO(b'{"doc_number": "1"}\n\n'), "a.NDJSON"))
+    assert rows == [(1, {"doc_number": "1"}, None)]
+    rows = list(read_rows(io.BytesIO("doc_number,uom\r\n1,шт\r\n".encode()), "a.csv"))
+    assert rows == [(2, {"doc_number": "1", "uom": "шт"}, None)]
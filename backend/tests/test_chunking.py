@@ -0,0 +1,52 @@
+from services.llm.chunking import PhraseWindow, merge_window_answers, split_phrase_windows
+from services.llm.schema import AnswerStruct, Issue
+
+
+def answer(*issues):
+    return AnswerStruct(issues=[Issue(idx=idx, description=description) for idx, description in issues])
+
+
+def as_pairs(result):
+    return [(issue.idx, issue.description) for issue in result.issues]
+
+
+def test_windows_overlap_and_cover_all_lines():
+    lines = [f"{i} --> фраза номер {i}" for i in range(20)]
+    windows = split_phrase_windows(lines, max_tokens=40, overlap=2)
+
+    assert windows[0].start == 0 and windows[-1].end == len(lines)
+    for previous, current in zip(windows, windows[1:]):
+        assert current.start == previous.end - 2
+
+
+def test_long_line_gets_its_own_window():
+    windows = split_phrase_windows(["коротко", "x" * 1000, "коротко"], max_tokens=10, overlap=0)
+    assert windows == [PhraseWindow(0, 1), PhraseWindow(1, 2), PhraseWindow(2, 3)]
+
+
+def test_merge_keeps_several_issues_on_one_phrase():
+    windows = [PhraseWindow(0, 5), PhraseWindow(3, 8)]
+    answers = [
+        answer((1, "Трещина в стяжке"), (1, "Отсутствует гидроизоляция"), (4, "Оголена арматура")),
+        # фраза 4 в зоне перекрытия: второе окно описывает её иначе - это дубль, а не новое нарушение
+        answer((1, "Оголена арматура колонны"), (3, "Мусор на этаже")),
+    ]
+
+    assert as_pairs(merge_window_answers(windows, answers)) == [
+        (1, "Трещина в стяжке"),
+        (1, "Отсутствует гидроизоляция"),
+        (4, "Оголена арматура"),
+        (6, "Мусор на этаже"),
+    ]
+
+
+def test_merge_drops_out_of_window_indexes_and_exact_repeats():
+    windows = [PhraseWindow(0, 3)]
+    result = merge_window_answers(windows, [answer((2, "Нет ограждения"), (2, "Нет ограждения"), (7, "Вне окна"))])
+    assert as_pairs(result) == [(2, "Нет ограждения")]
+
+
+def test_merge_skips_failed_windows():
+    windows = [PhraseWindow(0, 4), PhraseWindow(2, 6)]
+    assert as_pairs(merge_window_answers(windows, [None, answer((0, "Трещина"))])) == [(2, "Трещина")]
+    assert merge_window_answers(windows, [None, None]) is None
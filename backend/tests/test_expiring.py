@@ -0,0 +1,107 @@
+import io
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from services.db import schema
+from services.db.bulk_import import import_file
+from services.db.service import DocumentService
+from services.others import expiring
+from services.others.expiring import get_expiring
+
+
+@pytest.fixture(autouse=True)
+def no_snapshot():
+    expiring.invalidate_expiring()
+    yield
+    expiring.invalidate_expiring()
+
+
+def add_document(db, site, number, days_left):
+    user, obj, _ = site
+    return DocumentService(db).create_document(schema.DocumentCreate(
+        user_id=user.user_id,
+        object_id=obj.object_id,
+        doc_type=schema.DocTypeEnum.TTN,
+        doc_number=number,
+        doc_date_start=date.today() - timedelta(days=30),
+        doc_date_end=date.today() + timedelta(days=days_left),
+        doc_image_id="",
+    ))
+
+
+def numbers(documents):
+    return [document.doc_number for document in documents]
+
+
+def test_served_from_snapshot_until_documents_change(db, site):
+    add_document(db, site, "A", 5)
+    assert numbers(get_expiring(db, 10)) == ["A"]
+    snapshot = expiring._snapshot
+    assert numbers(get_expiring(db, 3)) == []
+    assert expiring._snapshot is snapshot
+
+
+def test_new_document_shows_up_without_fresh(db, site):
+    add_document(db, site, "A", 5)
+    assert numbers(get_expiring(db, 10)) == ["A"]
+
+    add_document(db, site, "B", 2)
+
+    assert numbers(get_expiring(db, 10)) == ["B", "A"]
+
+
+def test_edited_and_deleted_documents_leave_the_list(db, site):
+    first = add_document(db, site, "A", 5)
+    second = add_document(db, site, "B", 2)
+    assert numbers(get_expiring(db, 10)) == ["B", "A"]
+
+    DocumentService(db).update_document(
+        first.document_id, schema.DocumentUpdate(doc_date_end=date.today() + timedelta(days=60))
+    )
+    assert numbers(get_expiring(db, 10)) == ["B"]
+
+    DocumentService(db).delete_document(second.document_id)
+    assert numbers(get_expiring(db, 10)) == []
+
+
+def test_bulk_import_refreshes_snapshot(db, site):
+    user, obj, _ = site
+    assert get_expiring(db, 10) == []
+    row = {
+        "doc_type": "ТТН",
+        "doc_number": "IMP-1",
+        "doc_date_start": str(date.today()),
+        "doc_date_end": str(date.today() + timedelta(days=4)),
+    }
+
+    report = import_file(
+        db, io.BytesIO(json.dumps(row).encode()), "docs.jsonl", {"user_id": user.user_id, "object_id": obj.object_id}
+    )
+
+    assert report.documents == 1
+    assert numbers(get_expiring(db, 10)) == ["IMP-1"]
+
+
+def test_rolled_back_changes_keep_snapshot(db, site):
+    document = add_document(db, site, "A", 5)
+    get_expiring(db, 10)
+    snapshot = expiring._snapshot
+
+    document.doc_number = "changed"
+    db.flush()
+    db.rollback()
+    db.commit()
+
+    assert expiring._snapshot is snapshot
+
+
+def test_beyond_horizon_and_per_object(db, site):
+    add_document(db, site, "A", 5)
+    add_document(db, site, "far", 200)
+    _, obj, _ = site
+
+    assert numbers(get_expiring(db, 365)) == ["A", "far"]
+    assert numbers(get_expiring(db, 10, obj.object_id)) == ["A"]
+    assert get_expiring(db, 10, obj.object_id + 1) == []
@@ -0,0 +1,96 @@
+import io
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from services.others.image_prep import (
+    A4_LONG_SIDE_INCHES,
+    InvalidImageError,
+    estimate_skew,
+    preprocess_image,
+    probe_image_header,
+    rotate,
+)
+
+
+def document_photo(width=1200, height=1600, angle=0.0, color=False) -> Image.Image:
+    """White page with a block of dark text-like lines, tilted by angle degrees (down to the right)."""
+    page = np.full((height, width), 255, dtype=np.uint8)
+    for y in range(300, height - 300, 60):
+        cv2.line(page, (200, y), (width - 200, y), 0, 12)
+    if angle:
+        page = rotate(page, -angle)
+    image = Image.fromarray(page)
+    return image.convert("RGB") if color else image
+
+
+def encode(image: Image.Image, fmt="JPEG", **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def decode(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data))
+
+
+def test_downscales_to_target_dpi_and_grayscale_jpeg():
+    photo = encode(document_photo(3000, 4000, color=True))
+
+    prepared = preprocess_image(photo, target_dpi=150)
+
+    assert prepared.mime_type == "image/jpeg"
+    assert prepared.original_size == (3000, 4000)
+    assert max(prepared.width, prepared.height) == round(150 * A4_LONG_SIDE_INCHES)
+    assert len(prepared.data) < len(photo)
+    result = decode(prepared.data)
+    assert result.format == "JPEG" and result.mode == "L"
+    assert result.size == (prepared.width, prepared.height)
+
+
+def test_small_photo_is_not_upscaled_and_can_stay_in_color():
+    prepared = preprocess_image(encode(document_photo(600, 800), "PNG"), grayscale=False, deskew=False)
+
+    assert (prepared.width, prepared.height) == (600, 800)
+    assert decode(prepared.data).mode == "RGB"
+
+
+def test_applies_exif_orientation():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # снято повёрнутым на 90°
+    photo = encode(document_photo(800, 600), exif=exif)
+
+    prepared = preprocess_image(photo, deskew=False)
+
+    assert prepared.original_size == (600, 800)
+    assert (prepared.width, prepared.height) == (600, 800)
+
+
+def test_straightens_tilted_lines():
+    prepared = preprocess_image(encode(document_photo(angle=5.0)), target_dpi=0)
+
+    assert prepared.skew_angle == pytest.approx(5.0, abs=1.0)
+    assert abs(estimate_skew(np.asarray(decode(prepared.data)))) < 1.0
+
+
+def test_small_skew_is_left_alone():
+    prepared = preprocess_image(encode(document_photo(angle=0.0)), target_dpi=0)
+    assert prepared.skew_angle == 0.0
+
+
+def test_rejects_non_images():
+    with pytest.raises(InvalidImageError):
+        preprocess_image(b"%PDF-1.7 definitely not a photo")
+
+
+def test_probe_reads_header_without_full_file():
+    photo = encode(document_photo(1200, 1600), "PNG")
+
+    assert probe_image_header(photo[:4]) is None
+    header = probe_image_header(photo[:1024])
+    assert (header.format, header.width, header.height) == ("PNG", 1200, 1600)
+    with pytest.raises(InvalidImageError):
+        probe_image_header(photo[:1024], max_pixels=1000)
+    with pytest.raises(InvalidImageError):
+        probe_image_header(b"GIF89a" + b"\x00" * 100)
@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+from services.llm.cache import LLMResultCache, make_cache_key
+from services.others.video_client import ISSUES_PROMPT_VERSION, VideoPipe
+
+PHRASES = [{"text": "нет ограждения на краю перекрытия"}]
+
+
+class FakeLLM:
+    model_name = "fake-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        return SimpleNamespace(content='{"issues": [{"idx": 0, "description": "Нет ограждения"}]}')
+
+
+def make_pipe(tmp_path, llm):
+    cache = LLMResultCache(str(tmp_path / "llm_cache.db"), ttl_seconds=3600, max_bytes=1024 * 1024)
+    pipe = VideoPipe(
+        llm, frame_stage=object(), transcriber=object(), llm_cache=cache, blob_store=object(), scratch=object()
+    )
+    return pipe, cache, make_cache_key(PHRASES, ISSUES_PROMPT_VERSION, llm.model_name)
+
+
+def test_cached_answer_skips_llm(tmp_path):
+    llm = FakeLLM()
+    pipe, cache, key = make_pipe(tmp_path, llm)
+    cache.set(key, '{"issues": [{"idx": 0, "description": "Из кэша"}]}')
+
+    answer = asyncio.run(pipe._llm_analyse_window(PHRASES, timeout=5))
+
+    assert [issue.description for issue in answer.issues] == ["Из кэша"]
+    assert llm.calls == 0
+    cache.close()
+
+
+def test_invalid_cache_entry_falls_back_to_llm(tmp_path):
+    llm = FakeLLM()
+    pipe, cache, key = make_pipe(tmp_path, llm)
+    # запись прежней схемы ответа
+    cache.set(key, '{"violations": [{"phrase": 0}]}')
+
+    answer = asyncio.run(pipe._llm_analyse_window(PHRASES, timeout=5))
+
+    assert [issue.description for issue in answer.issues] == ["Нет ограждения"]
+    assert llm.calls == 1
+    assert cache.get(key) == answer.model_dump_json()
+    cache.close()
@@ -0,0 +1,158 @@
+import asyncio
+import io
+from datetime import date
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import config
+from handlers.documents import router as documents_router
+from services.db import schema
+from services.db.db import get_db
+from services.llm import schema as llm_schema
+from services.others import blob_store, photo_client
+from services.others.photo_client import (
+    FakeExtractionBackend,
+    PhotoBackendUnavailableError,
+    PhotoPipe,
+    get_photo_pipe,
+    merge_pages,
+)
+
+
+def photo_bytes(fmt="JPEG", size=(2400, 3200)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "white").save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def item(name, amount, uom="шт"):
+    return llm_schema.ItemsList(item_name=name, UOM=uom, amount=amount)
+
+
+def page(items, number="", day=10, name="Транспортная накладная"):
+    return llm_schema.Document(
+        doc_name=name,
+        doc_number=number,
+        doc_date_start=date(2026, 3, day),
+        doc_date_end=date(2026, 3, day),
+        item_list=items,
+    )
+
+
+def test_pipe_prepares_image_and_maps_to_db_schemas():
+    backend = FakeExtractionBackend()
+    pipe = PhotoPipe(backend, target_dpi=100)
+
+    document, materials = asyncio.run(pipe(photo_bytes(), "ab" * 32 + ".jpg"))
+
+    assert len(backend.calls) == 1
+    prepared = backend.calls[0]
+    assert prepared.mime_type == "image/jpeg"
+    assert max(prepared.width, prepared.height) == round(100 * 11.69)
+    assert document.doc_type == schema.DocTypeEnum.TTN
+    assert document.doc_number == "TEST-0001"
+    assert document.doc_image_id == "ab" * 32 + ".jpg"
+    assert [(m.name, m.amount, m.uom, m.to_be_certified) for m in materials] == [
+        ("Generic Construction Material", 100.0, "шт", True)
+    ]
+
+
+def test_act_items_are_not_certified():
+    backend = FakeExtractionBackend(page([item("Монтаж опалубки", 12, "м2")], "7", name="Акт выполненных работ"))
+
+    document, materials = asyncio.run(PhotoPipe(backend)(photo_bytes("PNG", (400, 300))))
+
+    assert document.doc_type == schema.DocTypeEnum.OUTPUT
+    assert not materials[0].to_be_certified
+
+
+class PagesBackend:
+    """Answers each page by the size of its photo, whatever order the pages finish in."""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    async def extract(self, image):
+        return self.pages[image.original_size]
+
+
+def test_pages_are_recognised_and_merged_in_page_order():
+    backend = PagesBackend({
+        (400, 600): page([item("Кирпич М150", 500), item("Цемент М500", 40)], "12"),
+        (400, 601): page([item("Цемент М500", 40), item("Песок", 3, "м")]),
+    })
+    pipe = PhotoPipe(backend, deskew=False)
+
+    merged = asyncio.run(pipe.extract_pages([photo_bytes(size=(400, 600)), photo_bytes(size=(400, 601))]))
+
+    # строка, попавшая на оба фото, берётся один раз
+    assert [i.item_name for i in merged.item_list] == ["Кирпич М150", "Цемент М500", "Песок"]
+    assert merged.doc_number == "12"
+
+
+def test_merge_pages_takes_requisites_and_period_across_pages():
+    first = page([item("Кирпич М150", 500), item("Цемент М500", 40)], "", day=12)
+    second = page([item("Цемент  м500", 40), item("Песок", 3, "м")], "ТТН-5", day=10)
+
+    merged = merge_pages([first, second])
+
+    assert merged.doc_number == "ТТН-5"
+    assert (merged.doc_date_start, merged.doc_date_end) == (date(2026, 3, 10), date(2026, 3, 12))
+    assert [i.item_name for i in merged.item_list] == ["Кирпич М150", "Цемент М500", "Песок"]
+
+
+@pytest.fixture
+def unconfigured(monkeypatch):
+    monkeypatch.setattr(config, "PHOTO_LLM_API_KEY", "")
+    monkeypatch.setattr(config, "PHOTO_FAKE_BACKEND", False)
+    monkeypatch.setattr(photo_client, "_default_pipe", None)
+
+
+def test_no_silent_fake_backend(unconfigured):
+    with pytest.raises(PhotoBackendUnavailableError):
+        get_photo_pipe()
+
+
+def test_fake_backend_only_when_enabled(unconfigured, monkeypatch):
+    monkeypatch.setattr(config, "PHOTO_FAKE_BACKEND", True)
+    assert isinstance(get_photo_pipe().backend, FakeExtractionBackend)
+
+
+@pytest.fixture
+def client(db, tmp_path, monkeypatch, unconfigured):
+    monkeypatch.setattr(blob_store, "_default_store", blob_store.BlobStore(str(tmp_path / "blobs")))
+    app = FastAPI()
+    app.include_router(documents_router)
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(app)
+
+
+def post_photo(client, site, photo):
+    user, obj, _ = site
+    return client.post(
+        "/documents/process-photo",
+        data={"user_id": str(user.user_id), "object_id": str(obj.object_id)},
+        files={"photo": ("ttn.jpg", photo, "image/jpeg")},
+    )
+
+
+def test_process_photo_is_unavailable_without_backend(client, site):
+    response = post_photo(client, site, photo_bytes())
+    assert response.status_code == 503
+
+
+def test_process_photo_with_fake_backend_and_repeat(client, site, monkeypatch):
+    monkeypatch.setattr(config, "PHOTO_FAKE_BACKEND", True)
+    photo = photo_bytes()
+
+    created = post_photo(client, site, photo)
+    assert created.status_code == 201
+    assert created.json()["document"]["doc_number"] == "TEST-0001"
+    assert len(created.json()["materials"]) == 1
+
+    repeated = post_photo(client, site, photo)
+    assert repeated.status_code == 200
+    assert repeated.json() == created.json()
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+import pytest
+
+from services.others.audio_chunks import SAMPLE_RATE, split_on_silence
+from services.others.limiter import BackendLimiter
+from services.others.transcribe_client import CircuitBreaker, CircuitOpenError, TranscribeClient, TranscribeError
+
+URL = "http://transcribe.test/transcribe_long"
+PHRASES = [{"text": "трещина в стене", "start_time": 0.5, "end_time": 1.0}]
+
+
+def make_client(handler, **kwargs) -> TranscribeClient:
+    kwargs.setdefault("limiter", BackendLimiter("test", max_concurrency=8))
+    kwargs.setdefault("backoff_base", 0.0)
+    return TranscribeClient(URL, client=httpx.AsyncClient(transport=httpx.MockTransport(handler)), **kwargs)
+
+
+def responder(*statuses):
+    """Stub /transcribe_long answering with the given statuses in turn, then 200 with PHRASES."""
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        calls.append(body)
+        status = statuses[len(calls) - 1] if len(calls) <= len(statuses) else 200
+        if status == 200:
+            return httpx.Response(200, json={"message": PHRASES})
+        return httpx.Response(status, text="unavailable")
+
+    return handler, calls
+
+
+def test_retries_transient_statuses_then_succeeds():
+    handler, calls = responder(503, 502)
+    client = make_client(handler)
+    audio = b"\x01\x00" * 1000
+
+    assert asyncio.run(client.transcribe(audio)) == PHRASES
+    assert len(calls) == 3
+    assert all(body == audio for body in calls)
+    assert client.breaker.state == "closed"
+
+
+def test_gives_up_after_attempts():
+    handler, calls = responder(*[500] * 10)
+    client = make_client(handler, attempts=3)
+
+    with pytest.raises(TranscribeError, match="3"):
+        asyncio.run(client.transcribe(b"\x00\x00" * 10))
+    assert len(calls) == 3
+
+
+def test_client_errors_are_not_retried():
+    handler, calls = responder(400)
+    client = make_client(handler)
+
+    with pytest.raises(TranscribeError, match="HTTP 400"):
+        asyncio.run(client.transcribe(b"\x00\x00" * 10))
+    assert len(calls) == 1
+
+
+def test_connection_errors_are_retried():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={"message": PHRASES})
+
+    assert asyncio.run(make_client(handler).transcribe(b"\x00\x00")) == PHRASES
+    assert len(calls) == 2
+
+
+def test_backoff_grows_and_is_capped(monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr("random.uniform", lambda low, high: high)
+    handler, _ = responder(*[503] * 10)
+    client = make_client(
+        handler, attempts=5, backoff_base=0.5, backoff_max=2.0, breaker=CircuitBreaker(failure_threshold=100)
+    )
+
+    with pytest.raises(TranscribeError):
+        asyncio.run(client.transcribe(b"\x00\x00"))
+    assert delays == [0.5, 1.0, 2.0, 2.0]
+
+
+def test_breaker_opens_and_recovers_after_probe():
+    handler, calls = responder(*[503] * 2)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    client = make_client(handler, attempts=4, breaker=breaker)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.transcribe(b"\x00\x00"))
+    assert len(calls) == 2
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert asyncio.run(client.transcribe(b"\x00\x00")) == PHRASES
+    assert breaker.state == "closed"
+
+
+def open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.record_failure()
+    breaker._opened_at -= breaker.reset_timeout
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_probe_released_when_limiter_rejects():
+    handler, calls = responder()
+    breaker = open_breaker()
+    client = make_client(handler, breaker=breaker, limiter=BackendLimiter("full", max_concurrency=1, max_queue=0))
+
+    with pytest.raises(TranscribeError):
+        asyncio.run(client.transcribe(b"\x00\x00"))
+    assert not calls
+    assert breaker.allow()
+
+
+def test_probe_released_on_unexpected_http_error():
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.DecodingError("bad gzip", request=request)
+
+    breaker = open_breaker()
+    client = make_client(handler, breaker=breaker)
+
+    with pytest.raises(httpx.DecodingError):
+        asyncio.run(client.transcribe(b"\x00\x00"))
+    assert breaker.allow()
+
+
+def test_probe_released_on_cancel():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(10)
+        return httpx.Response(200, json={"message": PHRASES})
+
+    breaker = open_breaker()
+    client = make_client(handler, breaker=breaker)
+
+    async def run():
+        task = asyncio.create_task(client.transcribe(b"\x00\x00"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert breaker.allow()
+
+
+def speech_with_pauses(seconds: int) -> bytes:
+    """Tone with a quiet half-second at the end of every second."""
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    samples = (8000 * np.sin(2 * np.pi * 220 * t)).astype("<i2")
+    samples[(t % 1.0) >= 0.5] = 0
+    return samples.tobytes()
+
+
+def window_responder():
+    """Stub answering each window with one phrase half a second in."""
+    sizes = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        sizes.append(len(body))
+        seconds = len(body) / (2 * SAMPLE_RATE)
+        return httpx.Response(200, content=json.dumps({"message": [
+            {"text": f"{seconds:.2f}", "start_time": 0.5, "end_time": 1.0}
+        ]}))
+
+    return handler, sizes
+
+
+def test_chunked_shifts_phrases_to_recording_time():
+    audio = speech_with_pauses(90)
+    handler, sizes = window_responder()
+    client = make_client(handler, window_s=20.0, overlap_s=0.5)
+    windows = split_on_silence(audio, window_s=20.0, overlap_s=0.5)
+    assert len(windows) > 1
+
+    phrases = asyncio.run(client.transcribe_chunked(audio))
+
+    assert sorted(sizes) == sorted((w.end - w.start) * 2 for w in windows)
+    assert [p["start_time"] for p in phrases] == [w.start / SAMPLE_RATE + 0.5 for w in windows]
+    assert all(p["end_time"] - p["start_time"] == pytest.approx(0.5) for p in phrases)
+
+
+def test_stream_matches_chunked():
+    audio = speech_with_pauses(90)
+    handler, _ = window_responder()
+    client = make_client(handler, window_s=20.0, overlap_s=0.5)
+
+    async def chunks():
+        for offset in range(0, len(audio), 12345):
+            yield audio[offset:offset + 12345]
+
+    streamed = asyncio.run(client.transcribe_stream(chunks()))
+    assert streamed == asyncio.run(client.transcribe_chunked(audio))
+
+
+def test_chunked_skips_failed_windows():
+    audio = speech_with_pauses(90)
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(422, text="bad audio")
+        return httpx.Response(200, json={"message": PHRASES})
+
+    client = make_client(handler, window_s=20.0, overlap_s=0.5, max_concurrency=1)
+    windows = split_on_silence(audio, window_s=20.0, overlap_s=0.5)
+
+    phrases = asyncio.run(client.transcribe_chunked(audio))
+    assert len(phrases) == len(windows) - 1
@@ -0,0 +1,105 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from services.db import db as db_module
+from services.db import model, schema
+from services.db.service import DocumentService, MaterialService
+from services.others.uom import to_canonical
+
+
+@pytest.mark.parametrize("amount, uom, expected", [
+    (2, "т", (2000.0, "кг")),
+    (1500, "г", (1.5, "кг")),
+    (3, "кв. м", (3.0, "м2")),
+    (3, "М²", (3.0, "м2")),
+    (250, "мм", (0.25, "м")),
+    (12, "шт.", (12.0, "шт")),
+    (2, "тыс. шт", (2000.0, "шт")),
+    (40, "л", (0.04, "м3")),
+    (5, "Рулон ", (5.0, "рулон")),
+    (5, "", (5, None)),
+    (None, "т", (None, "кг")),
+    (7, None, (7, None)),
+])
+def test_to_canonical(amount, uom, expected):
+    assert to_canonical(amount, uom) == (pytest.approx(expected[0]) if expected[0] is not None else None, expected[1])
+
+
+def add_document(db, site, number, materials):
+    user, obj, _ = site
+    return DocumentService(db).create_document_with_materials(
+        schema.DocumentCreate(
+            user_id=user.user_id,
+            object_id=obj.object_id,
+            doc_type=schema.DocTypeEnum.TTN,
+            doc_number=number,
+            doc_date_start=date(2026, 4, 1),
+            doc_date_end=date(2026, 4, 1),
+            doc_image_id="",
+        ),
+        [
+            schema.MaterialBase(name=name, okpd="-", amount=amount, uom=uom, to_be_certified=False)
+            for name, amount, uom in materials
+        ],
+    )
+
+
+def test_totals_sum_in_canonical_units(db, site):
+    _, obj, _ = site
+    add_document(db, site, "1", [("Цемент", 2, "т"), ("Арматура", 120, "м"), ("Плитка", 3, "кв.м")])
+    add_document(db, site, "2", [("Цемент", 500, "кг"), ("Арматура", 3000, "мм"), ("Плитка", 1.5, "М2")])
+    add_document(db, site, "3", [("Цемент", 4, "мешок")])
+
+    totals = MaterialService(db).totals_by_object(obj.object_id)
+
+    assert [(name, uom, pytest.approx(amount), count) for name, uom, amount, count in totals] == [
+        ("Арматура", "м", pytest.approx(123.0), 2),
+        ("Плитка", "м2", pytest.approx(4.5), 2),
+        ("Цемент", "кг", pytest.approx(2500.0), 2),
+        ("Цемент", "мешок", pytest.approx(4.0), 1),
+    ]
+    assert MaterialService(db).totals_by_object(obj.object_id + 1) == []
+
+
+def test_update_recomputes_canonical_amount(db, site):
+    _, materials = add_document(db, site, "1", [("Цемент", 2, "т")])
+
+    material = MaterialService(db).update_material(materials[0].material_id, schema.MaterialUpdate(amount=3))
+
+    assert (material.amount_canonical, material.uom_canonical) == (3000.0, "кг")
+
+
+def test_upgrade_adds_columns_and_backfills_old_rows(session_factory, db, site, monkeypatch):
+    add_document(db, site, "old", [("Цемент", 2, "т"), ("Доска", 6, "пог. м")])
+    engine = session_factory.kw["bind"]
+    with engine.begin() as conn:
+        # таблица, созданная до появления канонических колонок
+        conn.execute(text('ALTER TABLE "MATERIAL" DROP COLUMN amount_canonical'))
+        conn.execute(text('ALTER TABLE "MATERIAL" DROP COLUMN uom_canonical'))
+    monkeypatch.setattr(db_module, "engine", engine)
+    monkeypatch.setattr(db_module, "SessionLocal", session_factory)
+
+    db_module.upgrade_tables()
+
+    db.expire_all()
+    rows = db.query(model.Material).order_by(model.Material.material_id).all()
+    assert [(row.amount_canonical, row.uom_canonical) for row in rows] == [(2000.0, "кг"), (6.0, "м")]
+
+
+def test_upgrade_resumes_interrupted_backfill(session_factory, db, site, monkeypatch):
+    add_document(db, site, "old", [("Цемент", 2, "т"), ("Доска", 6, "пог. м")])
+    # колонки уже есть, но прошлый пересчёт оборвался на первой строке
+    db.query(model.Material).filter(model.Material.name == "Доска").update(
+        {model.Material.amount_canonical: None, model.Material.uom_canonical: None}
+    )
+    db.commit()
+    monkeypatch.setattr(db_module, "engine", session_factory.kw["bind"])
+    monkeypatch.setattr(db_module, "SessionLocal", session_factory)
+
+    db_module.upgrade_tables()
+
+    db.expire_all()
+    rows = db.query(model.Material).order_by(model.Material.material_id).all()
+    assert [(row.amount_canonical, row.uom_canonical) for row in rows] == [(2000.0, "кг"), (6.0, "м")]
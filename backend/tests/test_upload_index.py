@@ -0,0 +1,99 @@
+from datetime import date
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from services.db import model, schema
+from services.db.service import CheckService, DocumentService, UploadService
+
+HASH = "a" * 64
+
+
+def document_in(user, obj):
+    return schema.DocumentCreate(
+        user_id=user.user_id,
+        object_id=obj.object_id,
+        doc_type=schema.DocTypeEnum.TTN,
+        doc_number="17",
+        doc_date_start=date(2026, 1, 10),
+        doc_date_end=date(2026, 2, 10),
+        doc_image_id="0" * 64 + ".jpg",
+    )
+
+
+def cement():
+    return schema.MaterialBase(name="Цемент", okpd="23.51.12", amount=2, uom="т", to_be_certified=False)
+
+
+def photo_upload(obj):
+    return UploadService.new_upload(schema.UploadKindEnum.PHOTO, obj.object_id, HASH, size=10)
+
+
+def test_document_and_upload_are_committed_together(db, site):
+    user, obj, _ = site
+    document, _ = DocumentService(db).create_document_with_materials(document_in(user, obj), [], photo_upload(obj))
+
+    upload = UploadService(db).find_upload(schema.UploadKindEnum.PHOTO, obj.object_id, HASH)
+    assert upload.document_id == document.document_id
+
+
+def test_concurrent_duplicate_upload_creates_no_second_document(session_factory, site):
+    user, obj, _ = site
+    first, second = session_factory(), session_factory()
+    # оба запроса не нашли загрузку в индексе и проанализировали фото
+    assert UploadService(first).find_upload(schema.UploadKindEnum.PHOTO, obj.object_id, HASH) is None
+    assert UploadService(second).find_upload(schema.UploadKindEnum.PHOTO, obj.object_id, HASH) is None
+
+    document, _ = DocumentService(first).create_document_with_materials(
+        document_in(user, obj), [cement()], photo_upload(obj)
+    )
+    with pytest.raises(IntegrityError):
+        DocumentService(second).create_document_with_materials(
+            document_in(user, obj), [cement()], photo_upload(obj)
+        )
+
+    assert second.query(model.Document).count() == 1
+    assert second.query(model.Material).count() == 1
+    upload = UploadService(second).find_upload(schema.UploadKindEnum.PHOTO, obj.object_id, HASH)
+    assert upload.document_id == document.document_id
+    first.close()
+    second.close()
+
+
+def test_concurrent_duplicate_video_creates_no_second_check(session_factory, site):
+    _, _, subobject = site
+    first, second = session_factory(), session_factory()
+    check_in = schema.CheckCreate(subobject_id=subobject.subobject_id, info="Видео")
+    incidents = [schema.IncidentBase(incident_status=True, incident_info="Нет ограждения")]
+
+    def upload():
+        return UploadService.new_upload(schema.UploadKindEnum.VIDEO, subobject.subobject_id, HASH)
+
+    check, saved = CheckService(first).create_check_with_incidents(check_in, incidents, upload())
+    assert [incident.check_id for incident in saved] == [check.check_id]
+    with pytest.raises(IntegrityError):
+        CheckService(second).create_check_with_incidents(check_in, incidents, upload())
+
+    assert second.query(model.Check).count() == 1
+    assert second.query(model.Incident).count() == 1
+    first.close()
+    second.close()
+
+
+def test_deleting_document_removes_its_upload(db, site):
+    user, obj, _ = site
+    document, _ = DocumentService(db).create_document_with_materials(document_in(user, obj), [], photo_upload(obj))
+
+    assert DocumentService(db).delete_document(document.document_id)
+    assert db.query(model.Upload).count() == 0
+
+
+def test_deleting_check_removes_its_upload(db, site):
+    _, _, subobject = site
+    upload = UploadService.new_upload(schema.UploadKindEnum.VIDEO, subobject.subobject_id, HASH)
+    check, _ = CheckService(db).create_check_with_incidents(
+        schema.CheckCreate(subobject_id=subobject.subobject_id), [], upload
+    )
+
+    assert CheckService(db).delete_check(check.check_id)
+    assert db.query(model.Upload).count() == 0
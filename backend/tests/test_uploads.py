@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import io
+
+import httpx
+import pytest
+from PIL import Image
+from starlette.requests import Request
+
+from services.others.image_prep import InvalidImageError, probe_image_header
+from services.others.uploads import (
+    HEAD_MIN_SIZE,
+    MULTIPART_OVERHEAD,
+    InvalidUploadError,
+    UploadTooLargeError,
+    stream_multipart,
+)
+
+
+def multipart(files, data=None):
+    request = httpx.Request("POST", "http://test/upload", files=files, data=data)
+    return request.headers["content-type"], request.read()
+
+
+class Body:
+    """ASGI receive() that sends the body in small chunks and records how much was read."""
+
+    def __init__(self, body: bytes, chunk_size: int = 4096) -> None:
+        self.body = body
+        self.chunk_size = chunk_size
+        self.sent = 0
+
+    async def __call__(self):
+        chunk = self.body[self.sent:self.sent + self.chunk_size]
+        self.sent += len(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": self.sent < len(self.body)}
+
+
+def png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def make_request(content_type: str, body: Body, content_length=None) -> Request:
+    headers = [(b"content-type", content_type.encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    return Request({"type": "http", "method": "POST", "path": "/upload", "headers": headers}, body)
+
+
+def parse(content_type, body, content_length=None, **kwargs):
+    return asyncio.run(stream_multipart(make_request(content_type, body, content_length), **kwargs))
+
+
+def test_fields_and_files_are_hashed_while_received():
+    photo = b"\x89PNG" + bytes(range(256)) * 400
+    content_type, raw = multipart({"photo": ("ttn.png", photo, "image/png")}, {"object_id": "7", "user_id": "1"})
+
+    fields, uploads = parse(content_type, Body(raw), len(raw), max_file_size=len(photo))
+
+    assert fields == {"object_id": "7", "user_id": "1"}
+    [upload] = uploads
+    assert (upload.field, upload.filename, upload.content_type) == ("photo", "ttn.png", "image/png")
+    assert upload.size == len(photo)
+    assert upload.content_hash == hashlib.sha256(photo).hexdigest()
+    assert upload.read() == photo
+    upload.close()
+
+
+def test_declared_length_over_limit_is_rejected_before_reading():
+    content_type, raw = multipart({"photo": ("a.png", b"x" * 10, "image/png")})
+    body = Body(raw)
+
+    with pytest.raises(UploadTooLargeError):
+        parse(content_type, body, 2 * 1024 + MULTIPART_OVERHEAD + 1, max_file_size=1024, max_files=2)
+    assert body.sent == 0
+
+
+def test_oversized_file_stops_the_upload_early():
+    content_type, raw = multipart({"photo": ("a.png", b"x" * 1024 * 1024, "image/png")})
+    body = Body(raw)
+
+    with pytest.raises(UploadTooLargeError):
+        parse(content_type, body, max_file_size=64 * 1024)
+    assert body.sent < 128 * 1024
+
+
+def test_disallowed_type_is_rejected_before_file_data():
+    content_type, raw = multipart({"photo": ("a.gif", b"GIF89a" + b"x" * 100000, "image/gif")})
+    body = Body(raw)
+
+    with pytest.raises(InvalidUploadError, match="image/gif"):
+        parse(content_type, body, max_file_size=1024 * 1024, content_types={"image/png", "image/jpeg"})
+    assert body.sent < 10000
+
+
+def test_header_inspection_rejects_bad_file_from_first_bytes():
+    fake = b"%PDF-1.7" + b"\x00" * 300000
+    content_type, raw = multipart({"photo": ("a.png", fake, "image/png")})
+    body = Body(raw)
+
+    with pytest.raises(InvalidImageError):
+        parse(content_type, body, max_file_size=1024 * 1024, inspect=probe_image_header)
+    assert body.sent < 4 * HEAD_MIN_SIZE + 8192
+
+
+def test_header_inspection_result_is_kept():
+    content_type, raw = multipart({"photo": ("a.png", png(40, 30), "image/png")})
+
+    _, [upload] = parse(content_type, Body(raw), max_file_size=1024 * 1024, inspect=probe_image_header)
+
+    assert (upload.info.format, upload.info.width, upload.info.height) == ("PNG", 40, 30)
+    upload.close()
+
+
+def test_too_many_files():
+    files = [("photos", (f"{i}.png", b"x", "image/png")) for i in range(3)]
+    content_type, raw = multipart(files)
+
+    with pytest.raises(InvalidUploadError, match="Too many files"):
+        parse(content_type, Body(raw), max_file_size=10, max_files=2)
+
+
+def test_large_text_field_is_rejected():
+    content_type, raw = multipart({"photo": ("a.png", b"x", "image/png")}, {"note": "я" * 10000})
+
+    with pytest.raises(UploadTooLargeError, match="note"):
+        parse(content_type, Body(raw), max_file_size=10, max_field_size=1024)
+
+
+def test_not_multipart_or_malformed():
+    with pytest.raises(InvalidUploadError, match="multipart"):
+        parse("application/json", Body(b"{}"), max_file_size=10)
+    with pytest.raises(InvalidUploadError):
+        parse("multipart/form-data; boundary=abc", Body(b"--xyz\r\n\r\n"), max_file_size=10)
+
+
+def test_body_without_closing_boundary_is_rejected():
+    content_type, raw = multipart({"photo": ("a.png", png(40, 30), "image/png")}, {"object_id": "7"})
+    truncated = raw[:raw.rindex(b"\r\n--")]
+
+    with pytest.raises(InvalidUploadError, match="closing boundary"):
+        parse(content_type, Body(truncated), max_file_size=1024 * 1024, inspect=probe_image_header)
+    with pytest.raises(InvalidUploadError, match="closing boundary"):
+        parse(content_type, Body(raw[:len(raw) // 2]), max_file_size=1024 * 1024)
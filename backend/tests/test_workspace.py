@@ -0,0 +1,73 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from services.others.workspace import JOB_PREFIX, ScratchSpace
+
+
+def make_dir(scratch, name, age=0.0):
+    path = os.path.join(scratch.root, name)
+    os.makedirs(path)
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return path
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_sweep_keeps_old_directories_of_live_processes(tmp_path):
+    scratch = ScratchSpace(preferred_roots=(), fallback_root=str(tmp_path), orphan_max_age=60)
+    parent = make_dir(scratch, f"{JOB_PREFIX}{os.getppid()}-long", age=3600)
+
+    assert scratch.sweep() == 0
+    assert os.path.isdir(parent)
+
+
+def test_sweep_removes_directories_of_previous_run_with_same_pid(tmp_path):
+    scratch = ScratchSpace(preferred_roots=(), fallback_root=str(tmp_path), orphan_max_age=60)
+    stale = make_dir(scratch, f"{JOB_PREFIX}{os.getpid()}-stale")
+
+    assert scratch.sweep() == 1
+    assert not os.path.exists(stale)
+
+
+def test_sweep_removes_directories_of_dead_processes(tmp_path):
+    scratch = ScratchSpace(preferred_roots=(), fallback_root=str(tmp_path), orphan_max_age=60)
+    orphan = make_dir(scratch, f"{JOB_PREFIX}{dead_pid()}-crashed")
+
+    assert scratch.sweep() == 1
+    assert not os.path.exists(orphan)
+
+
+def test_sweep_ages_out_directories_without_pid(tmp_path):
+    scratch = ScratchSpace(preferred_roots=(), fallback_root=str(tmp_path), orphan_max_age=60)
+    old = make_dir(scratch, f"{JOB_PREFIX}legacy-old", age=3600)
+    fresh = make_dir(scratch, f"{JOB_PREFIX}legacy-new")
+    other = make_dir(scratch, "not-a-job", age=3600)
+
+    assert scratch.sweep() == 1
+    assert not os.path.exists(old)
+    assert os.path.isdir(fresh) and os.path.isdir(other)
+
+
+def test_job_directory_survives_sweep_and_is_removed_on_exit(tmp_path):
+    scratch = ScratchSpace(preferred_roots=(), fallback_root=str(tmp_path), orphan_max_age=0)
+
+    async def run():
+        async with scratch.job(1024) as workspace:
+            with open(workspace.file("audio.pcm"), "wb") as f:
+                f.write(b"\x00" * 10)
+            assert scratch.sweep() == 0
+            assert workspace.used_bytes() == 10
+            return workspace.path
+
+    path = asyncio.run(run())
+    assert not os.path.exists(path)
+    assert scratch.reserved_bytes == 0